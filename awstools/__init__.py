@@ -2,6 +2,8 @@ import os
 from ConfigParser import ConfigParser
 
 
+__version__ = '0.3.11.dev0'
+
 _DEFAULTS = {}
 
 
@@ -1,9 +1,15 @@
 import collections
+import cPickle as pickle
+import hashlib
+import os
 import pprint
 import re
 
 import yaml
 
+import awstools
+from awstools.utils.cache import CACHE_DIR, atomic_write
+
 
 class ApplicationError(Exception):
     pass
@@ -37,6 +43,9 @@ class Application(object):
             raise ApplicationInvalid
         self.model = False
         self.properties = properties
+        self._index = None
+        self._stacks = None
+        self._invalid_environments = None
 
     def __repr__(self):
         return '<Application %s>' % self.name
@@ -97,55 +106,140 @@ class Application(object):
             raise ApplicationEnvironmentNotFound(
                 "No such environment: %s" % environment)
 
-        # Seed the stack properties from model
-        if self.model:
-            try:
-                stack_prop = self.model.get_stack_info(environment=environment,
-                                                       pool=pool,
-                                                       identifier=identifier)
-            except ApplicationNotFound:
-                stack_prop = {}
-        else:
-            stack_prop = {}
-
-        # Update with application level properties
-        stack_prop.update(self.properties)
-        stack_prop.pop('environments')
-
-        # Search for a matching pool/id
-        pools = self.properties['environments'][environment]
-
-        app_pool_prop = pools.get(pool)  # use default pool (without id)
-
-        for pool_name, pool_props in pools.items():  # search matching id
-            match = re.match(pool + r'\[(.+)\]', pool_name)
-            if match:
-                identifiers = [s.strip() for s in match.groups()[0].split(',')]
-                if identifier in identifiers:
-                    app_pool_prop = pool_props
-                    break
-
-        # Update with pool level properties
-        # True as empty dict to get model properties only
-        if app_pool_prop is True:
-            app_pool_prop = {}
-        if not isinstance(app_pool_prop, collections.Mapping):
+        index = self.get_index()
+        if environment in self._invalid_environments:
+            raise ApplicationInvalid(
+                "Invalid environment %s of the application %s: "
+                "not a mapping of pools" % (environment, self.name))
+        stack_prop = index.get((environment, pool, identifier)) or \
+            index.get((environment, pool, None))
+        if stack_prop is None:
             raise ApplicationPoolNotFound("No such pool: %s" % pool)
-        stack_prop.update(app_pool_prop)
 
-        # Update with actual environment/pool properties
-        stack_prop.update({'Environment': environment,
-                           'Type': pool})
+        return dict(stack_prop)
+
+    def get_index(self):
+        """Return the stack properties by (environment, pool, identifier).
+
+        Built once (see build_index). An identifier missing from the index
+        has the properties of the identifier None: the default pool.
+        """
+        if self._index is None:
+            self.build_index()
+        return self._index
+
+    def build_index(self):
+        """Resolve the properties of every stack of the application.
+
+        The properties are, by priority: the environment and pool, the
+        properties of the pool (the one listing the identifier, like
+        "pool[1,2]", else the default pool), the application properties,
+        and the properties of the same stack in the model, if any.
+
+        An environment which is not a mapping of pools is left out of the
+        index (see get_stack_info), the other ones still resolve.
+        """
+        model_index = self.model.get_index() if self.model else {}
+        stacks = []
+
+        app_prop = dict(self.properties)
+        app_prop.pop('environments')
+
+        self._index = {}
+        self._invalid_environments = set()
+        for environment, pools in self.properties['environments'].items():
+            if not isinstance(pools, collections.Mapping):
+                self._invalid_environments.add(environment)
+                continue
+            default_pools, identifier_pools = parse_pools(pools)
+
+            for pool in set(default_pools) | \
+                    set(p for p, i in identifier_pools):
+                # The identifiers of the model matter too: its properties
+                # seed the ones of the application
+                identifiers = set([None])
+                identifiers.update(i for p, i in identifier_pools
+                                   if p == pool)
+                identifiers.update(i for e, p, i in model_index
+                                   if e == environment and p == pool)
+
+                for identifier in identifiers:
+                    if (pool, identifier) in identifier_pools:
+                        pool_prop = identifier_pools[(pool, identifier)]
+                        defined = True
+                    else:
+                        pool_prop = default_pools.get(pool)
+                        defined = identifier is None
+
+                    # True as empty dict to get model properties only
+                    if pool_prop is True:
+                        pool_prop = {}
+                    if not isinstance(pool_prop, collections.Mapping):
+                        continue
+
+                    stack_prop = dict(
+                        model_index.get((environment, pool, identifier)) or
+                        model_index.get((environment, pool, None)) or {})
+                    stack_prop.update(app_prop)
+                    stack_prop.update(pool_prop)
+                    stack_prop.update({'Environment': environment,
+                                       'Type': pool})
+                    self._index[(environment, pool, identifier)] = stack_prop
+                    if defined:
+                        stacks.append((environment, pool, identifier))
+
+        self._stacks = sorted(stacks)
+
+    def get_stack_name(self, environment, pool, identifier=None):
+        parts = [self.shortname, pool, environment]
+        if identifier is not None:
+            parts.append(identifier)
+        return '-'.join(parts)
+
+    def expand_stacks(self):
+        """Yield the (stack name, stack info) of every stack defined.
+
+        That is each pool of each environment, and each identifier of the
+        pools of identifiers (the ones of its model are not included).
+        """
+        index = self.get_index()
+        for environment, pool, identifier in self._stacks:
+            yield (self.get_stack_name(environment, pool, identifier),
+                   dict(index[(environment, pool, identifier)]))
+
 
-        return stack_prop
+RE_POOL_IDENTIFIERS = re.compile(r'^(.+?)\[(.+)\]$')
+
+
+def parse_pools(pools):
+    """Split the pools of an environment in default and identifier pools.
+
+    The default pools are by name, the pools of some identifiers by pool name
+    and identifier: "node[2, 3]" is the pool node of the identifiers 2 and 3.
+    """
+    default_pools = {}
+    identifier_pools = {}
+    for pool_name, pool_prop in pools.items():
+        match = RE_POOL_IDENTIFIERS.match(pool_name)
+        if match is None:
+            default_pools[pool_name] = pool_prop
+            continue
+        pool, identifiers = match.groups()
+        for identifier in identifiers.split(','):
+            identifier_pools.setdefault((pool, identifier.strip()), pool_prop)
+    return default_pools, identifier_pools
 
 
 class Applications(collections.Set):
 
-    """Collection of Application."""
+    """Collection of Application.
+
+    The applications are indexed by name and shortname, which are unique.
+    """
 
     def __init__(self, yamldata=None):
         self._apps = []
+        self._index_apps()
         if yamldata:
             self.load_from_yaml(yamldata)
 
@@ -153,7 +247,11 @@ class Applications(collections.Set):
         return iter(self._apps)
 
     def __contains__(self, value):
-        return value in self._apps
+        try:
+            return value in self._app_set
+        except TypeError:
+            # Unhashable, not an Application
+            return False
 
     def __len__(self):
         return len(self._apps)
@@ -163,27 +261,126 @@ class Applications(collections.Set):
 
     def load_from_yaml(self, yamldata):
         """Load from a multiple documents yaml stream."""
-        docs = yaml.load_all(yamldata)
+        # The libyaml parser is much faster, when available
+        docs = yaml.load_all(yamldata,
+                             Loader=getattr(yaml, 'CLoader', yaml.Loader))
 
         self._apps = [Application(d) for d in docs]
+        self._index_apps()
 
         for app in self:
             app.apply_model(self)
             app.validate()
 
+        # A model is indexed before the applications using it
+        for app in self:
+            app.get_index()
+
+    def _index_apps(self):
+        """Index the applications by name and shortname.
+
+        Raise ApplicationInvalid for a duplicate name or shortname.
+        """
+        self._app_set = set(self._apps)
+        self._by_name = {}
+        self._by_shortname = {}
+
+        for app in self._apps:
+            for prop, index in [('name', self._by_name),
+                                ('shortname', self._by_shortname)]:
+                try:
+                    value = getattr(app, prop)
+                except KeyError:
+                    # Missing, see Application.validate
+                    continue
+                if value in index:
+                    raise ApplicationInvalid(
+                        "Duplicate %s: %s" % (prop, value))
+                index[value] = app
+
+    def expand_all(self):
+        """Yield the (stack name, stack info) of every stack of every app.
+
+        See Application.expand_stacks.
+        """
+        for app in self:
+            for stack in app.expand_stacks():
+                yield stack
+
     def get(self, name=None, shortname=None, stackname=None):
-        """Return the first matching Application.
+        """Return the matching Application.
 
         Only compare the name or shortname even when matching with a stackname
         """
         if stackname:
             shortname = stackname.split('-')[0]
 
-        for app in self:
-            if name and app.name != name:
-                continue
-            if shortname and app.shortname != shortname:
-                continue
-            return app
+        if name:
+            app = self._by_name.get(name)
+            if shortname and self._by_shortname.get(shortname) is not app:
+                app = None
+        elif shortname:
+            app = self._by_shortname.get(shortname)
+        else:
+            app = self._apps[0] if self._apps else None
+
+        if app is None:
+            raise ApplicationNotFound("Application not found")
+        return app
+
 
-        raise ApplicationNotFound("Application not found")
+# To be increased when the pickled attributes of Application(s) change
+SETTINGS_CACHE_FORMAT = 3
+
+# The Applications loaded in this process, by path: (key, applications)
+_loaded = {}
+
+
+def load_applications(path, directory=CACHE_DIR):
+    """Return the Applications of a settings file.
+
+    The applications (parsed and indexed) are kept in a binary cache in
+    `directory`, used as long as the modification time and the content of
+    the settings file are the same.
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    with open(path, 'rb') as fp:
+        yamldata = fp.read()
+        mtime = os.fstat(fp.fileno()).st_mtime
+    # A new version may change the classes or the resolution
+    key = (SETTINGS_CACHE_FORMAT, awstools.__version__, mtime,
+           hashlib.sha1(yamldata).hexdigest())
+
+    if path in _loaded and _loaded[path][0] == key:
+        return _loaded[path][1]
+
+    cachepath = os.path.join(
+        os.path.expanduser(directory),
+        'settings-%s.pickle' % hashlib.sha1(path).hexdigest()[:16])
+
+    apps = _read_settings_cache(cachepath, key)
+    if apps is None:
+        apps = Applications(yamldata)
+        _write_settings_cache(cachepath, key, apps)
+
+    _loaded[path] = (key, apps)
+    return apps
+
+
+def _read_settings_cache(cachepath, key):
+    try:
+        with open(cachepath, 'rb') as fp:
+            cached_key, apps = pickle.load(fp)
+    except Exception:
+        # Missing, corrupted, or made by another version
+        return None
+    return apps if cached_key == key else None
+
+
+def _write_settings_cache(cachepath, key, apps):
+    try:
+        atomic_write(cachepath,
+                     pickle.dumps((key, apps), pickle.HIGHEST_PROTOCOL))
+    except (IOError, OSError):
+        # The cache is an optimization only
+        pass
@@ -0,0 +1,30 @@
+"""Entry points of the commands.
+
+Only the standard library is imported here, the command modules (argh,
+boto...) are imported once needed: `ec2ssh --completion-list`, run at each
+Tab press, only reads a small file.
+"""
+import sys
+
+
+def cfn():
+    from awstools.commands.cloudformation import main
+    main()
+
+
+def cfnas():
+    from awstools.commands.cfnautoscale import main
+    main()
+
+
+def ec2ssh():
+    if sys.argv[1:] == ['--completion-list']:
+        from awstools.utils.completion import read_completion_list
+        try:
+            print(" ".join(read_completion_list()))
+        except IOError:
+            pass
+        return
+
+    from awstools.commands.ec2ssh import main
+    main()
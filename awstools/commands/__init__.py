@@ -1,30 +1,181 @@
+"""Helpers shared by the commands.
+
+Only the modules needed by every command are imported at the top: the
+others (yaml, boto.cloudformation, prettytable...) are imported by the
+helpers using them, to keep the start of the commands fast.
+"""
+import atexit
 import os
-import pkg_resources
+import sys
 
 from argh import ArghParser, confirm
 from argh.exceptions import CommandError
 
 import awstools
-from awstools.application import Applications
+from awstools.utils.cache import CACHE_DIR
+from awstools.utils.profiling import profiler
+
+
+# Default lifetime of the instances inventory of ec2ssh, in seconds
+INVENTORY_TTL = 300
+
+
+class _CommandErrors(object):
+
+    """The errors displayed without traceback (see argh.wrap_errors).
+
+    Only iterated when a command runs: boto is not imported for --help.
+    """
+
+    def __iter__(self):
+        from boto.exception import BotoServerError
+
+        return iter([ValueError, BotoServerError])
+
+
+COMMAND_ERRORS = _CommandErrors()
+
+
+def get_base_parser(**kwargs):
+    """Return the parser of the stack commands (cfn, cfnas)."""
+    parser = ArghParser(version=awstools.__version__, **kwargs)
+    add_common_arguments(parser)
+    parser.add_argument(
+        '--settings',
+        default=None,
+        help="path of the application settings configuration file")
+
+    return parser
 
 
-def get_base_parser():
-    dist = pkg_resources.get_distribution("awstools")
-    parser = ArghParser(version=dist.version)
+def add_common_arguments(parser):
+    """Add the options read by every command: configuration, cache, profile."""
     parser.add_argument(
         '--config',
         default=None,
         help="path of an alternative configuration file")
     parser.add_argument(
-        '--settings',
+        '--refresh',
+        default=False,
+        action='store_true',
+        help="ignore the cached AWS data (and refresh it)")
+    parser.add_argument(
+        '--profile-api',
+        default=False,
+        action='store_true',
+        help="display statistics of the AWS API calls at exit")
+    parser.add_argument(
+        '--profile-api-output',
         default=None,
-        help="path of the application settings configuration file")
+        metavar='PATH',
+        help="write the AWS API calls to a file, as JSON lines")
 
-    return parser
+
+def setup_from_cli(args):
+    """Configure the global helpers from the configuration and options.
+
+    To be run by argh before the command (pre_call).
+    """
+    from awstools.utils.cloudformation import stack_cache
+
+    config = awstools.read_config(args.config)
+
+    stack_cache.configure(
+        ttl=_get_option(config, 'cache', 'ttl', 0, config.getint),
+        describe=_get_option(config, 'cache', 'describe', False,
+                             config.getboolean),
+        directory=_get_option(config, 'cache', 'directory', CACHE_DIR),
+        refresh=args.refresh)
+
+    setup_profiling(args)
+
+
+def setup_ec2ssh_from_cli(args):
+    """Like setup_from_cli, for ec2ssh (no stack cache but an inventory)."""
+    from awstools.utils.ssh import multiplexer, CONTROL_PERSIST
+
+    config = awstools.read_config(args.config)
+
+    configure_inventory(config, refresh=args.refresh,
+                        regions=getattr(args, 'region', None))
+
+    multiplexer.configure(
+        enabled=getattr(args, 'multiplex', False) or
+        _get_option(config, 'ec2ssh', 'multiplex', False, config.getboolean),
+        directory=_get_option(config, 'cache', 'directory', CACHE_DIR),
+        persist=_get_option(config, 'ec2ssh', 'control_persist',
+                            CONTROL_PERSIST))
+
+    setup_profiling(args)
+
+
+def configure_inventory(config, refresh=False, regions=None):
+    """Configure the inventory of the instances from the configuration.
+
+    `regions` (comma-separated) overrides the [ec2ssh] regions.
+    """
+    from awstools.utils.inventory import inventory
+
+    regions = regions or _get_option(config, 'ec2ssh', 'regions', None)
+
+    inventory.configure(
+        ttl=_get_option(config, 'cache', 'instances_ttl', INVENTORY_TTL,
+                        config.getint),
+        directory=_get_option(config, 'cache', 'directory', CACHE_DIR),
+        refresh=refresh,
+        regions=split_list(regions))
+
+
+def setup_profiling(args):
+    if not (args.profile_api or args.profile_api_output):
+        return
+
+    profiler.configure(enabled=True)
+    _pending_reports.append((args.profile_api, args.profile_api_output))
+    atexit.register(flush_profile)
+
+
+# The profile reports to make, once: (display, path)
+_pending_reports = []
+
+
+def flush_profile():
+    """Make the pending profile report.
+
+    Called at exit, and before the process is replaced (exec), which skips
+    the exit handlers.
+    """
+    while _pending_reports:
+        report_profile(*_pending_reports.pop())
+
+
+def report_profile(display, path=None):
+    from awstools.display import format_profile
+
+    if display:
+        sys.stderr.write(format_profile(profiler.summary()) + '\n')
+
+    if path:
+        with open(os.path.expanduser(path), 'w') as fp:
+            profiler.dump(fp)
+
+
+def _get_option(config, section, option, default, getter=None):
+    if not config.has_option(section, option):
+        return default
+    return (getter or config.get)(section, option)
+
+
+def split_list(value):
+    """Return the items of a comma-separated list, None if empty."""
+    items = [item.strip() for item in (value or '').split(',')]
+    return [item for item in items if item] or None
 
 
 def initialize_from_cli(args):
     """Read the configuration and settings file and lookup for a stack_info."""
+    from awstools.application import load_applications
+
     config = awstools.read_config(args.config)
 
     if args.settings:
@@ -32,10 +183,10 @@ def initialize_from_cli(args):
     else:
         settings = config.get("cfn", "settings")
 
-    settings_data = open(os.path.expanduser(settings), 'rb')
-
     if hasattr(args, 'stack_name'):
-        apps = Applications(settings_data)
+        apps = load_applications(
+            settings,
+            directory=_get_option(config, 'cache', 'directory', CACHE_DIR))
         app = apps.get(stackname=args.stack_name)
         sinfo = app.get_stack_info_from_stackname(args.stack_name)
     else:
@@ -44,8 +195,12 @@ def initialize_from_cli(args):
     return config, settings, sinfo
 
 
+def is_live(sinfo):
+    return sinfo['live'] and sinfo['Environment'] == 'production'
+
+
 def warn_for_live(sinfo):
-    if sinfo['live'] and sinfo['Environment'] == 'production':
+    if is_live(sinfo):
         if not confirm("WARNING: Updating a live stack! Are you sure? "):
             raise CommandError("Aborted")
 
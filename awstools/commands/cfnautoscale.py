@@ -3,18 +3,22 @@ from time import sleep
 from argh import arg, confirm, wrap_errors, expects_obj
 from argh.exceptions import CommandError
 
-import boto
-from boto.exception import BotoServerError
-
 from awstools.display import (format_stack_summary,
                               format_autoscale,
-                              format_autoscale_instances)
+                              format_autoscale_instances,
+                              format_instances_health)
 from awstools.utils.cloudformation import (find_stacks,
                                            find_one_stack,
                                            find_one_resource,
+                                           describe_stacks_resources,
+                                           find_resources,
                                            RES_TYPE_ASG,
                                            RES_TYPE_ELB)
-from awstools.commands import (get_base_parser,
+from awstools.utils import connections
+from awstools.utils.pool import ordered_map, DEFAULT_JOBS
+from awstools.commands import (COMMAND_ERRORS,
+                               get_base_parser,
+                               setup_from_cli,
                                initialize_from_cli,
                                warn_for_live,
                                confirm_action)
@@ -26,6 +30,7 @@ HELP_MIN = "AutoScaleGroup min constraint"
 HELP_MAX = "AutoScaleGroup max constraint"
 HELP_DESIRED = "AutoScaleGroup desired value"
 HELP_FORCE = "Don't ask for confirmation"
+HELP_JOBS = "Number of stacks to inspect in parallel"
 
 
 def main():
@@ -39,22 +44,29 @@ def main():
                          show_cfg,
                          metrics])
 
-    parser.dispatch(completion=False)
+    parser.dispatch(completion=False, pre_call=setup_from_cli)
 
 
 @arg('stack_name', help=HELP_SN)
-@wrap_errors([ValueError, BotoServerError])
+@arg('-j', '--jobs', type=int, default=DEFAULT_JOBS, help=HELP_JOBS)
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def status(args):
     """List the status of the instances and ELB."""
-    stacks = find_stacks(args.stack_name)
+    stacks = sorted(find_stacks(args.stack_name), key=lambda k: k.stack_name)
 
-    cfn = boto.connect_cloudformation()
+    stacks_resources = describe_stacks_resources(stacks, args.jobs)
+    asgs = find_resources(stacks_resources, RES_TYPE_ASG)
+    elbs = find_resources(stacks_resources, RES_TYPE_ELB, only_id=True)
 
-    for stack in stacks:
-        fullstack = cfn.describe_stacks(stack.stack_name)[0]
-        yield "\nStack %s" % fullstack.stack_name
-        yield format_autoscale_instances(fullstack)
+    def fetch(stack):
+        elb = connections.elb()
+        ihealth = elb.describe_instance_health(elbs[stack.stack_name])
+        return stack, format_instances_health(asgs[stack.stack_name], ihealth)
+
+    for stack, instances in ordered_map(fetch, stacks, args.jobs):
+        yield "\nStack %s" % stack.stack_name
+        yield instances
 
 
 @arg('stack_name', help=HELP_SN)
@@ -62,7 +74,7 @@ def status(args):
 @arg('max', nargs='?', help=HELP_MAX)
 @arg('desired', nargs='?', help=HELP_DESIRED)
 @arg('-f', '--force', default=False, help=HELP_FORCE)
-@wrap_errors([ValueError, BotoServerError])
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def control(args):
     """Control the stack: update the AutoScaleGroup constraints."""
@@ -93,7 +105,7 @@ def control(args):
 
 @arg('stack_name', help=HELP_SN)
 @arg('-f', '--force', default=False, help=HELP_FORCE)
-@wrap_errors([ValueError, BotoServerError])
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def stop(args):
     """Stop the stack: force the AutoScale to shut all instances down."""
@@ -120,7 +132,7 @@ def stop(args):
 
 @arg('stack_name', help=HELP_SN)
 @arg('-f', '--force', default=False, help=HELP_FORCE)
-@wrap_errors([ValueError, BotoServerError])
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def start(args):
     """Start the stack: set AutoScale control to configured values."""
@@ -149,30 +161,31 @@ def start(args):
 
 
 @arg('stack_name', help=HELP_SN)
-@wrap_errors([ValueError, BotoServerError])
+@arg('-j', '--jobs', type=int, default=DEFAULT_JOBS, help=HELP_JOBS)
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def show_cfg(args):
     """List the instance with AutoScale launch config."""
-    stacks = find_stacks(args.stack_name)
+    stacks = sorted(find_stacks(args.stack_name), key=lambda k: k.stack_name)
 
-    cfn = boto.connect_cloudformation()
+    stacks_resources = describe_stacks_resources(stacks, args.jobs)
+    asgs = find_resources(stacks_resources, RES_TYPE_ASG)
 
     for stack in stacks:
         yield "Stack %s" % stack.stack_name
 
-        stack = cfn.describe_stacks(stack.stack_name)[0]
-
-        asg = find_one_resource(stack, RES_TYPE_ASG)
-        for instance in asg.instances:
+        for instance in asgs[stack.stack_name].instances:
             yield "  {i!r} LC:{i.launch_config_name}".format(i=instance)
 
 
 @arg('stack_name', help=HELP_SN)
 @arg('-f', '--force', default=False, help=HELP_FORCE)
-@wrap_errors([ValueError, BotoServerError])
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def migrate_cfg(args):
     """Migrate the stack: re-instantiate all instances."""
+    from boto.exception import BotoServerError
+
     config, settings, sinfo = initialize_from_cli(args)
     stack = find_one_stack(args.stack_name, summary=False)
     print(format_stack_summary(stack))
@@ -216,7 +229,7 @@ def migrate_cfg(args):
         sleep(30)
         asg = find_one_resource(stack, RES_TYPE_ASG)
         res_elb_id = find_one_resource(stack, RES_TYPE_ELB, only_id=True)
-        elbinstances = boto.connect_elb().describe_instance_health(res_elb_id)
+        elbinstances = connections.elb().describe_instance_health(res_elb_id)
         if len(asg.instances) < mig_desired:
             yield "    NOTYET: only %i instances created" % len(asg.instances)
             continue
@@ -260,7 +273,7 @@ def migrate_cfg(args):
 @arg('stack_name', help=HELP_SN)
 @arg('--enable', default=False)
 @arg('--disable', default=False)
-@wrap_errors([ValueError, BotoServerError])
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def metrics(args):
     """Control the metrics collection activation."""
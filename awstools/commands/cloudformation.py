@@ -1,22 +1,38 @@
+import copy
 import os
+import time
 
 from argh import arg, named, confirm, wrap_errors, expects_obj
 from argh.exceptions import CommandError
 
-import boto
-from boto.exception import BotoServerError
-
 from awstools.display import (format_stack_summary, format_stack_outputs,
-                              format_stacks, format_stack_resources,
+                              format_stacks, format_stacks_stream,
+                              format_stack_resources,
                               format_stack_parameters,
-                              format_stack_events)
+                              format_stack_events,
+                              format_stack_event_line,
+                              format_update_results)
 from awstools.utils.cloudformation import (find_stacks,
-                                           find_one_stack)
-from awstools.commands import (get_base_parser,
+                                           find_one_stack,
+                                           stack_cache,
+                                           iter_stack_events,
+                                           wait_for_stacks,
+                                           follow_stack_events,
+                                           is_stack_event,
+                                           is_stack_stable,
+                                           STACK_STATUSES,
+                                           STACK_SUCCESS_STATUS)
+from awstools.commands import (COMMAND_ERRORS,
+                               get_base_parser,
+                               setup_from_cli,
                                initialize_from_cli,
                                warn_for_live,
+                               is_live,
                                confirm_action)
 from awstools import cfntemplate
+from awstools.utils import connections
+from awstools.utils.backoff import WaitTimeout
+from awstools.utils.pool import ordered_map
 
 
 HELP_SN = "The name of the stack like tt-python-production"
@@ -28,6 +44,18 @@ HELP_DESIRED = "AutoScaleGroup desired value"
 HELP_FORCE = "Don't ask for confirmation"
 HELP_FULL_LIST = "Display the full list"
 
+DEFAULT_TIMEOUT = 3600
+HELP_WAIT = "Wait until the stack(s) creation/update/deletion is over"
+HELP_TIMEOUT = "Maximum time to wait, in seconds"
+HELP_FOLLOW = "Wait for and display the new events until the stack is stable"
+HELP_SINCE = "Only display the events since a UTC date (like 2013-12-17T10:00)"
+HELP_JOBS = "Number of stacks to update at the same time"
+HELP_MAX_FAILURES = ("Don't start new updates after this number of failures "
+                     "(0 for no limit)")
+
+NO_UPDATE_MESSAGE = "No updates are to be performed."
+UPDATE_SUCCESS_STATUS = STACK_SUCCESS_STATUS + ['NO_UPDATE', 'UPDATE_STARTED']
+
 
 def main():
     parser = get_base_parser()
@@ -44,26 +72,31 @@ def main():
                          events,
                          activities])
 
-    parser.dispatch(completion=False)
+    parser.dispatch(completion=False, pre_call=setup_from_cli)
 
 
 @arg('-a', '--all', default=False)
 @arg('stack_name', nargs='?', default='')
 @named('list')
-@wrap_errors([ValueError, BotoServerError])
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def ls(args):
     """List stacks."""
     stacks = find_stacks(args.stack_name, findall=args.all)
-    yield format_stacks(stacks)
+    for line in format_stacks_stream(stacks):
+        yield line
 
 
 @arg('stack_name', help=HELP_SN)
 @arg('--template', help=HELP_TMPL)
-@wrap_errors([ValueError, BotoServerError])
+@arg('-w', '--wait', default=False, help=HELP_WAIT)
+@arg('--timeout', type=int, default=DEFAULT_TIMEOUT, help=HELP_TIMEOUT)
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def create(args):
     """Create a stack."""
+    from boto.exception import BotoServerError
+
     config, settings, sinfo = initialize_from_cli(args)
 
     # Read template
@@ -90,12 +123,13 @@ def create(args):
     confirm_action(arg, default=True)
 
     try:
-        stackid = boto.connect_cloudformation().create_stack(
+        stackid = connections.cloudformation().create_stack(
             args.stack_name,
             template_body=template.body,
             parameters=parameters,
             tags=tags,
             capabilities=['CAPABILITY_IAM'])
+        stack_cache.invalidate(args.stack_name)
         print("StackId %s" % stackid)
     except BotoServerError as error:
         if error.error_message:
@@ -103,25 +137,32 @@ def create(args):
         else:
             raise error
 
+    if args.wait:
+        for line in wait_stacks([stackid], args.timeout):
+            print(line)
+
 
 @arg('stack_name', help=HELP_SN)
 @arg('--template', help=HELP_TMPL)
 @arg('-f', '--force', default=False, help=HELP_FORCE)
-@wrap_errors([ValueError, BotoServerError])
+@arg('-w', '--wait', default=False, help=HELP_WAIT)
+@arg('--timeout', type=int, default=DEFAULT_TIMEOUT, help=HELP_TIMEOUT)
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def update(args):
     """Update a stack."""
-    config, settings, sinfo = initialize_from_cli(args)
+    stackid = update_stack(args)
 
-    # Read template
-    template = cfntemplate.CfnTemplate(
-        os.path.join(
-            config.get("cfn", "templatedir"),
-            args.template if args.template else sinfo['template']
-        )
-    )
+    if args.wait:
+        for line in wait_stacks([stackid], args.timeout):
+            print(line)
 
-    parameters = cfntemplate.CfnParameters(template, sinfo)
+
+def update_stack(args):
+    """Update the stack args.stack_name and return its id."""
+    from boto.exception import BotoServerError
+
+    sinfo, template, parameters = read_stack_update(args, args.stack_name)
 
     print("\nStack name: {args.stack_name}\n"
           "\nTemplate: {template!r}\n"
@@ -134,11 +175,7 @@ def update(args):
     confirm_action(arg, default=True)
 
     try:
-        stackid = boto.connect_cloudformation().update_stack(
-            args.stack_name,
-            template_body=template.body,
-            parameters=parameters,
-            capabilities=['CAPABILITY_IAM'])
+        stackid = start_stack_update(args.stack_name, template, parameters)
         print("StackId %s" % stackid)
     except BotoServerError as error:
         if error.error_message:
@@ -146,36 +183,191 @@ def update(args):
         else:
             raise error
 
+    return stackid
+
+
+def read_stack_update(args, stack_name):
+    """Return the stack info, template and parameters to update a stack."""
+    args = copy.copy(args)
+    args.stack_name = stack_name
+    config, settings, sinfo = initialize_from_cli(args)
+
+    # Read template
+    template = cfntemplate.CfnTemplate(
+        os.path.join(
+            config.get("cfn", "templatedir"),
+            args.template if args.template else sinfo['template']
+        )
+    )
+
+    parameters = cfntemplate.CfnParameters(template, sinfo)
+
+    return sinfo, template, parameters
+
+
+def start_stack_update(stack_name, template, parameters):
+    stackid = connections.cloudformation().update_stack(
+        stack_name,
+        template_body=template.body,
+        parameters=parameters,
+        capabilities=['CAPABILITY_IAM'])
+    stack_cache.invalidate(stack_name)
+    return stackid
+
 
 @arg('stack_name', nargs='?', default='')
 @arg('-f', '--force', default=False, help=HELP_FORCE)
-@wrap_errors([ValueError, BotoServerError])
+@arg('-w', '--wait', default=False, help=HELP_WAIT)
+@arg('--timeout', type=int, default=DEFAULT_TIMEOUT, help=HELP_TIMEOUT)
+@arg('-j', '--jobs', type=int, default=1, help=HELP_JOBS)
+@arg('--max-failures', type=int, default=1, help=HELP_MAX_FAILURES)
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def batch_update(args):
-    """Update a batch of stacks sequentially."""
+    """Update a batch of stacks, --jobs of them at the same time."""
     args.template = None
 
-    stacks = find_stacks(args.stack_name)
+    stacks = sorted(find_stacks(args.stack_name), key=lambda k: k.stack_name)
     yield format_stacks(stacks)
 
-    confirm_action(arg, default=False)
-
+    # Read everything first: nothing is started if a stack can't be updated
+    updates = []
     for stack in stacks:
-        args.stack_name = stack.stack_name
-        try:
-            update(args)
-        except CommandError as error:
-            print error
-            if not confirm('Continue anyway?', default=True):
-                raise
+        sinfo, template, parameters = read_stack_update(args,
+                                                        stack.stack_name)
+        updates.append((stack.stack_name, sinfo, template, parameters))
+
+    live = [name for name, sinfo, _, _ in updates if is_live(sinfo)]
+    if live:
+        yield "Live production stacks: %s" % ', '.join(live)
+        if not confirm("WARNING: Updating %s live stack(s)! Are you sure? "
+                       % len(live)):
+            raise CommandError("Aborted")
+
+    confirm_action(args, action="update of %s stack(s)" % len(updates),
+                   default=False)
+
+    results = []
+    for name, status, message in run_stack_updates(updates, args):
+        yield "%s: %s %s" % (name, status, message)
+        results.append((name, status, message))
+
+    yield format_update_results(results)
+
+    failed = [name for name, status, _ in results
+              if status not in UPDATE_SUCCESS_STATUS]
+    if failed:
+        raise SystemExit("Failed stack(s): %s" % ', '.join(failed))
+
+
+def run_stack_updates(updates, args):
+    """Yield (stack name, status, message) for each update, in order.
+
+    Up to args.jobs updates are in progress at the same time. They are
+    started in parallel and, with args.wait, the stacks in progress are
+    waited for together (one poll for all of them, see wait_for_stacks): a
+    new update starts as soon as one is over. Once args.max_failures
+    updates failed, the remaining ones are skipped.
+    """
+    queue = list(enumerate(updates))
+    # The stacks in progress, by id: (index of the update, deadline)
+    in_progress = {}
+    results = {}
+    failures = [0]
+    next_index = 0
+
+    def record(index, status, message):
+        results[index] = (updates[index][0], status, message)
+        if status not in UPDATE_SUCCESS_STATUS:
+            failures[0] += 1
+
+    def too_many_failures():
+        return args.max_failures and failures[0] >= args.max_failures
+
+    while queue or in_progress:
+        if too_many_failures():
+            for index, _ in queue:
+                record(index, 'SKIPPED', 'Too many failures')
+            queue = []
+
+        slots = max(args.jobs, 1) - len(in_progress)
+        started, queue = queue[:slots], queue[slots:]
+        statuses = ordered_map(start_update,
+                               [update for _, update in started], args.jobs)
+        for (index, _), (status, message) in zip(started, statuses):
+            if status == 'UPDATE_STARTED' and args.wait:
+                in_progress[message] = (index, time.time() + args.timeout)
+            else:
+                record(index, status, message)
+
+        if in_progress:
+            # Only until a stack is over when another update can start
+            wait_all = not queue or too_many_failures()
+            for stack_id, status, message in wait_for_updates(in_progress,
+                                                              args.timeout):
+                record(in_progress.pop(stack_id)[0], status, message)
+                if not wait_all:
+                    break
+
+        while next_index in results:
+            yield results.pop(next_index)
+            next_index += 1
+
+
+def start_update(update):
+    """Start an update (stack name, info, template, parameters).
+
+    Return its status and a message (the stack id once started).
+    """
+    from boto.exception import BotoServerError
+
+    stack_name, _, template, parameters = update
+    try:
+        stackid = start_stack_update(stack_name, template, parameters)
+    except BotoServerError as error:
+        message = error.error_message or str(error)
+        if message == NO_UPDATE_MESSAGE:
+            return 'NO_UPDATE', ''
+        return 'ERROR', message
+    return 'UPDATE_STARTED', stackid
+
+
+def wait_for_updates(in_progress, timeout):
+    """Yield (stack id, status, message) as soon as each stack is over.
+
+    The stacks in progress are given as {stack id: (index, deadline)}.
+    Once the first deadline is past, the stacks past their deadline are
+    yielded as TIMEOUT, and the other ones aren't waited for.
+    """
+    from boto.exception import BotoServerError
+
+    deadline = min(d for _, d in in_progress.values())
+    try:
+        for stack in wait_for_stacks(sorted(in_progress),
+                                     timeout=max(deadline - time.time(), 0)):
+            yield (stack.stack_id, stack.stack_status,
+                   stack.stack_status_reason or '')
+    except WaitTimeout:
+        now = time.time()
+        for stack_id, (_, deadline) in sorted(in_progress.items()):
+            if deadline <= now:
+                yield (stack_id, 'TIMEOUT',
+                       "Still in progress after %ss" % timeout)
+    except BotoServerError as error:
+        for stack_id in sorted(in_progress):
+            yield stack_id, 'ERROR', error.error_message or str(error)
 
 
 @arg('stack_name', help=HELP_SN)
 @arg('-f', '--force', default=False, help=HELP_FORCE)
-@wrap_errors([ValueError, BotoServerError])
+@arg('-w', '--wait', default=False, help=HELP_WAIT)
+@arg('--timeout', type=int, default=DEFAULT_TIMEOUT, help=HELP_TIMEOUT)
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def delete(args):
     """Delete a stack."""
+    from boto.exception import BotoServerError
+
     config, settings, sinfo = initialize_from_cli(args)
 
     stack = find_one_stack(args.stack_name)
@@ -185,7 +377,8 @@ def delete(args):
     confirm_action(arg, default=True)
 
     try:
-        res = boto.connect_cloudformation().delete_stack(stack.stack_name)
+        res = connections.cloudformation().delete_stack(stack.stack_name)
+        stack_cache.invalidate(stack.stack_name)
     except BotoServerError as error:
         if error:
             raise CommandError("BotoServerError: " + error.error_message)
@@ -193,9 +386,34 @@ def delete(args):
             raise error
     print("Result %s" % res)
 
+    if args.wait:
+        for line in wait_stacks([stack.stack_id], args.timeout):
+            yield line
+
+
+def wait_stacks(stackids, timeout):
+    """Yield the final status of each stack as soon as it's stable.
+
+    Exit with an error status if one of them failed or on timeout.
+    """
+    yield "Waiting for %s stack(s)..." % len(stackids)
+
+    failed = []
+    try:
+        for stack in wait_for_stacks(stackids, timeout=timeout):
+            yield "%s: %s" % (stack.stack_name, stack.stack_status)
+            if stack.stack_status not in STACK_SUCCESS_STATUS:
+                failed.append(stack.stack_name)
+    except WaitTimeout:
+        raise SystemExit("Timeout: stacks still in progress after %ss" % (
+                         timeout))
+
+    if failed:
+        raise SystemExit("Failed stack(s): %s" % ', '.join(failed))
+
 
 @arg('stack_name', help=HELP_SN)
-@wrap_errors([ValueError, BotoServerError])
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def info(args):
     """Display information of a stack."""
@@ -218,7 +436,7 @@ def info(args):
 
 
 @arg('stack_name', help=HELP_SN)
-@wrap_errors([ValueError, BotoServerError])
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def outputs(args):
     """Display outputs of a stack."""
@@ -231,7 +449,7 @@ def outputs(args):
 
 
 @arg('stack_name', help=HELP_SN)
-@wrap_errors([ValueError, BotoServerError])
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def parameters(args):
     """Display parameters of a stack."""
@@ -244,7 +462,7 @@ def parameters(args):
 
 
 @arg('stack_name', help=HELP_SN)
-@wrap_errors([ValueError, BotoServerError])
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def resources(args):
     """Display resources of a stack."""
@@ -259,22 +477,78 @@ def resources(args):
 
 @arg('stack_name', help=HELP_SN)
 @arg('-a', '--all', default=False, help=HELP_FULL_LIST)
-@wrap_errors([ValueError, BotoServerError])
+@arg('--since', default=None, help=HELP_SINCE)
+@arg('-f', '--follow', default=False, help=HELP_FOLLOW)
+@wrap_errors(COMMAND_ERRORS)
 @expects_obj
 def events(args):
     """Display events of a stack."""
+    since = parse_since(args.since)
+
     stack = find_one_stack(args.stack_name, summary=False)
     yield format_stack_summary(stack) + '\n'
-    if args.all:
-        yield format_stack_events(stack)
+
+    if args.follow:
+        for line in follow_events(stack, since):
+            yield line
+    elif args.all or since:
+        yield format_stack_events(stack, since=since)
     else:
         yield format_stack_events(stack, limit=20)
     yield ''
 
 
+def follow_events(stack, since=None):
+    """Print the recent events then the new ones until the stack is stable.
+
+    Exit with an error status if the stack ends in a failed state.
+    """
+    limit = None if since else 20
+    recent = list(iter_stack_events(stack.stack_id, limit=limit, since=since))
+    recent.reverse()
+
+    for event in recent:
+        yield format_stack_event_line(event)
+
+    status = stack.stack_status
+    for event in reversed(recent):
+        if is_stack_event(event):
+            status = event.resource_status
+            break
+
+    if not is_stack_stable(status):
+        if recent:
+            last_event_id = recent[-1].event_id
+        else:
+            # None printed since the date: follow from the newest event
+            newest = list(iter_stack_events(stack.stack_id, limit=1))
+            last_event_id = newest[0].event_id if newest else None
+        for event in follow_stack_events(stack.stack_id, last_event_id):
+            yield format_stack_event_line(event)
+            if is_stack_event(event):
+                status = event.resource_status
+
+    yield '\nStack status: %s' % status
+    if status not in STACK_SUCCESS_STATUS:
+        raise SystemExit(1)
+
+
+def parse_since(value):
+    """Return a naive UTC datetime from a date string, None if empty."""
+    import arrow
+
+    if not value:
+        return None
+    try:
+        return arrow.get(value).to('utc').naive
+    except (arrow.parser.ParserError, ValueError) as error:
+        raise CommandError("Invalid date for --since: %s" % error)
+
+
 def activities(args):
     """Display global activity."""
-    stacks = find_stacks(None, findall=True)
-    stacks = [s for s in stacks if not s.stack_status.endswith('_COMPLETE')]
-    yield format_stacks(stacks)
+    statuses = [s for s in STACK_STATUSES if not s.endswith('_COMPLETE')]
+    stacks = find_stacks(None, statuses=statuses)
+    for line in format_stacks_stream(stacks):
+        yield line
     yield ''
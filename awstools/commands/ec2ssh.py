@@ -1,12 +1,15 @@
 import argparse
-import json
 import os
 import subprocess
 
 import argh
 from argh.exceptions import CommandError
 
-from awstools.utils import ec2
+import awstools
+from awstools.commands import (add_common_arguments, setup_ec2ssh_from_cli,
+                               flush_profile)
+from awstools.utils import completion, ec2, ssh
+from awstools.utils.inventory import inventory
 
 
 def main():
@@ -24,9 +27,13 @@ def main():
         epilog=epilog,
         formatter_class=argparse.RawDescriptionHelpFormatter,
         )
+    # -v is --verbose here
+    parser.add_argument('--version', action='version',
+                        version=awstools.__version__)
+    add_common_arguments(parser)
 
     argh.set_default_command(parser, connect)
-    argh.dispatch(parser, completion=False)
+    argh.dispatch(parser, completion=False, pre_call=setup_ec2ssh_from_cli)
 
 
 HELP_INSTANCE = "Instance or list of instances"
@@ -36,6 +43,13 @@ HELP_CONFIRM = "Always confirm"
 HELP_VERBOSE = "Verbose mode"
 HELP_ONE = "Run on the first instance found only"
 HELP_YES = "Always answer yes"
+HELP_PARALLEL = ("Run the command on N instances at the same time, with "
+                 "the output prefixed by the instance name")
+HELP_TIMEOUT = "Kill the command of an instance after SECONDS"
+HELP_MULTIPLEX = ("Share one SSH connection per instance, kept open in the "
+                  "background for the next commands")
+HELP_REGION = ("Regions of the instances, separated by commas "
+               "(default: the regions of the configuration or us-east-1)")
 HELP_COMPLETION = "Helper for completion (list eventually uptodate)"
 HELP_COMPLETION = "Output a script to setup bash completion"
 
@@ -47,6 +61,12 @@ HELP_COMPLETION = "Output a script to setup bash completion"
 @argh.arg('-v', '--verbose', default=False, help=HELP_VERBOSE)
 @argh.arg('-y', '--yes', default=False, help=HELP_YES)
 @argh.arg('-1', '--one', default=False, help=HELP_ONE)
+@argh.arg('-p', '--parallel', type=int, default=0, metavar='N',
+          help=HELP_PARALLEL)
+@argh.arg('-t', '--timeout', type=float, default=None, metavar='SECONDS',
+          help=HELP_TIMEOUT)
+@argh.arg('-m', '--multiplex', default=False, help=HELP_MULTIPLEX)
+@argh.arg('--region', default=None, help=HELP_REGION)
 @argh.arg('--completion-list', default=False)
 @argh.arg('--completion-script', default=False, help=HELP_COMPLETION)
 @argh.expects_obj
@@ -62,7 +82,7 @@ def connect(args):
         yield BASH_COMPLETION_INSTALL_SCRIPT
 
     elif args.list:
-        instances = ec2.get_instances()
+        instances = inventory.get_all_instances()
         names = sorted([ec2.get_name(i) for i in instances])
         yield '\n'.join(names)
 
@@ -72,13 +92,29 @@ def connect(args):
     else:
         if args.confirm and args.yes:
             raise CommandError("Option confirm and yes are not compatible")
+        if (args.parallel or args.timeout) and not args.command:
+            raise CommandError("Option parallel and timeout need a command")
 
         try:
-            instances = ec2.get_instances()
-            write_completion_list(instances)
-
-            specifiers = args.instance.lower().strip().split(',')
-            instances = ec2.filter_instances(specifiers, instances)
+            # As typed for the EC2 filters, which are case sensitive
+            typed = args.instance.strip().split(',')
+            specifiers = [s.lower() for s in typed]
+
+            if inventory.is_cached():
+                instances = inventory.get_all_instances()
+                write_completion_list(instances)
+                found = ec2.filter_instances(specifiers, instances)
+            else:
+                found = inventory.find_instances(typed)
+
+            # Maybe a new instance, missing from the inventory, or a name
+            # in another case than its tag
+            if ec2.unmatched_specifiers(specifiers, found):
+                instances = inventory.fetch_all()
+                write_completion_list(instances)
+                found = ec2.filter_instances(specifiers, instances)
+
+            instances = found
             if len(instances) == 0:
                 raise CommandError("No instances found.")
         except KeyboardInterrupt:
@@ -103,39 +139,90 @@ def connect(args):
                                 default=True):
                 instances = [instances[0]]
 
-        if len(instances) == 1:
+        ssh.multiplexer.prepare()
+        options = ssh.multiplexer.options()
+
+        if args.parallel or args.timeout:
+            for line in run_in_parallel(instances, args, options):
+                yield line
+
+        elif len(instances) == 1:
             host = instances[0].public_dns_name
+            flush_profile()
             try:
-                os.execvp('ssh', ['ec2ssh', host] + args.command)
+                os.execvp('ssh', ['ec2ssh'] + options + [host] + args.command)
             except OSError as error:
                 raise Exception("Failed to call the ssh command: %s" % error)
         else:
+            failed = ssh.multiplexer.warm_up(
+                [i.public_dns_name for i in instances])
+            if failed:
+                yield '----- Failed to connect to: %s' % ', '.join(failed)
+
             for instance in instances:
                 if args.verbose:
-                    yield "----- %s: %s  %s" % (
+                    yield "----- %s: %s  %s  %s" % (
                         instance.id,
                         instance.public_dns_name,
                         instance.private_ip_address,
+                        ec2.get_region(instance),
                         )
 
                 host = instance.public_dns_name
-                subprocess.call(['ssh', host] + args.command)
+                subprocess.call(['ssh'] + options + [host] + args.command)
 
         if args.verbose:
             yield '----- DONE'
 
 
+def run_in_parallel(instances, args, options=()):
+    """Run the command on the instances, args.parallel at the same time.
+
+    Yield the output lines prefixed by the instance names, then the exit
+    statuses. Exit with an error status if a command failed.
+    """
+    from awstools.display import format_command_results
+
+    labels = get_labels(instances)
+    hosts = [(labels[i.id], i.public_dns_name) for i in instances]
+    width = max(len(name) for name, address in hosts)
+
+    statuses = {}
+    for name, line, status in ssh.run_commands(
+            hosts, args.command, jobs=max(args.parallel, 1),
+            timeout=args.timeout, options=options):
+        if status is None:
+            yield '%-*s | %s' % (width, name, line)
+        else:
+            statuses[name] = status
+
+    results = [(name, statuses[name]) for name, address in hosts]
+    yield format_command_results(results)
+
+    failed = [name for name, status in results if status != 0]
+    if failed:
+        raise SystemExit("Failed on %s instance(s): %s" % (
+            len(failed), ', '.join(failed)))
+
+
+def get_labels(instances):
+    """Return the label of each instance, by id.
+
+    The label is the name of the instance, with its id if the name is not
+    unique.
+    """
+    names = [ec2.get_name(i) for i in instances]
+    return dict(
+        (i.id, name if names.count(name) == 1 else '%s/%s' % (name, i.id))
+        for i, name in zip(instances, names))
+
+
 def write_completion_list(instances):
-    names = sorted([ec2.get_name(i) for i in instances])
-    fname = os.path.expanduser("~/.ec2ssh_completion")
-    with open(fname, 'wb') as fp:
-        json.dump(names, fp, indent=2)
+    completion.write_completion_list([ec2.get_name(i) for i in instances])
 
 
 def read_completion_list():
-    fname = os.path.expanduser("~/.ec2ssh_completion")
-    with open(fname, 'rb') as fp:
-        return json.load(fp)
+    return completion.read_completion_list()
 
 
 BASH_COMPLETION_INSTALL_SCRIPT = """
@@ -150,7 +237,9 @@ _ec2ssh()
             case $prev in
                 *)
                     opts="-l --list -c --confirm -v --verbose -y --yes -1 "
-                    opts="$opts --one --completion-list --completion-script"
+                    opts="$opts --one -p --parallel -t --timeout"
+                    opts="$opts -m --multiplex --region --completion-list"
+                    opts="$opts --completion-script"
                 ;;
             esac
             ;;
@@ -1,22 +1,37 @@
-import boto
-import arrow
-from prettytable import PrettyTable
+"""Formatting of the AWS objects for the terminal.
 
+arrow and prettytable are slow to import (prettytable loads pkg_resources):
+they are imported by the functions using them.
+"""
+from awstools.utils import connections
 from awstools.utils.cloudformation import (find_one_resource,
+                                           iter_stack_events,
                                            RES_TYPE_ASG,
                                            RES_TYPE_ELB)
 
 
 def humanize_date(date):
+    import arrow
+
     return arrow.get(date).humanize()
 
 
 def local_date(date):
+    import arrow
+
     if date is None:
         return '-'
     return arrow.get(date).to('local').format('YYYY-MM-DD HH:mm:ss')
 
 
+def make_table(fields, align='l'):
+    from prettytable import PrettyTable
+
+    tab = PrettyTable(fields)
+    tab.align = align
+    return tab
+
+
 def long_date(date):
     return "%s (%s)" % (local_date(date), humanize_date(date))
 
@@ -37,8 +52,7 @@ def format_stack_summary(stack):
 
 
 def format_stacks(stacks):
-    tab = PrettyTable(['Name', 'Template', 'Status', 'Creation'])
-    tab.align = 'l'
+    tab = make_table(['Name', 'Template', 'Status', 'Creation'])
 
     for s in stacks:
         tab.add_row([
@@ -51,21 +65,30 @@ def format_stacks(stacks):
     return tab.get_string()
 
 
-def format_stack_events(stack, limit=None):
-    if hasattr(stack, 'describe_events'):
-        events = stack.describe_events()
-    else:
-        cfn = boto.connect_cloudformation()
-        events = cfn.describe_stack_events(stack.stack_name)
+STACKS_STREAM_TMPL = "{0:<40} {1:<30} {2:<19} {3}"
+
+
+def format_stacks_stream(stacks):
+    """Yield the stacks as lines of a table, as soon as they arrive.
+
+    Unlike format_stacks, the columns have a fixed width so the first stacks
+    can be printed before the last ones are fetched.
+    """
+    yield STACKS_STREAM_TMPL.format('Name', 'Status', 'Creation', 'Template')
+
+    for s in stacks:
+        yield STACKS_STREAM_TMPL.format(
+            s.stack_name,
+            s.stack_status,
+            local_date(s.creation_time),
+            s.template_description,
+            )
 
-    cfn = boto.connect_cloudformation()
-    events = list(cfn.describe_stack_events(stack.stack_name))
 
-    if limit is None:
-        limit = len(events)
+def format_stack_events(stack, limit=None, since=None):
+    events = iter_stack_events(stack.stack_name, limit=limit, since=since)
 
-    tab = PrettyTable(['Time', 'Type', 'Logical ID', 'Status', 'Reason'])
-    tab.align = 'l'
+    tab = make_table(['Time', 'Type', 'Logical ID', 'Status', 'Reason'])
 
     for e in events:
         reason = e.resource_status_reason
@@ -78,18 +101,75 @@ def format_stack_events(stack, limit=None):
             reason if reason is not None else ''
             ])
 
-    return tab.get_string(end=limit)
+    return tab.get_string()
+
+
+EVENT_LINE_TMPL = "{0:<19} {1:<44} {2:<30} {3:<30} {4}"
+
+
+def format_stack_event_line(event):
+    """Format an event as a single line, for the events printed one by one."""
+    reason = event.resource_status_reason
+
+    return EVENT_LINE_TMPL.format(
+        local_date(event.timestamp),
+        event.resource_type,
+        event.logical_resource_id,
+        event.resource_status,
+        reason if reason is not None else '',
+        )
+
+
+def format_update_results(results):
+    """Format the (stack name, status, message) of a batch of updates."""
+    tab = make_table(['Name', 'Status', 'Message'])
+
+    for name, status, message in results:
+        tab.add_row([name, status, message])
+
+    return tab.get_string()
+
+
+def format_command_results(results):
+    """Format the (host name, exit status) of a command run on many hosts."""
+    tab = make_table(['Host', 'Exit status'])
+
+    for name, status in results:
+        tab.add_row([name, status])
+
+    return tab.get_string()
+
+
+def format_profile(rows):
+    """Format the statistics of the AWS API calls (see Profiler.summary)."""
+    tab = make_table(['Service', 'Operation', 'Calls', 'Pages', 'Retries',
+                      'KB', 'p50 (ms)', 'p95 (ms)', 'Total (s)'], align='r')
+    tab.align['Service'] = tab.align['Operation'] = 'l'
+
+    for r in rows:
+        tab.add_row([
+            r['service'],
+            r['operation'],
+            r['calls'],
+            r['pages'],
+            r['retries'],
+            r['bytes'] // 1024,
+            int(r['p50'] * 1000),
+            int(r['p95'] * 1000),
+            "%.2f" % r['total'],
+            ])
+
+    return tab.get_string()
 
 
 def format_stack_resources(stack):
     if hasattr(stack, 'describe_resources'):
         resources = stack.describe_resources()
     else:
-        cfn = boto.connect_cloudformation()
+        cfn = connections.cloudformation()
         resources = cfn.describe_stack_resources(stack.stack_name)
 
-    tab = PrettyTable(['Type', 'Status', 'Logical ID', 'Physical ID'])
-    tab.align = 'l'
+    tab = make_table(['Type', 'Status', 'Logical ID', 'Physical ID'])
     tab.sortby = 'Type'
 
     for r in resources:
@@ -110,8 +190,7 @@ def format_stack_resources(stack):
 
 
 def format_stack_outputs(stack):
-    tab = PrettyTable(['Key', 'Value', 'Description'])
-    tab.align = 'l'
+    tab = make_table(['Key', 'Value', 'Description'])
     tab.sortby = 'Key'
 
     for o in stack.outputs:
@@ -121,8 +200,7 @@ def format_stack_outputs(stack):
 
 
 def format_stack_parameters(stack):
-    tab = PrettyTable(['Key', 'Value'])
-    tab.align = 'l'
+    tab = make_table(['Key', 'Value'])
     tab.sortby = 'Key'
 
     for p in stack.parameters:
@@ -146,13 +224,20 @@ def format_autoscale(asg, detail=False):
 
 
 def format_autoscale_instances(stack):
+    res_asg = find_one_resource(stack, RES_TYPE_ASG)
+
+    res_elb_id = find_one_resource(stack, RES_TYPE_ELB, only_id=True)
+    ihealth = connections.elb().describe_instance_health(res_elb_id)
+
+    return format_instances_health(res_asg, ihealth)
+
+
+def format_instances_health(asg, ihealth):
     s = []
 
     tmpl = "  ASG: {id} {health}/{state} LC:{lc}"
 
-    res_asg = find_one_resource(stack, RES_TYPE_ASG)
-
-    for i in res_asg.instances:
+    for i in asg.instances:
         s.append(tmpl.format(id=i.instance_id,
                              state=i.lifecycle_state,
                              health=i.health_status,
@@ -160,9 +245,6 @@ def format_autoscale_instances(stack):
 
     tmpl = "  ELB: {i.instance_id} {i.state} ({i.reason_code})"
 
-    res_elb_id = find_one_resource(stack, RES_TYPE_ELB, only_id=True)
-    ihealth = boto.connect_elb().describe_instance_health(res_elb_id)
-
     for i in ihealth:
         s.append(tmpl.format(i=i))
 
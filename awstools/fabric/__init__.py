@@ -1,4 +1,18 @@
-import boto
+"""Fabric roles made of the EC2 instances.
+
+    from fabric.api import env
+    from awstools.fabric import lazy_roledefs
+
+    env.roledefs = lazy_roledefs(tags={'Environment': 'production'})
+
+Each role template of the configuration ([fabric] roletemplates, one per
+line) is formatted with the tags of the instances: an instance is in the
+roles `template % tags` and `template % tags:availability-zone`. The
+instances come from the inventory of ec2ssh ([cache] instances_ttl and
+[ec2ssh] regions), requested again once expired, and can be narrowed to
+some tags.
+"""
+import re
 
 import awstools
 
@@ -8,30 +22,117 @@ DEFAULTTEMPLATES = u"""
     %(aws:cloudformation:stack-name)s
 """
 
+RE_TEMPLATE_KEY = re.compile(r'%\(([^)]*)\)')
 
-def populate_roledefs():
-    roledefs = {}
 
-    config = awstools.read_config()
-    cfg_roletmpl = unicode(config.get("fabric", "roletemplates",
-                           DEFAULTTEMPLATES))
-    roletemplates = [t.strip() for t in cfg_roletmpl.split('\n') if t.strip()]
+class RoleTemplate(object):
+
+    """A role template, with the tags it needs."""
 
-    filters = {u'instance-state-name': u'running'}
-    reservations = boto.connect_ec2().get_all_instances(filters=filters)
-    instances = [i for r in reservations for i in r.instances]
+    def __init__(self, template):
+        self.template = template
+        self.keys = RE_TEMPLATE_KEY.findall(template)
+        # Raise the format errors now, not once per instance
+        template % dict.fromkeys(self.keys, u'')
+
+    def format(self, tags):
+        """Return the role of the tags, None if a tag is missing."""
+        for key in self.keys:
+            if key not in tags:
+                return None
+        return self.template % tags
+
+
+def get_role_templates(config):
+    if config.has_option("fabric", "roletemplates"):
+        # Raw: the templates are %(tag)s formats, not interpolations
+        roletemplates = config.get("fabric", "roletemplates", raw=True)
+    else:
+        roletemplates = DEFAULTTEMPLATES
+    return [RoleTemplate(unicode(t.strip()))
+            for t in roletemplates.split('\n') if t.strip()]
+
+
+def populate_roledefs(tags=None):
+    """Return the roledefs of the running instances (with the tags)."""
+    from awstools.commands import configure_inventory
+    from awstools.utils.inventory import inventory
+
+    config = awstools.read_config()
+    roletemplates = get_role_templates(config)
 
-    def add_instance(role, instance):
-        roledefs.setdefault(role,
-                            set()).add(instance.public_dns_name)
-        roledefs.setdefault(u':'.join([role, instance.placement]),
-                            set()).add(instance.public_dns_name)
+    configure_inventory(config)
+    # Never an expired inventory: fab would use terminated instances
+    instances = inventory.find_tagged_instances(tags or {}, stale=False)
 
+    roledefs = {}
     for instance in instances:
-        for templates in roletemplates:
-            try:
-                add_instance(templates % instance.tags, instance)
-            except:
-                pass
+        for template in roletemplates:
+            role = template.format(instance.tags)
+            if role is None:
+                continue
+            roledefs.setdefault(role, set()).add(instance.public_dns_name)
+            roledefs.setdefault(u':'.join([role, instance.placement]),
+                                set()).add(instance.public_dns_name)
 
     return dict([(k, list(v)) for k, v in roledefs.items()])
+
+
+def _resolving(name):
+    method = getattr(dict, name)
+
+    def call(self, *args, **kwargs):
+        self.resolve()
+        return method(self, *args, **kwargs)
+    call.__name__ = name
+    return call
+
+
+class LazyRoledefs(dict):
+
+    """The roledefs, populated on the first access to a role.
+
+    A fabfile can set them at import: nothing is requested for the tasks
+    using no role.
+    """
+
+    def __init__(self, tags=None):
+        super(LazyRoledefs, self).__init__()
+        self.tags = tags
+        self.resolved = False
+
+    def resolve(self):
+        if not self.resolved:
+            self.resolved = True
+            dict.update(self, populate_roledefs(self.tags))
+
+    __getitem__ = _resolving('__getitem__')
+    __setitem__ = _resolving('__setitem__')
+    __delitem__ = _resolving('__delitem__')
+    __contains__ = _resolving('__contains__')
+    __iter__ = _resolving('__iter__')
+    __len__ = _resolving('__len__')
+    __repr__ = _resolving('__repr__')
+    __eq__ = _resolving('__eq__')
+    __ne__ = _resolving('__ne__')
+    get = _resolving('get')
+    has_key = _resolving('has_key')
+    keys = _resolving('keys')
+    values = _resolving('values')
+    items = _resolving('items')
+    iterkeys = _resolving('iterkeys')
+    itervalues = _resolving('itervalues')
+    iteritems = _resolving('iteritems')
+    copy = _resolving('copy')
+    update = _resolving('update')
+    setdefault = _resolving('setdefault')
+    pop = _resolving('pop')
+    popitem = _resolving('popitem')
+
+
+def lazy_roledefs(tags=None):
+    """Return the roledefs of the running instances (with the tags), lazily.
+
+    They are only populated when a role is used.
+    """
+    return LazyRoledefs(tags)
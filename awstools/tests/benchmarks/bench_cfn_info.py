@@ -0,0 +1,55 @@
+"""Latency of `cfn info` depending on the number of stacks in the account.
+
+    python -m awstools.tests.benchmarks.bench_cfn_info [latency_ms]
+
+Each API call of the fake account sleeps for `latency_ms` (default 20).
+"before" disables the exact name lookup of find_one_stack (list every stack,
+then describe the match), "after" is the current behavior.
+"""
+import re
+import StringIO
+import sys
+import time
+
+import argh
+import mock
+
+from awstools.commands import cloudformation as cfn_commands
+from awstools.tests.benchmarks.fake_aws import FakeAccount
+from awstools.utils import cloudformation
+
+
+STACK_COUNTS = [100, 1000, 5000, 20000]
+
+
+def run_info(count, latency, fast):
+    account = FakeAccount(stacks=count, instances=0, latency=latency)
+    target = account.stack_name(count - 1)  # the worst case: on the last page
+    output = StringIO.StringIO()
+
+    re_stack_name = cloudformation.RE_STACK_NAME if fast else re.compile('$^')
+
+    with account.installed(), \
+            mock.patch.object(cloudformation, 'RE_STACK_NAME', re_stack_name):
+        start = time.time()
+        argh.dispatch_command(cfn_commands.info, argv=[target],
+                              output_file=output, completion=False)
+        elapsed = time.time() - start
+
+    assert target in output.getvalue()
+    return account.call_count, elapsed
+
+
+def main(latency_ms=20):
+    latency = float(latency_ms) / 1000
+    print("API latency: %sms" % latency_ms)
+    print("%8s %14s %12s %14s %12s" % ('stacks', 'before calls', 'before (s)',
+                                       'after calls', 'after (s)'))
+    for count in STACK_COUNTS:
+        before = run_info(count, latency, fast=False)
+        after = run_info(count, latency, fast=True)
+        print("%8s %14s %12.3f %14s %12.3f" % ((count,) + before + after))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,133 @@
+"""Time the commands end to end against fake accounts of growing size.
+
+    python -m awstools.tests.benchmarks.bench_commands [latency_ms]
+
+Each API call of the fake account sleeps for `latency_ms` (default 0, to
+measure the client side only). For each account and scenario, the elapsed
+time and the API calls are reported: a change in the number of calls is a
+regression (or an improvement) whatever the latency.
+"""
+import StringIO
+import sys
+import time
+
+import argh
+
+from awstools.commands import cloudformation, cfnautoscale, ec2ssh
+from awstools.tests.benchmarks.fake_aws import FakeAccount
+from awstools.utils import ec2
+from awstools.utils.inventory import inventory
+
+
+# (stacks, instances)
+ACCOUNTS = [(1000, 10000), (10000, 20000), (50000, 20000)]
+
+# The EC2 instances are spread over these regions
+REGIONS = ['us-east-1', 'us-west-2', 'eu-west-1', 'ap-southeast-1',
+           'sa-east-1']
+
+# Matches the first 100 stacks of an account
+STATUS_PATTERN = 'bm000'
+
+SPECIFIERS = ['bm00042-web-production', 'bm001*', 'i-0000002a', '10.0.1.2',
+              'ip-10-0-2-3']
+
+# Without names: filtered by EC2
+ADDRESS_SPECIFIERS = ['i-0000002a', '10.0.1.2', 'ip-10-0-2-3']
+
+# Like a long comma-separated list given to ec2ssh
+MANY_SPECIFIERS = (['bm%05d-web-production' % i for i in range(0, 1000, 25)] +
+                   ['i-%08x' % i for i in range(0, 1000, 100)])
+
+
+def dispatch(command, argv):
+    output = StringIO.StringIO()
+    argh.dispatch_command(command, argv=argv, output_file=output,
+                          completion=False)
+    return output.getvalue()
+
+
+def cfn_list(account):
+    return dispatch(cloudformation.ls, [])
+
+
+def cfn_info(account):
+    # The worst case: on the last page of the listing
+    return dispatch(cloudformation.info,
+                    [account.stack_name(account.stack_count - 1)])
+
+
+def cfnas_status(account):
+    return dispatch(cfnautoscale.status, [STATUS_PATTERN])
+
+
+def ec2ssh_list(account):
+    inventory.configure(regions=account.regions)
+    try:
+        return dispatch(ec2ssh.connect, ['--list'])
+    finally:
+        inventory.configure()
+
+
+def filter_instances(account):
+    return ec2.filter_instances(SPECIFIERS, account.instances)
+
+
+def filter_instances_many(account):
+    return ec2.filter_instances(MANY_SPECIFIERS, account.instances)
+
+
+def find_instances(account):
+    # ec2ssh without inventory: a name needs all the instances
+    return ec2.find_instances(SPECIFIERS)
+
+
+def find_instances_addresses(account):
+    # ec2ssh without inventory: filtered by EC2
+    return ec2.find_instances(ADDRESS_SPECIFIERS)
+
+
+SCENARIOS = [
+    ('cfn list', cfn_list),
+    ('cfn info', cfn_info),
+    ('cfnas status', cfnas_status),
+    ('ec2ssh -l', ec2ssh_list),
+    ('filter_instances', filter_instances),
+    ('filter_instances 50', filter_instances_many),
+    ('find_instances', find_instances),
+    ('find_instances addresses', find_instances_addresses),
+]
+
+
+def run(account, scenario):
+    """Run a scenario, return its elapsed time and its API calls."""
+    account.reset_calls()
+    with account.installed():
+        start = time.time()
+        scenario(account)
+        elapsed = time.time() - start
+    return elapsed, dict(account.calls)
+
+
+def format_calls(calls):
+    return ' '.join('%s:%s' % (op, count)
+                    for op, count in sorted(calls.items()))
+
+
+def main(latency_ms=0):
+    latency = float(latency_ms) / 1000
+    print("API latency: %sms" % latency_ms)
+    print("%-20s %7s %9s %10s %7s  %s" % (
+        'scenario', 'stacks', 'instances', 'time (s)', 'calls', 'detail'))
+    for stacks, instances in ACCOUNTS:
+        account = FakeAccount(stacks=stacks, instances=instances,
+                              latency=latency, regions=REGIONS)
+        for name, scenario in SCENARIOS:
+            elapsed, calls = run(account, scenario)
+            print("%-20s %7s %9s %10.3f %7s  %s" % (
+                name, stacks, instances, elapsed, sum(calls.values()),
+                format_calls(calls)))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,129 @@
+"""Time the applications settings: loading and resolving the stack names.
+
+    python -m awstools.tests.benchmarks.bench_settings [applications]
+
+A settings file of `applications` documents (default 400) is generated:
+each application has a model, 3 environments and 4 pools, one of them split
+by identifiers. It is loaded with the pure Python yaml parser, with libyaml
+(if available) and from the settings cache. Every stack name of the
+settings is then resolved.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import mock
+import yaml
+
+from awstools import application
+from awstools.application import Applications, load_applications
+
+
+ENVIRONMENTS = ['development', 'stage', 'production']
+
+MODEL = """
+Application: model
+ShortName: mo
+KeyName: key-model
+live: false
+environments:
+%s
+"""
+
+APPLICATION = """
+Application: app%(index)05d
+ShortName: a%(index)05d
+model: model
+live: %(live)s
+environments:
+%(environments)s
+"""
+
+POOLS = """\
+    %(environment)s:
+        python:
+            InstanceType: c1.medium
+            WebServerCapacity: 3
+        java: True
+        worker:
+            template: worker.js
+        node:
+            ident: default
+        node[1]:
+            ident: node1
+        node[2, 3, 4]:
+            ident: node234
+"""
+
+
+def make_settings(count):
+    environments = ''.join(POOLS % {'environment': e} for e in ENVIRONMENTS)
+    documents = [MODEL % environments]
+    documents.extend(APPLICATION % {'index': i,
+                                    'live': 'true' if i % 2 else 'false',
+                                    'environments': environments}
+                     for i in range(count))
+    return '---\n'.join(documents)
+
+
+def get_stack_names(count):
+    return ['a%05d-%s-%s%s' % (i, pool, environment, identifier)
+            for i in range(count)
+            for environment in ENVIRONMENTS
+            for pool, identifier in [('python', ''), ('java', ''),
+                                     ('worker', ''), ('node', ''),
+                                     ('node', '-1'), ('node', '-3')]]
+
+
+def find_applications(apps, stack_names):
+    return [apps.get(stackname=stack_name) for stack_name in stack_names]
+
+
+def get_stack_infos(applications, stack_names):
+    return [app.get_stack_info_from_stackname(stack_name)
+            for app, stack_name in zip(applications, stack_names)]
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def main(count=400):
+    count = int(count)
+    settings = make_settings(count)
+    stack_names = get_stack_names(count)
+
+    with mock.patch.object(yaml, 'CLoader', yaml.Loader, create=True):
+        apps, load_python = timed(Applications, settings)
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'settings.yaml')
+        with open(path, 'w') as fp:
+            fp.write(settings)
+        apps, load = timed(load_applications, path, directory)
+        # As in a new process
+        application._loaded.clear()
+        apps, load_cached = timed(load_applications, path, directory)
+    finally:
+        shutil.rmtree(directory)
+
+    applications, find = timed(find_applications, apps, stack_names)
+    stack_infos, resolve = timed(get_stack_infos, applications, stack_names)
+    all_stacks, expand = timed(list, apps.expand_all())
+
+    print("applications: %s, stacks: %s" % (count, len(stack_names)))
+    print("load settings (python yaml): %8.3fs" % load_python)
+    print("load settings:               %8.3fs" % load)
+    print("load settings (cached):      %8.3fs" % load_cached)
+    print("find applications:           %8.3fs" % find)
+    print("get stack infos:             %8.3fs" % resolve)
+    print("expand all (%s stacks):   %8.3fs" % (len(all_stacks), expand))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
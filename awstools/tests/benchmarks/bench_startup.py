@@ -0,0 +1,68 @@
+"""Start time of the commands, without any AWS call.
+
+    python -m awstools.tests.benchmarks.bench_startup [runs]
+
+Each command line is run `runs` times (default 10) in a new interpreter.
+The overhead is the median time minus the one of an empty interpreter; the
+benchmark exits with an error status if an overhead is over its budget.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# (name, python code, overhead budget in ms)
+COMMANDS = [
+    ('ec2ssh --completion-list',
+     "import sys; sys.argv = ['ec2ssh', '--completion-list']\n"
+     "from awstools import cli; cli.ec2ssh()", 30),
+    ('ec2ssh --help',
+     "import sys; sys.argv = ['ec2ssh', '--help']\n"
+     "from awstools import cli; cli.ec2ssh()", 100),
+    ('cfn --help',
+     "import sys; sys.argv = ['cfn', '--help']\n"
+     "from awstools import cli; cli.cfn()", 250),
+    ('cfnas --help',
+     "import sys; sys.argv = ['cfnas', '--help']\n"
+     "from awstools import cli; cli.cfnas()", 250),
+]
+
+
+def median_time(code, runs, env):
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for i in range(runs):
+            start = time.time()
+            subprocess.call([sys.executable, '-c', code], env=env,
+                            stdout=devnull, stderr=devnull)
+            times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main(runs=10):
+    runs = int(runs)
+    home = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, HOME=home)
+        baseline = median_time('pass', runs, env)
+        print("python startup: %.0fms" % (baseline * 1000))
+        print("%-26s %14s %12s" % ('command', 'overhead (ms)', 'budget (ms)'))
+
+        over_budget = []
+        for name, code, budget in COMMANDS:
+            overhead = (median_time(code, runs, env) - baseline) * 1000
+            print("%-26s %14.0f %12s" % (name, overhead, budget))
+            if overhead > budget:
+                over_budget.append(name)
+    finally:
+        shutil.rmtree(home)
+
+    if over_budget:
+        sys.exit("Over budget: %s" % ', '.join(over_budget))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,351 @@
+"""In-memory stand-ins of the AWS services, for the benchmarks.
+
+A FakeAccount generates a synthetic account: N stacks (bm00000-web-production,
+bm00001-web-production...), each with an AutoScale group, an ELB and a long
+history of events, and M running instances spread over the stacks (and over
+the regions of the account, for EC2).
+The stacks and events are generated page by page, so an account of 50k
+stacks costs nothing until listed.
+
+Every API call is counted (account.calls) and can be slowed down by a fixed
+latency, to stand for the network round trip.
+
+    account = FakeAccount(stacks=1000, instances=10000, latency=0.02)
+    with account.installed():
+        ...  # the awstools helpers and commands talk to the fake account
+"""
+import collections
+import contextlib
+import datetime
+import threading
+import time
+from fnmatch import fnmatch
+
+import mock
+from boto.cloudformation.stack import (Stack, StackSummary, StackEvent,
+                                       StackResource)
+from boto.ec2.autoscale.group import AutoScalingGroup
+from boto.ec2.autoscale.instance import Instance as ASGInstance
+from boto.ec2.elb.instancestate import InstanceState as ELBInstanceState
+from boto.ec2.elb.loadbalancer import LoadBalancer
+from boto.ec2.instance import Instance, InstanceState, Reservation
+from boto.exception import BotoServerError
+from boto.regioninfo import RegionInfo
+
+
+STACK_PAGE_SIZE = 100
+EVENT_PAGE_SIZE = 100
+RESERVATION_SIZE = 10
+
+CREATION_TIME = datetime.datetime(2013, 1, 1)
+
+NOT_FOUND = """<ErrorResponse><Error><Code>ValidationError</Code>
+<Message>Stack with id %s does not exist</Message></Error></ErrorResponse>"""
+
+
+class Page(list):
+
+    """A result page, with the token of the next one (None if last)."""
+
+    def __init__(self, data, next_token=None):
+        super(Page, self).__init__(data)
+        self.next_token = self.next_marker = next_token
+
+
+class FakeAccount(object):
+
+    def __init__(self, stacks=1000, instances=10000, events=200, latency=0,
+                 regions=('us-east-1',)):
+        self.stack_count = stacks
+        self.instance_count = instances
+        self.event_count = events
+        self.latency = latency
+        self.regions = list(regions)
+
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+
+        self.connections = {
+            'cloudformation': FakeCloudFormation(self),
+            'autoscale': FakeAutoScale(self),
+            'elb': FakeELB(self),
+        }
+        self.ec2 = dict((region, FakeEC2(self, region))
+                        for region in self.regions)
+        self.instances = [self._make_instance(i) for i in range(instances)]
+
+    def call(self, operation):
+        """Count an API call and wait for its latency."""
+        with self._lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def call_count(self):
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    @contextlib.contextmanager
+    def installed(self):
+        """Make the connections registry return the fake services."""
+        def get_connection(service, region=None):
+            if service == 'ec2':
+                return self.ec2[region or self.regions[0]]
+            return self.connections[service]
+
+        with mock.patch('awstools.utils.connections.get_connection',
+                        side_effect=get_connection):
+            yield self
+
+    # Synthetic data
+
+    def stack_name(self, index):
+        return 'bm%05d-web-production' % index
+
+    def stack_index(self, name_or_id):
+        """Return the index of a stack from its name or id, None if unknown."""
+        name = name_or_id.split('/')[1] if '/' in name_or_id else name_or_id
+        try:
+            index = int(name[2:7])
+        except ValueError:
+            return None
+        if not 0 <= index < self.stack_count or \
+                name != self.stack_name(index):
+            return None
+        return index
+
+    def stack_id(self, index):
+        return ('arn:aws:cloudformation:us-east-1:123456789012:stack/%s/%s' %
+                (self.stack_name(index), index))
+
+    def stack_instances(self, index):
+        """Return the instances of a stack: every stack_count-th instance."""
+        return self.instances[index::self.stack_count]
+
+    def _make_instance(self, index):
+        ec2 = self.ec2[self.regions[index % len(self.regions)]]
+        instance = Instance(ec2)
+        instance.id = 'i-%08x' % index
+        address = (index // 65536 % 256, index // 256 % 256, index % 256)
+        instance.private_ip_address = '10.%s.%s.%s' % address
+        instance.private_dns_name = 'ip-10-%s-%s-%s.ec2.internal' % address
+        instance.public_dns_name = 'ec2-54-%s-%s-%s.compute-1.amazonaws.com' \
+            % address
+        instance._state = InstanceState(16, 'running')
+        if self.stack_count:
+            name = self.stack_name(index % self.stack_count)
+        else:
+            name = 'bm-host%05d' % index
+        instance.tags = {'Name': name}
+        ec2.instances.append(instance)
+        return instance
+
+
+class FakeService(object):
+
+    def __init__(self, account):
+        self.account = account
+
+
+class FakeCloudFormation(FakeService):
+
+    def _make_summary(self, index):
+        summary = StackSummary(self)
+        summary.stack_id = self.account.stack_id(index)
+        summary.stack_name = self.account.stack_name(index)
+        summary.stack_status = 'UPDATE_COMPLETE'
+        summary.creation_time = CREATION_TIME
+        summary.template_description = 'Benchmark stack'
+        return summary
+
+    def _find(self, stack_name_or_id):
+        index = self.account.stack_index(stack_name_or_id)
+        if index is None:
+            raise BotoServerError(400, 'Bad Request',
+                                  NOT_FOUND % stack_name_or_id)
+        return index
+
+    def list_stacks(self, stack_status_filters=None, next_token=None):
+        self.account.call('ListStacks')
+        if stack_status_filters and \
+                'UPDATE_COMPLETE' not in stack_status_filters:
+            return Page([])
+
+        start = int(next_token or 0)
+        end = min(start + STACK_PAGE_SIZE, self.account.stack_count)
+        page = [self._make_summary(i) for i in range(start, end)]
+        return Page(page, str(end) if end < self.account.stack_count else None)
+
+    def describe_stacks(self, stack_name_or_id=None, next_token=None):
+        self.account.call('DescribeStacks')
+        index = self._find(stack_name_or_id)
+
+        stack = Stack(self)
+        stack.stack_id = self.account.stack_id(index)
+        stack.stack_name = self.account.stack_name(index)
+        stack.stack_status = 'UPDATE_COMPLETE'
+        stack.creation_time = CREATION_TIME
+        stack.description = 'Benchmark stack'
+        return [stack]
+
+    def describe_stack_events(self, stack_name_or_id=None, next_token=None):
+        self.account.call('DescribeStackEvents')
+        index = self._find(stack_name_or_id)
+
+        count = self.account.event_count
+        start = int(next_token or 0)
+        end = min(start + EVENT_PAGE_SIZE, count)
+        page = [self._make_event(index, n, count) for n in range(start, end)]
+        return Page(page, str(end) if end < count else None)
+
+    def _make_event(self, index, n, count):
+        """Return the n-th newest event of a stack of `count` events."""
+        event = StackEvent(self)
+        event.stack_id = self.account.stack_id(index)
+        event.stack_name = self.account.stack_name(index)
+        event.event_id = '%s-%s' % (index, count - n)
+        event.timestamp = CREATION_TIME + datetime.timedelta(minutes=count - n)
+        if n == 0 or n == count - 1:
+            event.resource_type = 'AWS::CloudFormation::Stack'
+            event.logical_resource_id = event.stack_name
+            event.resource_status = ('UPDATE_COMPLETE' if n == 0
+                                     else 'CREATE_IN_PROGRESS')
+        else:
+            event.resource_type = 'AWS::EC2::SecurityGroup'
+            event.logical_resource_id = 'SecurityGroup'
+            event.resource_status = 'UPDATE_COMPLETE'
+        event.resource_status_reason = None
+        return event
+
+    def describe_stack_resources(self, stack_name_or_id=None,
+                                 logical_resource_id=None,
+                                 physical_resource_id=None):
+        self.account.call('DescribeStackResources')
+        index = self._find(stack_name_or_id)
+        name = self.account.stack_name(index)
+
+        resources = []
+        for resource_type, logical_id, physical_id in [
+                ('AWS::AutoScaling::AutoScalingGroup', 'AutoScale',
+                 name + '-asg'),
+                ('AWS::ElasticLoadBalancing::LoadBalancer', 'ELB',
+                 'bm%05d-elb' % index),
+                ('AWS::AutoScaling::LaunchConfiguration', 'LaunchConfig',
+                 name + '-lc'),
+                ('AWS::EC2::SecurityGroup', 'SecurityGroup', name + '-sg')]:
+            resource = StackResource(self)
+            resource.stack_id = self.account.stack_id(index)
+            resource.stack_name = name
+            resource.resource_type = resource_type
+            resource.logical_resource_id = logical_id
+            resource.physical_resource_id = physical_id
+            resource.resource_status = 'UPDATE_COMPLETE'
+            resources.append(resource)
+        return resources
+
+
+class FakeAutoScale(FakeService):
+
+    def get_all_groups(self, names=None, max_records=None, next_token=None):
+        self.account.call('DescribeAutoScalingGroups')
+
+        groups = []
+        for name in names or []:
+            index = self.account.stack_index(name[:-len('-asg')])
+            if index is None:
+                continue
+            group = AutoScalingGroup(self, name=name, min_size=1, max_size=4,
+                                     desired_capacity=2)
+            group.instances = []
+            for instance in self.account.stack_instances(index):
+                asg_instance = ASGInstance(self)
+                asg_instance.instance_id = instance.id
+                asg_instance.lifecycle_state = 'InService'
+                asg_instance.health_status = 'Healthy'
+                asg_instance.launch_config_name = name[:-len('-asg')] + '-lc'
+                group.instances.append(asg_instance)
+            groups.append(group)
+        return Page(groups)
+
+
+class FakeELB(FakeService):
+
+    def _index(self, name):
+        try:
+            index = int(name[2:7])
+        except ValueError:
+            return None
+        if 0 <= index < self.account.stack_count and \
+                name == 'bm%05d-elb' % index:
+            return index
+        return None
+
+    def get_all_load_balancers(self, load_balancer_names=None, marker=None):
+        self.account.call('DescribeLoadBalancers')
+
+        elbs = []
+        for name in load_balancer_names or []:
+            if self._index(name) is not None:
+                elbs.append(LoadBalancer(self, name=name))
+        return Page(elbs)
+
+    def describe_instance_health(self, load_balancer_name, instances=None):
+        self.account.call('DescribeInstanceHealth')
+        index = self._index(load_balancer_name)
+        if index is None:
+            raise BotoServerError(400, 'Bad Request', 'LoadBalancerNotFound')
+
+        return [ELBInstanceState(instance_id=i.id, state='InService',
+                                 reason_code='N/A')
+                for i in self.account.stack_instances(index)]
+
+
+class FakeEC2(FakeService):
+
+    """The EC2 service of a region: only its share of the instances."""
+
+    def __init__(self, account, region):
+        super(FakeEC2, self).__init__(account)
+        self.region = RegionInfo(name=region)
+        self.instances = []
+
+    def get_all_instances(self, instance_ids=None, filters=None,
+                          dry_run=False, max_results=None):
+        self.account.call('DescribeInstances')
+
+        instances = self.instances
+        if instance_ids:
+            instance_ids = set(instance_ids)
+            instances = [i for i in instances if i.id in instance_ids]
+        for name, value in (filters or {}).items():
+            instances = [i for i in instances if match_filter(i, name, value)]
+
+        reservations = []
+        for start in range(0, len(instances), RESERVATION_SIZE):
+            reservation = Reservation(self)
+            reservation.instances = instances[start:start + RESERVATION_SIZE]
+            reservations.append(reservation)
+        return reservations
+
+
+def match_filter(instance, name, value):
+    """Match an instance against an EC2 filter (value or list of values)."""
+    values = value if isinstance(value, (list, tuple)) else [value]
+
+    if name == 'instance-state-name':
+        actual = instance.state
+    elif name == 'instance-id':
+        actual = instance.id
+    elif name == 'private-ip-address':
+        actual = instance.private_ip_address
+    elif name == 'private-dns-name':
+        actual = instance.private_dns_name
+    elif name.startswith('tag:'):
+        actual = instance.tags.get(name[len('tag:'):])
+    else:
+        raise ValueError("Unsupported filter: %s" % name)
+
+    return actual is not None and any(fnmatch(actual, v) for v in values)
@@ -0,0 +1,104 @@
+import unittest
+
+
+class TestBenchmarkScenarios(unittest.TestCase):
+
+    """Run the benchmark scenarios on a small fake account.
+
+    The number of API calls of each command is checked: a change is a
+    regression (or an improvement to record here).
+    """
+
+    def setUp(self):
+        from awstools.tests.benchmarks.fake_aws import FakeAccount
+
+        self.account = FakeAccount(stacks=250, instances=500, events=150)
+
+    def run_scenario(self, scenario):
+        from awstools.tests.benchmarks import bench_commands
+
+        return bench_commands.run(self.account, scenario)[1]
+
+    def test_cfn_list(self):
+        from awstools.tests.benchmarks import bench_commands
+
+        calls = self.run_scenario(bench_commands.cfn_list)
+
+        self.assertEqual(calls, {'ListStacks': 3})
+
+    def test_cfn_info(self):
+        from awstools.tests.benchmarks import bench_commands
+
+        calls = self.run_scenario(bench_commands.cfn_info)
+
+        self.assertEqual(calls, {'DescribeStacks': 1,
+                                 'DescribeStackEvents': 1,
+                                 'DescribeStackResources': 1})
+
+    def test_cfnas_status(self):
+        from awstools.tests.benchmarks import bench_commands
+
+        calls = self.run_scenario(bench_commands.cfnas_status)
+
+        self.assertEqual(calls, {'ListStacks': 3,
+                                 'DescribeStackResources': 100,
+                                 'DescribeAutoScalingGroups': 2,
+                                 'DescribeInstanceHealth': 100})
+
+    def test_ec2ssh_list(self):
+        from awstools.tests.benchmarks import bench_commands
+
+        calls = self.run_scenario(bench_commands.ec2ssh_list)
+
+        self.assertEqual(calls, {'DescribeInstances': 1})
+
+    def test_ec2ssh_list_regions(self):
+        from awstools.tests.benchmarks import bench_commands
+        from awstools.tests.benchmarks.fake_aws import FakeAccount
+
+        account = FakeAccount(stacks=250, instances=500,
+                              regions=bench_commands.REGIONS)
+        with account.installed():
+            names = bench_commands.ec2ssh_list(account).split()
+
+        self.assertEqual(len(names), 500)
+        self.assertEqual(account.calls, {'DescribeInstances': 5})
+
+    def test_filter_instances(self):
+        from awstools.tests.benchmarks import bench_commands
+
+        instances = bench_commands.filter_instances(self.account)
+
+        # Stack n has the instances n and n + 250
+        expected = set([42, 292, 258]) | set(range(100, 200)) | \
+            set(range(350, 450))
+        self.assertEqual(sorted(i.id for i in instances),
+                         sorted('i-%08x' % i for i in expected))
+
+    def test_find_instances(self):
+        from awstools.tests.benchmarks import bench_commands
+
+        calls = self.run_scenario(bench_commands.find_instances)
+
+        self.assertEqual(calls, {'DescribeInstances': 1})
+
+        with self.account.installed():
+            found = bench_commands.find_instances(self.account)
+        filtered = bench_commands.filter_instances(self.account)
+        self.assertEqual(sorted(i.id for i in found),
+                         sorted(i.id for i in filtered))
+
+    def test_find_instances_addresses(self):
+        from awstools.tests.benchmarks import bench_commands
+        from awstools.utils import ec2
+
+        calls = self.run_scenario(bench_commands.find_instances_addresses)
+
+        self.assertEqual(calls, {'DescribeInstances': 3})
+
+        with self.account.installed():
+            found = bench_commands.find_instances_addresses(self.account)
+        filtered = ec2.filter_instances(bench_commands.ADDRESS_SPECIFIERS,
+                                        self.account.instances)
+        self.assertEqual(sorted(i.id for i in found),
+                         sorted(i.id for i in filtered))
@@ -1,9 +1,11 @@
+import datetime
 import time
 import unittest
 import StringIO
 
 import argh
 import boto
+import mock
 
 
 class TestCfn(unittest.TestCase):
@@ -67,3 +69,317 @@ class TestCfn(unittest.TestCase):
                               errors_file=self.stderr,
                               completion=False,
                               )
+
+
+class TestCfnEventsFollow(unittest.TestCase):
+
+    def setUp(self):
+        self.stdout = StringIO.StringIO()
+        self.stderr = StringIO.StringIO()
+
+        self.stack = mock.Mock(stack_name='tt-python-production',
+                               stack_id='stack-id',
+                               stack_status='UPDATE_IN_PROGRESS',
+                               creation_time=datetime.datetime.utcnow())
+
+    def make_event(self, event_id, status, stack=False):
+        return mock.Mock(event_id=event_id,
+                         timestamp=datetime.datetime.utcnow(),
+                         stack_id='stack-id',
+                         stack_name='tt-python-production',
+                         resource_type=('AWS::CloudFormation::Stack' if stack
+                                        else 'AWS::EC2::Instance'),
+                         logical_resource_id='logical-%s' % event_id,
+                         physical_resource_id=('stack-id' if stack
+                                               else 'physical-%s' % event_id),
+                         resource_status=status,
+                         resource_status_reason=None)
+
+    def dispatch(self, *args):
+        from awstools.commands import cloudformation
+
+        argh.dispatch_command(cloudformation.events,
+                              argv=['--follow', 'tt-python-production'] +
+                              list(args),
+                              output_file=self.stdout,
+                              errors_file=self.stderr,
+                              completion=False,
+                              )
+
+    @mock.patch('awstools.commands.cloudformation.follow_stack_events')
+    @mock.patch('awstools.commands.cloudformation.iter_stack_events')
+    @mock.patch('awstools.commands.cloudformation.find_one_stack')
+    def test_follow_success(self, m_find_one_s, m_iter, m_follow):
+        m_find_one_s.return_value = self.stack
+        m_iter.return_value = [self.make_event('e1', 'UPDATE_IN_PROGRESS')]
+        m_follow.return_value = [
+            self.make_event('e2', 'UPDATE_COMPLETE', stack=True)]
+
+        self.dispatch()
+
+        m_follow.assert_called_once_with('stack-id', 'e1')
+        self.assertIn('logical-e2', self.stdout.getvalue())
+        self.assertIn('Stack status: UPDATE_COMPLETE', self.stdout.getvalue())
+
+    @mock.patch('awstools.commands.cloudformation.follow_stack_events')
+    @mock.patch('awstools.commands.cloudformation.iter_stack_events')
+    @mock.patch('awstools.commands.cloudformation.find_one_stack')
+    def test_follow_failure(self, m_find_one_s, m_iter, m_follow):
+        m_find_one_s.return_value = self.stack
+        m_iter.return_value = []
+        m_follow.return_value = [
+            self.make_event('e2', 'UPDATE_ROLLBACK_COMPLETE', stack=True)]
+
+        with self.assertRaises(SystemExit) as context:
+            self.dispatch()
+
+        self.assertEqual(context.exception.code, 1)
+
+    @mock.patch('awstools.commands.cloudformation.follow_stack_events')
+    @mock.patch('awstools.commands.cloudformation.iter_stack_events')
+    @mock.patch('awstools.commands.cloudformation.find_one_stack')
+    def test_follow_already_stable(self, m_find_one_s, m_iter, m_follow):
+        m_find_one_s.return_value = self.stack
+        m_iter.return_value = [
+            self.make_event('e2', 'UPDATE_COMPLETE', stack=True)]
+
+        self.dispatch()
+
+        self.assertFalse(m_follow.called)
+
+    @mock.patch('awstools.commands.cloudformation.follow_stack_events')
+    @mock.patch('awstools.commands.cloudformation.iter_stack_events')
+    @mock.patch('awstools.commands.cloudformation.find_one_stack')
+    def test_follow_nothing_since(self, m_find_one_s, m_iter, m_follow):
+        m_find_one_s.return_value = self.stack
+        # Nothing since the date, then the newest event
+        m_iter.side_effect = [[],
+                              [self.make_event('e1', 'UPDATE_IN_PROGRESS')]]
+        m_follow.return_value = [
+            self.make_event('e2', 'UPDATE_COMPLETE', stack=True)]
+
+        self.dispatch('--since', '2100-01-01')
+
+        m_follow.assert_called_once_with('stack-id', 'e1')
+        self.assertNotIn('logical-e1', self.stdout.getvalue())
+
+
+class TestCfnWait(unittest.TestCase):
+
+    @mock.patch('awstools.commands.cloudformation.wait_for_stacks')
+    def test_wait_success(self, m_wait):
+        from awstools.commands import cloudformation
+
+        m_wait.return_value = [
+            mock.Mock(stack_name='stack1', stack_status='UPDATE_COMPLETE'),
+            mock.Mock(stack_name='stack2', stack_status='CREATE_COMPLETE')]
+
+        lines = list(cloudformation.wait_stacks(['id1', 'id2'], 60))
+
+        m_wait.assert_called_once_with(['id1', 'id2'], timeout=60)
+        self.assertIn('stack1: UPDATE_COMPLETE', lines)
+        self.assertIn('stack2: CREATE_COMPLETE', lines)
+
+    @mock.patch('awstools.commands.cloudformation.wait_for_stacks')
+    def test_wait_failure(self, m_wait):
+        from awstools.commands import cloudformation
+
+        m_wait.return_value = [
+            mock.Mock(stack_name='stack1', stack_status='UPDATE_COMPLETE'),
+            mock.Mock(stack_name='stack2',
+                      stack_status='UPDATE_ROLLBACK_COMPLETE')]
+
+        with self.assertRaises(SystemExit) as context:
+            list(cloudformation.wait_stacks(['id1', 'id2'], 60))
+
+        self.assertIn('stack2', str(context.exception.code))
+
+    @mock.patch('awstools.commands.cloudformation.wait_for_stacks')
+    def test_wait_timeout(self, m_wait):
+        from awstools.commands import cloudformation
+        from awstools.utils.backoff import WaitTimeout
+
+        m_wait.side_effect = WaitTimeout
+
+        with self.assertRaises(SystemExit) as context:
+            list(cloudformation.wait_stacks(['id1'], 60))
+
+        self.assertIn('Timeout', str(context.exception.code))
+
+
+class TestCfnBatchUpdate(unittest.TestCase):
+
+    def setUp(self):
+        self.stdout = StringIO.StringIO()
+        self.stderr = StringIO.StringIO()
+
+        self.stacks = []
+        for name in ['stack3', 'stack1', 'stack2']:
+            stack = mock.Mock(stack_name=name, stack_status='UPDATE_COMPLETE',
+                              creation_time=datetime.datetime.utcnow())
+            self.stacks.append(stack)
+
+    def dispatch(self, *argv):
+        from awstools.commands import cloudformation
+
+        argh.dispatch_command(cloudformation.batch_update,
+                              argv=['--force', 'stack'] + list(argv),
+                              output_file=self.stdout,
+                              errors_file=self.stderr,
+                              completion=False,
+                              )
+
+    def sinfo(self, live=False):
+        return {'live': live, 'Environment': 'production'}
+
+    @mock.patch('awstools.commands.cloudformation.confirm')
+    @mock.patch('awstools.utils.connections.cloudformation')
+    @mock.patch('awstools.commands.cloudformation.read_stack_update')
+    @mock.patch('awstools.commands.cloudformation.find_stacks')
+    def test_parallel(self, m_find, m_read, m_cfn, m_confirm):
+        m_find.return_value = self.stacks
+        m_read.return_value = (self.sinfo(), mock.Mock(), [])
+        m_cfn.return_value.update_stack.side_effect = lambda name, **kw: (
+            'id-%s' % name)
+
+        self.dispatch('--jobs', '3')
+
+        self.assertEqual(m_cfn.return_value.update_stack.call_count, 3)
+        self.assertFalse(m_confirm.called)
+        output = self.stdout.getvalue()
+        self.assertIn('stack1: UPDATE_STARTED id-stack1', output)
+        self.assertLess(output.index('stack1: UPDATE_STARTED'),
+                        output.index('stack3: UPDATE_STARTED'))
+
+    @mock.patch('awstools.commands.cloudformation.wait_for_stacks')
+    @mock.patch('awstools.utils.connections.cloudformation')
+    @mock.patch('awstools.commands.cloudformation.read_stack_update')
+    @mock.patch('awstools.commands.cloudformation.find_stacks')
+    def test_max_failures(self, m_find, m_read, m_cfn, m_wait):
+        from boto.exception import BotoServerError
+
+        m_find.return_value = self.stacks
+        m_read.return_value = (self.sinfo(), mock.Mock(), [])
+        error = BotoServerError(400, 'Bad Request')
+        error.error_message = 'Template error'
+        m_cfn.return_value.update_stack.side_effect = [
+            'id-stack1', error, 'id-stack3']
+        m_wait.return_value = [mock.Mock(stack_id='id-stack1',
+                                         stack_status='UPDATE_COMPLETE',
+                                         stack_status_reason=None)]
+
+        with self.assertRaises(SystemExit) as context:
+            self.dispatch('--wait', '--max-failures', '1')
+
+        self.assertIn('stack2', str(context.exception.code))
+        self.assertEqual(m_cfn.return_value.update_stack.call_count, 2)
+        m_wait.assert_called_once_with(['id-stack1'], timeout=mock.ANY)
+        self.assertAlmostEqual(m_wait.call_args[1]['timeout'], 3600, delta=5)
+        output = self.stdout.getvalue()
+        self.assertIn('stack1: UPDATE_COMPLETE', output)
+        self.assertIn('stack2: ERROR Template error', output)
+        self.assertIn('stack3: SKIPPED', output)
+
+    def make_waiter(self, calls):
+        """Return a wait_for_stacks recording the ids waited for.
+
+        It yields the stacks in the order of their id.
+        """
+        def wait_for_stacks(stack_ids, timeout):
+            calls.append(stack_ids)
+            for stack_id in stack_ids:
+                yield mock.Mock(stack_id=stack_id,
+                                stack_status='UPDATE_COMPLETE',
+                                stack_status_reason=None)
+        return wait_for_stacks
+
+    @mock.patch('awstools.commands.cloudformation.wait_for_stacks')
+    @mock.patch('awstools.utils.connections.cloudformation')
+    @mock.patch('awstools.commands.cloudformation.read_stack_update')
+    @mock.patch('awstools.commands.cloudformation.find_stacks')
+    def test_wait_together(self, m_find, m_read, m_cfn, m_wait):
+        m_find.return_value = self.stacks
+        m_read.return_value = (self.sinfo(), mock.Mock(), [])
+        m_cfn.return_value.update_stack.side_effect = lambda name, **kw: (
+            'id-%s' % name)
+        calls = []
+        m_wait.side_effect = self.make_waiter(calls)
+
+        self.dispatch('--wait', '--jobs', '3')
+
+        self.assertEqual(calls, [['id-stack1', 'id-stack2', 'id-stack3']])
+        self.assertIn('stack3: UPDATE_COMPLETE', self.stdout.getvalue())
+
+    @mock.patch('awstools.commands.cloudformation.wait_for_stacks')
+    @mock.patch('awstools.utils.connections.cloudformation')
+    @mock.patch('awstools.commands.cloudformation.read_stack_update')
+    @mock.patch('awstools.commands.cloudformation.find_stacks')
+    def test_wait_rolling(self, m_find, m_read, m_cfn, m_wait):
+        m_find.return_value = self.stacks
+        m_read.return_value = (self.sinfo(), mock.Mock(), [])
+        m_cfn.return_value.update_stack.side_effect = lambda name, **kw: (
+            'id-%s' % name)
+        calls = []
+        m_wait.side_effect = self.make_waiter(calls)
+
+        self.dispatch('--wait', '--jobs', '2')
+
+        # A new update as soon as one is over, the last ones waited together
+        self.assertEqual(calls, [['id-stack1', 'id-stack2'],
+                                 ['id-stack2', 'id-stack3']])
+        output = self.stdout.getvalue()
+        self.assertLess(output.index('stack1: UPDATE_COMPLETE'),
+                        output.index('stack3: UPDATE_COMPLETE'))
+
+    @mock.patch('awstools.commands.cloudformation.wait_for_stacks')
+    @mock.patch('awstools.utils.connections.cloudformation')
+    @mock.patch('awstools.commands.cloudformation.read_stack_update')
+    @mock.patch('awstools.commands.cloudformation.find_stacks')
+    def test_wait_timeout(self, m_find, m_read, m_cfn, m_wait):
+        from awstools.utils.backoff import WaitTimeout
+
+        m_find.return_value = self.stacks[:1]
+        m_read.return_value = (self.sinfo(), mock.Mock(), [])
+        m_cfn.return_value.update_stack.return_value = 'id-stack3'
+        m_wait.side_effect = WaitTimeout
+
+        with self.assertRaises(SystemExit):
+            self.dispatch('--wait', '--timeout', '0')
+
+        self.assertIn('stack3: TIMEOUT Still in progress after 0s',
+                      self.stdout.getvalue())
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    @mock.patch('awstools.commands.cloudformation.read_stack_update')
+    @mock.patch('awstools.commands.cloudformation.find_stacks')
+    def test_no_update(self, m_find, m_read, m_cfn):
+        from boto.exception import BotoServerError
+
+        m_find.return_value = self.stacks[:1]
+        m_read.return_value = (self.sinfo(), mock.Mock(), [])
+        error = BotoServerError(400, 'Bad Request')
+        error.error_message = 'No updates are to be performed.'
+        m_cfn.return_value.update_stack.side_effect = error
+
+        self.dispatch()
+
+        self.assertIn('stack3: NO_UPDATE', self.stdout.getvalue())
+
+    @mock.patch('awstools.commands.cloudformation.confirm')
+    @mock.patch('awstools.utils.connections.cloudformation')
+    @mock.patch('awstools.commands.cloudformation.read_stack_update')
+    @mock.patch('awstools.commands.cloudformation.find_stacks')
+    def test_live_confirmation(self, m_find, m_read, m_cfn, m_confirm):
+        m_find.return_value = self.stacks
+        m_read.side_effect = [(self.sinfo(live=True), mock.Mock(), []),
+                              (self.sinfo(), mock.Mock(), []),
+                              (self.sinfo(live=True), mock.Mock(), [])]
+        m_confirm.return_value = False
+
+        self.dispatch()
+
+        m_confirm.assert_called_once_with(
+            "WARNING: Updating 2 live stack(s)! Are you sure? ")
+        self.assertIn('Live production stacks: stack1, stack3',
+                      self.stdout.getvalue())
+        self.assertFalse(m_cfn.return_value.update_stack.called)
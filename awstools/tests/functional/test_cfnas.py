@@ -6,6 +6,8 @@ import argh
 
 import mock
 
+from awstools.utils.cloudformation import RES_TYPE_ASG, RES_TYPE_ELB
+
 
 class TestCfnAs(unittest.TestCase):
 
@@ -18,20 +20,46 @@ class TestCfnAs(unittest.TestCase):
             0, self.stderr.len,
             msg="stderr is not empty:\n %s" % self.stderr.getvalue())
 
-    @mock.patch('awstools.commands.cfnautoscale.boto.connect_cloudformation')
+    def mock_stacks(self, m_c_cfn, m_c_as, count=3):
+        stacks = [mock.Mock(stack_name='test_stack_name_%s' % i)
+                  for i in range(1, count + 1)]
+
+        def describe_stack_resources(stack_name):
+            return [
+                mock.Mock(resource_type=RES_TYPE_ASG,
+                          physical_resource_id='asg-%s' % stack_name),
+                mock.Mock(resource_type=RES_TYPE_ELB,
+                          physical_resource_id='elb-%s' % stack_name),
+            ]
+
+        def get_all_groups(names, next_token=None):
+            groups = []
+            for name in names:
+                group = mock.Mock(instances=[
+                    mock.Mock(instance_id='i-' + name,
+                              launch_config_name='lc-' + name)])
+                group.name = name
+                groups.append(group)
+            return groups
+
+        cfn = m_c_cfn.return_value
+        cfn.describe_stack_resources.side_effect = describe_stack_resources
+        m_c_as.return_value.get_all_groups.side_effect = get_all_groups
+
+        return stacks
+
+    @mock.patch('awstools.utils.connections.elb')
+    @mock.patch('awstools.utils.connections.autoscale')
+    @mock.patch('awstools.utils.connections.cloudformation')
     @mock.patch('awstools.commands.cfnautoscale.find_stacks')
-    @mock.patch('awstools.commands.cfnautoscale.format_autoscale_instances')
-    def test_command_status(self, m_format, m_find_stacks, m_c_cfn):
+    def test_command_status(self, m_find_stacks, m_c_cfn, m_c_as, m_c_elb):
         from awstools.commands import cfnautoscale
 
-        m_format.side_effect = lambda x: "format: %s" % x
+        stacks = self.mock_stacks(m_c_cfn, m_c_as)
+        m_find_stacks.return_value = reversed(stacks)
 
-        stacks = [mock.Mock(stack_name='test_stack_name_1'),
-                  mock.Mock(stack_name='test_stack_name_2'),
-                  mock.Mock(stack_name='test_stack_name_3')]
-
-        m_find_stacks.return_value = stacks
-        m_c_cfn.return_value.describe_stacks.side_effect = zip(stacks)
+        m_c_elb.return_value.describe_instance_health.side_effect = (
+            lambda elb_id: [mock.Mock(instance_id='health-' + elb_id)])
 
         argh.dispatch_command(cfnautoscale.status,
                               argv=['testpattern'],
@@ -40,33 +68,25 @@ class TestCfnAs(unittest.TestCase):
                               completion=False,
                               )
 
-        m_format.assert_has_calls([mock.call(s) for s in stacks])
+        # One describe call per page of ASG names, not one per stack
+        self.assertEqual(m_c_as.return_value.get_all_groups.call_count, 1)
+
+        output = self.stdout.getvalue()
+        positions = [output.index(stack.stack_name) for stack in stacks]
+        self.assertEqual(positions, sorted(positions))
 
         for stack in stacks:
-            self.assertIn(str(stack), self.stdout.getvalue())
+            self.assertIn('i-asg-' + stack.stack_name, output)
+            self.assertIn('health-elb-' + stack.stack_name, output)
 
-    @mock.patch('awstools.commands.cfnautoscale.boto.connect_cloudformation')
+    @mock.patch('awstools.utils.connections.autoscale')
+    @mock.patch('awstools.utils.connections.cloudformation')
     @mock.patch('awstools.commands.cfnautoscale.find_stacks')
-    @mock.patch('awstools.commands.cfnautoscale.find_one_resource')
-    def test_command_show_cfg(self, m_find_one_r, m_find_stacks, m_c_cfn):
+    def test_command_show_cfg(self, m_find_stacks, m_c_cfn, m_c_as):
         from awstools.commands import cfnautoscale
 
-        stacks = [
-            mock.Mock(stack_name='test_stack_name_1'),
-            mock.Mock(stack_name='test_stack_name_2'),
-            mock.Mock(stack_name='test_stack_name_3')
-            ]
-
-        resources = [
-            mock.Mock(instances=[mock.Mock(launch_config_name='lc1')]),
-            mock.Mock(instances=[mock.Mock(launch_config_name='lc2')]),
-            mock.Mock(instances=[mock.Mock(launch_config_name='lc3')])
-            ]
-
+        stacks = self.mock_stacks(m_c_cfn, m_c_as)
         m_find_stacks.return_value = stacks
-        m_c_cfn.return_value.describe_stacks.side_effect = zip(stacks)
-
-        m_find_one_r.side_effect = resources
 
         argh.dispatch_command(cfnautoscale.show_cfg,
                               argv=['testpattern'],
@@ -76,9 +96,8 @@ class TestCfnAs(unittest.TestCase):
 
         for stack in stacks:
             self.assertIn(stack.stack_name, self.stdout.getvalue())
-
-        for name in ['lc1', 'lc2', 'lc3']:
-            self.assertIn(name, self.stdout.getvalue())
+            self.assertIn('lc-asg-' + stack.stack_name,
+                          self.stdout.getvalue())
 
     @mock.patch('awstools.commands.cfnautoscale.find_one_stack')
     @mock.patch('awstools.commands.cfnautoscale.find_one_resource')
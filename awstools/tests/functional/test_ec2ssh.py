@@ -34,17 +34,19 @@ class TestEc2ssh(unittest.TestCase):
 
         self.assertIn('CommandError', self.stderr.getvalue())
 
+    @mock.patch('awstools.commands.ec2ssh.inventory')
     @mock.patch('awstools.commands.ec2ssh.ec2')
     @mock.patch('awstools.commands.ec2ssh.os.execvp')
-    def test_command_single(self, mock_execvp, mock_ec2):
+    def test_command_single(self, mock_execvp, mock_ec2, mock_inventory):
         from awstools.commands import ec2ssh
 
         command = ['remote', 'command']
         identifiers = self.instances[0].id
 
-        mock_ec2.get_instances.return_value = self.instances
+        mock_inventory.get_all_instances.return_value = self.instances
         mock_ec2.get_name = lambda x: x.id
         mock_ec2.filter_instances = lambda x, y: [y[0]]
+        mock_ec2.unmatched_specifiers.return_value = []
 
         argv = [identifiers] + command
         argh.dispatch_command(ec2ssh.connect,
@@ -59,19 +61,71 @@ class TestEc2ssh(unittest.TestCase):
             ['ec2ssh', self.instances[0].public_dns_name] + command,
         )
 
+    @mock.patch('awstools.commands.ec2ssh.inventory')
+    @mock.patch('awstools.commands.ec2ssh.os.execvp')
+    def test_command_not_cached(self, mock_execvp, mock_inventory):
+        from awstools.commands import ec2ssh
+
+        mock_inventory.is_cached.return_value = False
+        mock_inventory.find_instances.return_value = self.instances[:1]
+
+        argv = ['Name-0']
+        argh.dispatch_command(ec2ssh.connect,
+                              argv=argv,
+                              output_file=self.stdout,
+                              errors_file=self.stderr,
+                              completion=False,
+                              )
+
+        mock_inventory.find_instances.assert_called_once_with(['Name-0'])
+        self.assertFalse(mock_inventory.get_all_instances.called)
+        mock_execvp.assert_called_once_with(
+            'ssh', ['ec2ssh', self.instances[0].public_dns_name])
+
+    @mock.patch('awstools.commands.atexit')
+    @mock.patch('awstools.commands.profiler')
+    @mock.patch('awstools.commands.report_profile')
+    @mock.patch('awstools.commands.ec2ssh.inventory')
+    @mock.patch('awstools.commands.ec2ssh.os.execvp')
+    def test_command_single_profile(self, mock_execvp, mock_inventory,
+                                    mock_report, mock_profiler, mock_atexit):
+        from awstools.commands import ec2ssh, setup_profiling
+
+        mock_inventory.is_cached.return_value = False
+        mock_inventory.find_instances.return_value = self.instances[:1]
+        # The exit handlers are not run once the process is replaced
+        mock_execvp.side_effect = (
+            lambda *args: self.assertTrue(mock_report.called))
+
+        setup_profiling(mock.Mock(profile_api=True, profile_api_output=None))
+        argh.dispatch_command(ec2ssh.connect,
+                              argv=['name-0'],
+                              output_file=self.stdout,
+                              errors_file=self.stderr,
+                              completion=False,
+                              )
+        # Not reported again at exit
+        mock_atexit.register.call_args[0][0]()
+
+        self.assertTrue(mock_execvp.called)
+        mock_report.assert_called_once_with(True, None)
+
+    @mock.patch('awstools.commands.ec2ssh.inventory')
     @mock.patch('awstools.commands.ec2ssh.ec2')
     @mock.patch('awstools.commands.ec2ssh.argh.confirm')
     @mock.patch('awstools.commands.ec2ssh.subprocess.call')
-    def test_command_multi(self, mock_call, mock_confirm, mock_ec2):
+    def test_command_multi(self, mock_call, mock_confirm, mock_ec2,
+                           mock_inventory):
         from awstools.commands import ec2ssh
 
         command = ['remote' 'command']
         identifiers = ','.join([self.instances[0].id,
                                 self.instances[1].id])
 
-        mock_ec2.get_instances.return_value = self.instances
+        mock_inventory.get_all_instances.return_value = self.instances
         mock_ec2.get_name = lambda x: x.id
         mock_ec2.filter_instances = lambda x, y: [y[0], y[1]]
+        mock_ec2.unmatched_specifiers.return_value = []
 
         argv = [identifiers] + command
         argh.dispatch_command(ec2ssh.connect,
@@ -91,6 +145,79 @@ class TestEc2ssh(unittest.TestCase):
 
         self.assertTrue(mock_confirm.called)
 
+    @mock.patch('awstools.commands.ec2ssh.inventory')
+    @mock.patch('awstools.commands.ec2ssh.ssh.multiplexer')
+    @mock.patch('awstools.commands.ec2ssh.argh.confirm')
+    @mock.patch('awstools.commands.ec2ssh.subprocess.call')
+    def test_command_multiplex(self, mock_call, mock_confirm,
+                               mock_multiplexer, mock_inventory):
+        from awstools.commands import ec2ssh
+
+        mock_inventory.is_cached.return_value = False
+        mock_inventory.find_instances.return_value = self.instances[:2]
+        mock_multiplexer.options.return_value = ['-o', 'ControlMaster=auto']
+        mock_multiplexer.warm_up.return_value = ['public-dns-1']
+
+        argv = ['name-*', 'uptime', '--yes']
+        argh.dispatch_command(ec2ssh.connect,
+                              argv=argv,
+                              output_file=self.stdout,
+                              errors_file=self.stderr,
+                              completion=False,
+                              )
+
+        self.assertTrue(mock_multiplexer.prepare.called)
+        mock_multiplexer.warm_up.assert_called_once_with(
+            ['public-dns-0', 'public-dns-1'])
+        self.assertIn('Failed to connect to: public-dns-1',
+                      self.stdout.getvalue())
+        mock_call.assert_any_call(
+            ['ssh', '-o', 'ControlMaster=auto', 'public-dns-0', 'uptime'])
+
+    @mock.patch('awstools.commands.ec2ssh.inventory')
+    @mock.patch('awstools.commands.ec2ssh.ssh.run_commands')
+    def test_command_parallel(self, mock_run_commands, mock_inventory):
+        from awstools.commands import ec2ssh
+
+        mock_inventory.is_cached.return_value = False
+        mock_inventory.find_instances.return_value = self.instances[:2]
+        mock_run_commands.return_value = [
+            ('name-1', 'up 2 days', None),
+            ('name-0', None, 'TIMEOUT'),
+            ('name-1', None, 0),
+            ]
+
+        argv = ['name-*', 'uptime', '--parallel', '10', '--timeout', '5',
+                '--yes']
+        with self.assertRaises(SystemExit) as context:
+            argh.dispatch_command(ec2ssh.connect,
+                                  argv=argv,
+                                  output_file=self.stdout,
+                                  errors_file=self.stderr,
+                                  completion=False,
+                                  )
+
+        mock_run_commands.assert_called_once_with(
+            [('name-0', 'public-dns-0'), ('name-1', 'public-dns-1')],
+            ['uptime'], jobs=10, timeout=5, options=[])
+        self.assertIn('name-1 | up 2 days', self.stdout.getvalue())
+        self.assertIn('TIMEOUT', self.stdout.getvalue())
+        self.assertIn('name-0', str(context.exception))
+
+    @mock.patch('awstools.commands.ec2ssh.argh.dispatch')
+    def test_parser(self, mock_dispatch):
+        from awstools.commands import ec2ssh
+
+        ec2ssh.main()
+        parser = mock_dispatch.call_args[0][0]
+
+        args = parser.parse_args(['--profile-api', '-v', 'name-0'])
+        self.assertTrue(args.profile_api)
+        self.assertTrue(args.verbose)
+        with mock.patch('sys.stderr', self.stderr):
+            self.assertRaises(SystemExit, parser.parse_args,
+                              ['--settings', 'settings.yaml', 'name-0'])
+
     def test_option_completion_script(self):
         from awstools.commands import ec2ssh
 
@@ -25,7 +25,7 @@ environments:
 
 ---
 Application: LiveApp
-ShortName: dm
+ShortName: la
 model: appmodel
 live: true
 environments:
@@ -195,3 +195,84 @@ class TestApplicationApplication(unittest.TestCase):
         }
 
         self.assertDictEqual(sinfo, valid_sinfo)
+
+    def test_application_application_stackinfo_copy(self):
+        sinfo = self.app.get_stack_info_from_stackname('tt-python-production')
+        sinfo['InstanceType'] = 'm3.large'
+
+        sinfo = self.app.get_stack_info_from_stackname('tt-python-production')
+        self.assertEqual(sinfo['InstanceType'], 'c1.medium')
+
+    def test_application_application_stackinfo_pool_metacharacters(self):
+        from awstools import application
+
+        data = dict(DATA, environments={'stage': {
+            'n.de[1]': {'ident': 'dot1'},
+            'node[1]': {'ident': 'node1'},
+            'c++': {'ident': 'cpp'},
+            'c++[2]': {'ident': 'cpp2'},
+        }})
+        app = application.Application(data)
+
+        self.assertEqual(app.get_stack_info('stage', 'node', '1')['ident'],
+                         'node1')
+        self.assertEqual(app.get_stack_info('stage', 'c++', '2')['ident'],
+                         'cpp2')
+        self.assertEqual(app.get_stack_info('stage', 'c++', '3')['ident'],
+                         'cpp')
+        with self.assertRaises(application.ApplicationPoolNotFound):
+            app.get_stack_info('stage', 'n.de', '2')
+
+
+class TestApplicationModel(unittest.TestCase):
+
+    def setUp(self):
+        from awstools import application
+
+        self.apps = application.Applications(multiyaml)
+
+    def test_model_properties(self):
+        app = self.apps.get(name='JustDevFromModel')
+        sinfo = app.get_stack_info_from_stackname('dm-python-development')
+
+        self.assertEqual(sinfo['template'], 'python.js')
+        self.assertEqual(sinfo['KeyName'], 'keymodel')
+        self.assertEqual(sinfo['Application'], 'JustDevFromModel')
+        self.assertEqual(sinfo['model'], 'appmodel')
+
+    def test_expand_all(self):
+        stacks = list(self.apps.expand_all())
+        names = [name for name, sinfo in stacks]
+
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(
+            [name for name in names if name.startswith('mi-')],
+            ['mi-node-stage', 'mi-node-stage-1', 'mi-node-stage-2',
+             'mi-node-stage-3', 'mi-node-stage-4'])
+        self.assertIn('tt-cloudadmin-production', names)
+        self.assertIn('am-python-development', names)
+        self.assertEqual(len(names), 13)
+
+        for name, sinfo in stacks:
+            app = self.apps.get(stackname=name)
+            self.assertEqual(sinfo, app.get_stack_info_from_stackname(name))
+
+    def test_model_identifiers(self):
+        from awstools import application
+
+        model = application.Application(dict(DATA, environments={'stage': {
+            'node': {'size': 'small', 'ident': 'model'},
+            'node[5]': {'size': 'large'},
+        }}))
+        app = application.Application(dict(DATA, environments={'stage': {
+            'node': {'ident': 'app'},
+        }}))
+        app.model = model
+
+        self.assertEqual(app.get_stack_info('stage', 'node', '5'),
+                         dict(app.get_stack_info('stage', 'node'),
+                              size='large'))
+        self.assertEqual(app.get_stack_info('stage', 'node', '6')['size'],
+                         'small')
+        self.assertEqual(app.get_stack_info('stage', 'node', '6')['ident'],
+                         'app')
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 import yaml
@@ -98,6 +101,7 @@ class TestApplications(unittest.TestCase):
     @mock.patch('awstools.application.Application', create=True)
     def test_load_from_yaml(self, mock_app, mock_yaml):
         mock_yaml.load_all.return_value = ['app1', 'app2']
+        mock_app.side_effect = lambda data: mock.Mock(shortname=data)
 
         self.apps.load_from_yaml("NotNone")
 
@@ -123,6 +127,7 @@ class TestApplications(unittest.TestCase):
             mock_app_deux,
             mock_app_trois
         ]
+        self.apps._index_apps()
 
         self.assertItemsEqual(
             self.apps,
@@ -144,3 +149,139 @@ class TestApplications(unittest.TestCase):
 
         with self.assertRaises(ApplicationNotFound):
             self.apps.get(name='nada')
+
+    def test_get_name_and_shortname(self):
+        from awstools.application import ApplicationNotFound
+
+        self.apps.load_from_yaml(DATAYAML)
+
+        self.assertIs(self.apps.get(name='test', shortname='tt'),
+                      self.apps.get(stackname='tt-python-stage'))
+        with self.assertRaises(ApplicationNotFound):
+            self.apps.get(name='test', shortname='ba')
+        with self.assertRaises(ApplicationNotFound):
+            self.apps.get(stackname='xx-python-stage')
+
+    def test_contains(self):
+        from awstools.application import Application
+
+        self.apps.load_from_yaml(DATAYAML)
+
+        self.assertIn(self.apps.get(name='base'), self.apps)
+        self.assertNotIn(Application({}), self.apps)
+        self.assertNotIn({}, self.apps)
+
+    def test_duplicate_shortname(self):
+        from awstools.application import ApplicationInvalid
+
+        data = DATAYAML.replace('ShortName: ba', 'ShortName: tt')
+
+        with self.assertRaises(ApplicationInvalid):
+            self.apps.load_from_yaml(data)
+
+    def test_invalid_environment(self):
+        from awstools.application import ApplicationInvalid
+
+        data = DATAYAML + """
+---
+
+Application: broken
+ShortName: br
+live: False
+environments:
+    stage:
+        python: True
+    production:
+"""
+        self.apps.load_from_yaml(data)
+
+        broken = self.apps.get(name='broken')
+        self.assertEqual(broken.get_stack_info_from_stackname(
+            'br-python-stage')['Type'], 'python')
+        with self.assertRaisesRegexp(ApplicationInvalid, 'broken'):
+            broken.get_stack_info_from_stackname('br-python-production')
+        test = self.apps.get(name='test')
+        self.assertEqual(test.get_stack_info_from_stackname(
+            'tt-python-stage')['Type'], 'python')
+
+
+class TestLoadApplications(unittest.TestCase):
+
+    def setUp(self):
+        from awstools import application
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.settings = os.path.join(self.directory, 'settings.yaml')
+        self.write_settings(DATAYAML)
+
+        patcher = mock.patch.dict(application._loaded, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Count the loads from yaml
+        patcher = mock.patch.object(
+            application.Applications, 'load_from_yaml', autospec=True,
+            side_effect=application.Applications.load_from_yaml)
+        self.mock_apps = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_settings(self, data, mtime=1000000000):
+        with open(self.settings, 'w') as fp:
+            fp.write(data)
+        os.utime(self.settings, (mtime, mtime))
+
+    def load(self):
+        from awstools import application
+
+        return application.load_applications(self.settings,
+                                             directory=self.directory)
+
+    def test_load(self):
+        apps = self.load()
+
+        self.assertEqual(apps.get(name='test').get_stack_info(
+            'production', 'python')['template'], 'python.js')
+        self.assertIs(self.load(), apps)
+        self.assertEqual(self.mock_apps.call_count, 1)
+
+    def test_cached(self):
+        from awstools import application
+
+        self.load()
+        application._loaded.clear()
+        apps = self.load()
+
+        self.assertEqual(self.mock_apps.call_count, 1)
+        self.assertEqual(apps.get(name='test').get_stack_info(
+            'production', 'python')['template'], 'python.js')
+        self.assertIs(apps.get(name='test').model, apps.get(name='base'))
+
+    def test_changed(self):
+        self.load()
+
+        self.write_settings(DATAYAML.replace('python.js', 'python2.js'))
+        apps = self.load()
+
+        self.assertEqual(self.mock_apps.call_count, 2)
+        self.assertEqual(apps.get(name='test').get_stack_info(
+            'production', 'python')['template'], 'python2.js')
+
+        # Same content, but touched
+        self.write_settings(DATAYAML.replace('python.js', 'python2.js'),
+                            mtime=1000000001)
+        self.load()
+        self.assertEqual(self.mock_apps.call_count, 3)
+
+    def test_corrupted_cache(self):
+        from awstools import application
+
+        self.load()
+        application._loaded.clear()
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                with open(os.path.join(self.directory, name), 'w') as fp:
+                    fp.write('garbage')
+
+        self.load()
+        self.assertEqual(self.mock_apps.call_count, 2)
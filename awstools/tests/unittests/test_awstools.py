@@ -1,13 +1,15 @@
 from UserList import UserList
+import datetime
 import unittest
 
 import mock
 
 
 class Stack(object):
-    def __init__(self, name, status="CREATE_COMPLETE"):
+    def __init__(self, name, status="CREATE_COMPLETE", stack_id=None):
         self.stack_name = name
         self.stack_status = status
+        self.stack_id = stack_id
 
 
 class StackList(UserList):
@@ -16,6 +18,39 @@ class StackList(UserList):
         self.next_token = next_token
 
 
+class Resource(object):
+    def __init__(self, resource_type, physical_resource_id):
+        self.resource_type = resource_type
+        self.physical_resource_id = physical_resource_id
+
+
+class Named(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class Event(object):
+    def __init__(self, minute, status='CREATE_IN_PROGRESS', stack=False,
+                 nested=False):
+        self.minute = minute
+        self.event_id = 'event-%s' % minute
+        self.timestamp = datetime.datetime(2013, 1, 1, 0, minute)
+        self.resource_status = status
+        self.stack_id = 'stack-id'
+        self.stack_name = 'stack'
+        if stack or nested:
+            self.resource_type = 'AWS::CloudFormation::Stack'
+        else:
+            self.resource_type = 'AWS::EC2::Instance'
+        if stack:
+            self.logical_resource_id = 'stack'
+            self.physical_resource_id = 'stack-id'
+        else:
+            self.logical_resource_id = 'logical-%s' % minute
+            self.physical_resource_id = 'physical-%s' % minute
+        self.resource_status_reason = None
+
+
 class TestAwstools(unittest.TestCase):
 
     def setUp(self):
@@ -24,6 +59,9 @@ class TestAwstools(unittest.TestCase):
             next_token='tok')
 
         self.teststacks2 = StackList(
+            [Stack('ns1'), Stack('ns2')])
+
+        self.teststacks2_all = StackList(
             [Stack('ns1'), Stack('ns2'),
              Stack('deleted', status='DELETE_COMPLETE')])
 
@@ -33,46 +71,379 @@ class TestAwstools(unittest.TestCase):
         self.result = None
 
     def check_slist(self, listok):
-        self.assertEqual([s.stack_name for s in self.result], sorted(listok))
+        self.assertEqual([s.stack_name for s in self.result], listok)
 
-    @mock.patch('awstools.utils.cloudformation.boto.connect_cloudformation')
+    @mock.patch('awstools.utils.connections.cloudformation')
     def test_find_stacks_valid(self, mock_conn_cfn):
         from awstools.utils import cloudformation
 
         l_s = mock_conn_cfn.return_value.list_stacks
         l_s.side_effect = [self.teststacks1, self.teststacks2]
 
-        self.result = cloudformation.find_stacks()
+        self.result = list(cloudformation.find_stacks())
 
-        l_s.assert_has_calls([mock.call(next_token=None),
-                              mock.call(next_token='tok')])
+        statuses = [s for s in cloudformation.STACK_STATUSES
+                    if s != 'DELETE_COMPLETE']
+        l_s.assert_has_calls([
+            mock.call(stack_status_filters=statuses, next_token=None),
+            mock.call(stack_status_filters=statuses, next_token='tok')])
 
         self.check_slist(['test1', 'test2', 'test3', 'ns1', 'ns2'])
 
-    @mock.patch('awstools.utils.cloudformation.boto.connect_cloudformation')
+    def test_stack_statuses(self):
+        from awstools.utils import cloudformation
+
+        for status in ['REVIEW_IN_PROGRESS', 'IMPORT_IN_PROGRESS',
+                       'UPDATE_FAILED']:
+            self.assertIn(status, cloudformation.STACK_DEFAULT_STATUS)
+        self.assertIn('IMPORT_ROLLBACK_IN_PROGRESS',
+                      cloudformation.STACK_IN_PROGRESS_STATUS)
+
+    @mock.patch('awstools.utils.connections.cloudformation')
     def test_find_stacks_valid_all(self, mock_conn_cfn):
         from awstools.utils import cloudformation
 
         l_s = mock_conn_cfn.return_value.list_stacks
-        l_s.side_effect = [self.teststacks1, self.teststacks2]
+        l_s.side_effect = [self.teststacks1, self.teststacks2_all]
 
-        self.result = cloudformation.find_stacks(findall=True)
+        self.result = list(cloudformation.find_stacks(findall=True))
 
-        l_s.assert_has_calls([mock.call(next_token=None),
-                              mock.call(next_token='tok')])
+        l_s.assert_has_calls([
+            mock.call(stack_status_filters=None, next_token=None),
+            mock.call(stack_status_filters=None, next_token='tok')])
 
-        self.check_slist(['test1', 'test2', 'test3', 'ns1', 'ns2', 'deleted'])
+        self.check_slist(['test1', 'test2', 'test3', 'deleted', 'ns1', 'ns2'])
 
-    @mock.patch('awstools.utils.cloudformation.boto.connect_cloudformation')
+    @mock.patch('awstools.utils.connections.cloudformation')
     def test_find_stacks_pattern(self, mock_conn_cfn):
         from awstools.utils import cloudformation
 
         l_s = mock_conn_cfn.return_value.list_stacks
         l_s.side_effect = [self.teststacks1, self.teststacks2]
 
-        self.result = cloudformation.find_stacks(pattern='ns')
+        self.result = list(cloudformation.find_stacks(pattern='ns'))
 
-        l_s.assert_has_calls([mock.call(next_token=None),
-                              mock.call(next_token='tok')])
+        self.assertEqual(l_s.call_count, 2)
 
         self.check_slist(['ns1', 'ns2'])
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_find_stacks_streaming(self, mock_conn_cfn):
+        from awstools.utils import cloudformation
+
+        l_s = mock_conn_cfn.return_value.list_stacks
+        l_s.side_effect = [self.teststacks1, self.teststacks2]
+
+        stacks = cloudformation.find_stacks()
+
+        self.assertEqual(next(stacks).stack_name, 'test1')
+        self.assertEqual(l_s.call_count, 1)
+
+        self.assertEqual(len(list(stacks)), 4)
+        self.assertEqual(l_s.call_count, 2)
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_find_stacks_statuses(self, mock_conn_cfn):
+        from awstools.utils import cloudformation
+
+        l_s = mock_conn_cfn.return_value.list_stacks
+        l_s.side_effect = [self.teststacks2]
+
+        list(cloudformation.find_stacks(statuses=['CREATE_IN_PROGRESS']))
+
+        l_s.assert_called_once_with(
+            stack_status_filters=['CREATE_IN_PROGRESS'], next_token=None)
+
+    @mock.patch('awstools.utils.cloudformation.stack_cache')
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_find_stacks_cached(self, mock_conn_cfn, mock_cache):
+        from awstools.utils import cloudformation
+
+        mock_cache.get_summaries.return_value = self.teststacks1
+
+        self.result = list(cloudformation.find_stacks(pattern='test2'))
+
+        self.assertFalse(mock_conn_cfn.return_value.list_stacks.called)
+        self.check_slist(['test2'])
+
+    @mock.patch('awstools.utils.cloudformation.stack_cache')
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_find_stacks_fill_cache(self, mock_conn_cfn, mock_cache):
+        from awstools.utils import cloudformation
+
+        mock_cache.get_summaries.return_value = None
+        l_s = mock_conn_cfn.return_value.list_stacks
+        l_s.side_effect = [self.teststacks1, self.teststacks2]
+
+        self.result = list(cloudformation.find_stacks(pattern='test'))
+
+        self.check_slist(['test1', 'test2', 'test3'])
+        cached = mock_cache.set_summaries.call_args[0][0]
+        self.assertEqual(len(cached), 5)
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_find_one_stack_exact_name(self, mock_conn_cfn):
+        from awstools.utils import cloudformation
+
+        cfn = mock_conn_cfn.return_value
+        cfn.describe_stacks.return_value = [Stack('tt-python-production')]
+
+        stack = cloudformation.find_one_stack('tt-python-production',
+                                              summary=False)
+
+        self.assertEqual(stack.stack_name, 'tt-python-production')
+        cfn.describe_stacks.assert_called_once_with('tt-python-production')
+        self.assertFalse(cfn.list_stacks.called)
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_find_one_stack_pattern(self, mock_conn_cfn):
+        from boto.exception import BotoServerError
+        from awstools.utils import cloudformation
+
+        cfn = mock_conn_cfn.return_value
+        cfn.describe_stacks.side_effect = [
+            BotoServerError(400, 'Bad Request', STACK_NOT_FOUND),
+            [Stack('ns1')],
+        ]
+        cfn.list_stacks.side_effect = [self.teststacks1, self.teststacks2]
+
+        stack = cloudformation.find_one_stack('s1', summary=False)
+
+        self.assertEqual(stack.stack_name, 'ns1')
+        cfn.describe_stacks.assert_has_calls([mock.call('s1'),
+                                              mock.call('ns1')])
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_find_one_stack_error(self, mock_conn_cfn):
+        from boto.exception import BotoServerError
+        from awstools.utils import cloudformation
+
+        cfn = mock_conn_cfn.return_value
+        cfn.describe_stacks.side_effect = BotoServerError(403, 'Forbidden')
+
+        self.assertRaises(BotoServerError, cloudformation.find_one_stack,
+                          'ns1', summary=False)
+        self.assertFalse(cfn.list_stacks.called)
+
+    @mock.patch('awstools.utils.connections.autoscale')
+    def test_find_resources_pages(self, mock_conn_as):
+        from awstools.utils import cloudformation
+
+        stacks_resources = dict(
+            ('stack%s' % i, [Resource(cloudformation.RES_TYPE_ASG,
+                                      'asg%s' % i)])
+            for i in range(120))
+
+        mock_conn_as.return_value.get_all_groups.side_effect = (
+            lambda names, next_token: [Named(n) for n in names])
+
+        result = cloudformation.find_resources(stacks_resources,
+                                               cloudformation.RES_TYPE_ASG)
+
+        self.assertEqual(result['stack42'].name, 'asg42')
+        self.assertEqual(len(result), 120)
+        self.assertEqual(
+            mock_conn_as.return_value.get_all_groups.call_count, 3)
+
+    @mock.patch('awstools.utils.connections.elb')
+    def test_find_resources_marker(self, mock_conn_elb):
+        from awstools.utils import cloudformation
+
+        stacks_resources = {
+            'stack1': [Resource(cloudformation.RES_TYPE_ELB, 'elb1')],
+            'stack2': [Resource(cloudformation.RES_TYPE_ELB, 'elb2')],
+        }
+
+        first = StackList([Named('elb1')])
+        first.next_marker = 'marker'
+        second = StackList([Named('elb2')])
+        second.next_marker = None
+        get_all = mock_conn_elb.return_value.get_all_load_balancers
+        get_all.side_effect = [first, second]
+
+        result = cloudformation.find_resources(stacks_resources,
+                                               cloudformation.RES_TYPE_ELB)
+
+        self.assertEqual(result['stack2'].name, 'elb2')
+        get_all.assert_has_calls([
+            mock.call(['elb1', 'elb2'], marker=None),
+            mock.call(['elb1', 'elb2'], marker='marker')])
+
+    def test_find_resources_missing(self):
+        from awstools.utils import cloudformation
+
+        stacks_resources = {'stack1': []}
+
+        self.assertRaises(ValueError, cloudformation.find_resources,
+                          stacks_resources, cloudformation.RES_TYPE_ASG)
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_iter_stack_events_limit(self, mock_conn_cfn):
+        from awstools.utils import cloudformation
+
+        d_s_e = mock_conn_cfn.return_value.describe_stack_events
+        d_s_e.side_effect = [
+            StackList([Event(10), Event(9), Event(8)], next_token='tok'),
+            StackList([Event(7), Event(6), Event(5)], next_token='tok2'),
+            StackList([Event(4)]),
+        ]
+
+        events = list(cloudformation.iter_stack_events('stack', limit=4))
+
+        self.assertEqual([e.minute for e in events], [10, 9, 8, 7])
+        d_s_e.assert_has_calls([mock.call('stack', next_token=None),
+                                mock.call('stack', next_token='tok')])
+        self.assertEqual(d_s_e.call_count, 2)
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_iter_stack_events_since(self, mock_conn_cfn):
+        from awstools.utils import cloudformation
+
+        d_s_e = mock_conn_cfn.return_value.describe_stack_events
+        d_s_e.side_effect = [
+            StackList([Event(10), Event(9), Event(8)], next_token='tok'),
+            StackList([Event(7)]),
+        ]
+
+        since = datetime.datetime(2013, 1, 1, 0, 9)
+        events = list(cloudformation.iter_stack_events('stack', since=since))
+
+        self.assertEqual([e.minute for e in events], [10, 9])
+        self.assertEqual(d_s_e.call_count, 1)
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_iter_stack_events_all(self, mock_conn_cfn):
+        from awstools.utils import cloudformation
+
+        d_s_e = mock_conn_cfn.return_value.describe_stack_events
+        d_s_e.side_effect = [
+            StackList([Event(10), Event(9)], next_token='tok'),
+            StackList([Event(8)]),
+        ]
+
+        events = list(cloudformation.iter_stack_events('stack'))
+
+        self.assertEqual([e.minute for e in events], [10, 9, 8])
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_follow_stack_events(self, mock_conn_cfn):
+        from awstools.utils import cloudformation
+
+        d_s_e = mock_conn_cfn.return_value.describe_stack_events
+        d_s_e.side_effect = [
+            # Newest first, with the already seen event 1 on the first page
+            StackList([Event(2), Event(1), Event(0)]),
+            StackList([Event(2), Event(1)]),
+            StackList([Event(2), Event(1)]),
+            StackList([Event(4, 'CREATE_COMPLETE', stack=True), Event(3),
+                       Event(2)]),
+        ]
+        sleep = mock.Mock()
+
+        events = list(cloudformation.follow_stack_events(
+            'stack', last_event_id='event-1', interval=2, sleep=sleep))
+
+        self.assertEqual([e.minute for e in events], [2, 3, 4])
+        sleep.assert_has_calls([mock.call(2), mock.call(4), mock.call(8)])
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_follow_stack_events_in_progress(self, mock_conn_cfn):
+        from awstools.utils import cloudformation
+
+        d_s_e = mock_conn_cfn.return_value.describe_stack_events
+        d_s_e.side_effect = [
+            StackList([Event(2, 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
+                             stack=True), Event(1)]),
+            StackList([Event(3, 'UPDATE_COMPLETE', stack=True), Event(2)]),
+        ]
+
+        events = list(cloudformation.follow_stack_events(
+            'stack', last_event_id='event-1', sleep=mock.Mock()))
+
+        self.assertEqual([e.minute for e in events], [2, 3])
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_follow_stack_events_nested(self, mock_conn_cfn):
+        from awstools.utils import cloudformation
+
+        d_s_e = mock_conn_cfn.return_value.describe_stack_events
+        d_s_e.side_effect = [
+            StackList([Event(2, 'CREATE_COMPLETE', nested=True), Event(1)]),
+            StackList([Event(3, 'UPDATE_COMPLETE', stack=True), Event(2)]),
+        ]
+
+        events = list(cloudformation.follow_stack_events(
+            'stack', last_event_id='event-1', sleep=mock.Mock()))
+
+        self.assertEqual([e.minute for e in events], [2, 3])
+
+    @mock.patch('awstools.utils.cloudformation.stack_cache')
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_wait_for_one_stack(self, mock_conn_cfn, mock_cache):
+        from awstools.utils import cloudformation
+
+        d_s = mock_conn_cfn.return_value.describe_stacks
+        d_s.side_effect = [[Stack('stack1', 'UPDATE_IN_PROGRESS')],
+                           [Stack('stack1', 'UPDATE_COMPLETE')]]
+        backoff = mock.Mock()
+
+        stacks = list(cloudformation.wait_for_stacks(['id1'],
+                                                     backoff=backoff))
+
+        self.assertEqual([s.stack_status for s in stacks],
+                         ['UPDATE_COMPLETE'])
+        d_s.assert_has_calls([mock.call('id1'), mock.call('id1')])
+        self.assertEqual(backoff.sleep.call_count, 1)
+        mock_cache.invalidate.assert_called_once_with('stack1')
+
+    @mock.patch('awstools.utils.cloudformation.stack_cache')
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_wait_for_many_stacks(self, mock_conn_cfn, mock_cache):
+        from awstools.utils import cloudformation
+
+        cfn = mock_conn_cfn.return_value
+        cfn.list_stacks.side_effect = [
+            StackList([Stack('stack1', stack_id='id1'),
+                       Stack('stack2', stack_id='id2'),
+                       Stack('other', stack_id='other')]),
+            StackList([Stack('stack2', stack_id='id2')]),
+            StackList([]),
+        ]
+        cfn.describe_stacks.side_effect = (
+            lambda stack_id: [Stack(stack_id.replace('id', 'stack'),
+                                    'UPDATE_COMPLETE')])
+        backoff = mock.Mock()
+
+        stacks = list(cloudformation.wait_for_stacks(['id1', 'id2', 'id3'],
+                                                     backoff=backoff))
+
+        self.assertEqual([s.stack_name for s in stacks],
+                         ['stack3', 'stack1', 'stack2'])
+        cfn.list_stacks.assert_called_with(
+            stack_status_filters=cloudformation.STACK_IN_PROGRESS_STATUS,
+            next_token=None)
+        self.assertEqual(cfn.list_stacks.call_count, 2)
+        self.assertEqual(cfn.describe_stacks.call_count, 3)
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_wait_for_stacks_timeout(self, mock_conn_cfn):
+        from awstools.utils import cloudformation
+        from awstools.utils.backoff import WaitTimeout
+
+        d_s = mock_conn_cfn.return_value.describe_stacks
+        d_s.return_value = [Stack('stack1', 'UPDATE_IN_PROGRESS')]
+        backoff = mock.Mock()
+        backoff.sleep.side_effect = WaitTimeout
+
+        stacks = cloudformation.wait_for_stacks(['id1'], backoff=backoff)
+
+        self.assertRaises(WaitTimeout, list, stacks)
+
+
+STACK_NOT_FOUND = """<ErrorResponse>
+  <Error>
+    <Type>Sender</Type>
+    <Code>ValidationError</Code>
+    <Message>Stack with id s1 does not exist</Message>
+  </Error>
+</ErrorResponse>"""
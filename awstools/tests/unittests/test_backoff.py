@@ -0,0 +1,51 @@
+import unittest
+
+import mock
+
+from awstools.utils.backoff import Backoff, WaitTimeout
+
+
+class TestBackoff(unittest.TestCase):
+
+    def test_exponential(self):
+        backoff = Backoff(initial=1, maximum=5, jitter=0)
+
+        delays = [backoff.next_delay() for i in range(5)]
+
+        self.assertEqual(delays, [1, 2, 4, 5, 5])
+
+        backoff.reset()
+        self.assertEqual(backoff.next_delay(), 1)
+
+    def test_jitter(self):
+        backoff = Backoff(initial=10, maximum=10, jitter=0.5)
+
+        delays = [backoff.next_delay() for i in range(100)]
+
+        self.assertTrue(all(5 <= d <= 10 for d in delays))
+        self.assertTrue(len(set(delays)) > 1)
+
+    def test_sleep(self):
+        sleep = mock.Mock()
+        backoff = Backoff(initial=1, jitter=0, sleep=sleep)
+
+        backoff.sleep()
+        backoff.sleep()
+
+        sleep.assert_has_calls([mock.call(1), mock.call(2)])
+
+    def test_deadline(self):
+        clock = mock.Mock(return_value=100)
+        sleep = mock.Mock()
+        backoff = Backoff(initial=4, jitter=0, timeout=5,
+                          sleep=sleep, clock=clock)
+
+        backoff.sleep()
+        sleep.assert_called_with(4)
+
+        clock.return_value = 104
+        backoff.sleep()
+        sleep.assert_called_with(1)
+
+        clock.return_value = 105
+        self.assertRaises(WaitTimeout, backoff.sleep)
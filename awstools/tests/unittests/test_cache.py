@@ -0,0 +1,131 @@
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+from awstools.utils.cache import FileCache
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = FileCache('test', 60, directory=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_missing(self):
+        self.assertIsNone(self.cache.get())
+
+    def test_set_get(self):
+        self.assertTrue(self.cache.set({'key': ['value']}))
+        self.assertEqual(self.cache.get(), {'key': ['value']})
+        self.assertFalse([f for f in os.listdir(self.directory)
+                          if f.startswith('.tmp-')])
+
+    def test_expired(self):
+        self.cache.set('data')
+        later = time.time() + 61
+        with mock.patch('awstools.utils.cache.time.time') as mock_time:
+            mock_time.return_value = later
+            self.assertIsNone(self.cache.get())
+
+    def test_stale(self):
+        self.assertEqual(self.cache.get_stale(), (None, True))
+
+        self.cache.set('data')
+        self.assertEqual(self.cache.get_stale(), ('data', False))
+
+        later = time.time() + 61
+        with mock.patch('awstools.utils.cache.time.time') as mock_time:
+            mock_time.return_value = later
+            self.assertEqual(self.cache.get_stale(), ('data', True))
+
+    def test_corrupted(self):
+        self.cache.set('data')
+        with open(self.cache.path, 'wb') as fp:
+            fp.write('{"trunc')
+        self.assertIsNone(self.cache.get())
+
+    def test_invalidate(self):
+        self.cache.set('data')
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get())
+
+    def test_set_after_invalidation(self):
+        since = time.time() - 1
+        self.cache.invalidate()
+        self.assertFalse(self.cache.set('stale', since=since))
+        self.assertIsNone(self.cache.get())
+
+        self.assertTrue(self.cache.set('fresh', since=time.time()))
+        self.assertEqual(self.cache.get(), 'fresh')
+
+
+class TestStackCache(unittest.TestCase):
+
+    def setUp(self):
+        from awstools.utils.cloudformation import StackCache
+
+        self.directory = tempfile.mkdtemp()
+        self.cache = StackCache()
+        self.cache.configure(ttl=60, describe=True, directory=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_disabled(self):
+        from awstools.utils.cloudformation import StackCache
+
+        cache = StackCache()
+        cache.set_summaries([mock.Mock()], since=None)
+        self.assertIsNone(cache.get_summaries())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_summaries(self):
+        from boto.cloudformation.stack import StackSummary
+
+        stack = StackSummary()
+        stack.stack_name = 'tt-python-production'
+        stack.stack_status = 'CREATE_COMPLETE'
+        stack.creation_time = datetime.datetime(2013, 1, 2, 3, 4, 5, 6)
+
+        self.cache.set_summaries([stack], since=time.time())
+        cached = self.cache.get_summaries()
+
+        self.assertEqual(len(cached), 1)
+        self.assertIsInstance(cached[0], StackSummary)
+        self.assertEqual(cached[0].stack_name, stack.stack_name)
+        self.assertEqual(cached[0].creation_time, stack.creation_time)
+        self.assertIsNone(cached[0].deletion_time)
+
+        self.cache.refresh = True
+        self.assertIsNone(self.cache.get_summaries())
+
+    @mock.patch('awstools.utils.connections.cloudformation')
+    def test_stack(self, mock_cfn):
+        from boto.cloudformation.stack import Stack, Output
+
+        stack = Stack()
+        stack.stack_name = 'tt-python-production'
+        stack.creation_time = datetime.datetime(2013, 1, 2, 3, 4, 5)
+        output = Output()
+        output.key, output.value, output.description = 'k', 'v', 'd'
+        stack.outputs = [output]
+        stack.tags = {'Name': 'tt-python-production'}
+
+        self.cache.set_stack(stack, since=time.time())
+        cached = self.cache.get_stack('tt-python-production')
+
+        self.assertEqual(cached.creation_time, stack.creation_time)
+        self.assertEqual(cached.outputs[0].description, 'd')
+        self.assertEqual(cached.tags, stack.tags)
+        self.assertEqual(cached.connection, mock_cfn.return_value)
+
+        self.cache.invalidate('tt-python-production')
+        self.assertIsNone(self.cache.get_stack('tt-python-production'))
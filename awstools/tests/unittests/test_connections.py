@@ -0,0 +1,60 @@
+import unittest
+
+import mock
+
+from awstools.utils import connections
+
+
+class TestConnections(unittest.TestCase):
+
+    def setUp(self):
+        self.connect = mock.Mock(side_effect=lambda: self.make_connection())
+        self.connect_to_region = mock.Mock(
+            side_effect=lambda r: self.make_connection())
+
+        patcher = mock.patch.dict(connections.SERVICES, {
+            'cloudformation': (self.connect, self.connect_to_region)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        connections.reset()
+        self.addCleanup(connections.reset)
+
+    def make_connection(self):
+        return mock.Mock(http_exceptions=(IOError,),
+                         http_unretryable_exceptions=[])
+
+    def test_reuse(self):
+        conn = connections.cloudformation()
+
+        self.assertIs(connections.cloudformation(), conn)
+        self.assertIs(connections.get_connection('cloudformation'), conn)
+        self.connect.assert_called_once_with()
+
+    def test_regions(self):
+        default = connections.cloudformation()
+        east = connections.cloudformation('us-east-1')
+        west = connections.cloudformation('us-west-2')
+
+        self.assertEqual(len(set([default, east, west])), 3)
+        self.assertIs(connections.cloudformation('us-west-2'), west)
+        self.connect_to_region.assert_has_calls([mock.call('us-east-1'),
+                                                 mock.call('us-west-2')])
+
+    def test_unknown_region(self):
+        self.connect_to_region.side_effect = lambda r: None
+
+        self.assertRaises(ValueError, connections.cloudformation, 'mars-1')
+
+    def test_reset(self):
+        conn = connections.cloudformation()
+        connections.reset()
+
+        self.assertIsNot(connections.cloudformation(), conn)
+
+    def test_throttling(self):
+        conn = connections.cloudformation()
+
+        self.assertEqual(conn.num_retries, 0)
+        self.assertEqual(conn.make_request.__name__,
+                         'make_request_with_retries')
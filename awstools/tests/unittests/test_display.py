@@ -40,7 +40,7 @@ class TestDisplay(unittest.TestCase):
         self.assertIn('1969-12-31 14:00:00', fmt)
         self.assertIn('template_description', fmt)
 
-    @mock.patch('boto.connect_cloudformation')
+    @mock.patch('awstools.utils.connections.cloudformation')
     def test_format_stack_events(self, mock_cfn):
         stack = mock.MagicMock(stack_name="stack_name")
         stack.creation_time = datetime.datetime.fromtimestamp(0)
@@ -52,7 +52,8 @@ class TestDisplay(unittest.TestCase):
             logical_resource_id='logical_resource_id',
             resource_status_reason='resource_status_reason')
 
-        mock_cfn.return_value.describe_stack_events.return_value = [event]
+        mock_cfn.return_value.describe_stack_events.return_value = (
+            mock.MagicMock(__iter__=lambda s: iter([event]), next_token=None))
 
         fmt = display.format_stack_events(stack)
 
@@ -60,3 +61,20 @@ class TestDisplay(unittest.TestCase):
         self.assertIn(event.resource_type, fmt)
         self.assertIn(event.logical_resource_id, fmt)
         self.assertIn(event.resource_status_reason, fmt)
+
+    def test_format_stacks_stream(self):
+        stacks = [mock.Mock(stack_name='stack_name_%s' % i,
+                            stack_status='stack_status',
+                            creation_time=datetime.datetime.fromtimestamp(0),
+                            template_description='template_description')
+                  for i in range(3)]
+
+        lines = display.format_stacks_stream(iter(stacks))
+        date = display.local_date(stacks[0].creation_time)
+
+        self.assertIn('Name', next(lines))
+        for stack, line in zip(stacks, lines):
+            self.assertIn(stack.stack_name, line)
+            self.assertIn('stack_status', line)
+            self.assertIn(date, line)
+            self.assertIn('template_description', line)
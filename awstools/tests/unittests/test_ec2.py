@@ -0,0 +1,173 @@
+import unittest
+
+import mock
+
+
+def make_instance(i, name=None, altname=None):
+    instance = mock.Mock(id='i-%08x' % i,
+                         private_ip_address='10.0.%s.%s' % (i // 256, i % 256),
+                         private_dns_name='ip-10-0-%s-%s.ec2.internal' % (
+                             i // 256, i % 256))
+    instance.tags = {}
+    if name is not None:
+        instance.tags['Name'] = name
+    if altname is not None:
+        instance.tags['altName'] = altname
+    return instance
+
+
+class TestFilterInstances(unittest.TestCase):
+
+    def setUp(self):
+        self.instances = [
+            make_instance(0, 'tt-api-production'),
+            make_instance(1, 'tt-api-stage', 'Legacy-Api'),
+            make_instance(2, 'tt-web-production'),
+            make_instance(3),
+            make_instance(300, 'TT-Api-Test'),
+        ]
+
+    def filter(self, *specifiers):
+        from awstools.utils.ec2 import filter_instances
+
+        return [i.id for i in filter_instances(specifiers, self.instances)]
+
+    def test_instance_id(self):
+        self.assertEqual(self.filter('i-00000002'), ['i-00000002'])
+        self.assertEqual(self.filter('i-0000000f'), [])
+
+    def test_private_ip(self):
+        self.assertEqual(self.filter('10.0.1.44'), ['i-0000012c'])
+
+    def test_private_dns_prefix(self):
+        self.assertEqual(self.filter('ip-10-0-0-1'),
+                         ['i-00000001'])
+        self.assertEqual(self.filter('ip-10-0-0-2.ec2.internal'),
+                         ['i-00000002'])
+
+    def test_name(self):
+        self.assertEqual(self.filter('tt-api-stage'), ['i-00000001'])
+        self.assertEqual(self.filter('TT-API-TEST'), ['i-0000012c'])
+        self.assertEqual(self.filter('legacy-api'), ['i-00000001'])
+        self.assertEqual(self.filter('tt-api'), [])
+
+    def test_wildcard(self):
+        self.assertEqual(self.filter('tt-api-*'),
+                         ['i-00000000', 'i-00000001', 'i-0000012c'])
+        self.assertEqual(self.filter('*-production'),
+                         ['i-00000000', 'i-00000002'])
+        self.assertEqual(self.filter('tt-[aw]??-production'),
+                         ['i-00000000', 'i-00000002'])
+
+    def test_untagged(self):
+        self.assertEqual(self.filter('*'), [i.id for i in self.instances])
+
+    def test_many_specifiers(self):
+        # In the order of the instances, without duplicates
+        self.assertEqual(
+            self.filter('tt-web-*', 'i-00000000', 'tt-api-production',
+                        '10.0.1.44', 'unknown'),
+            ['i-00000000', 'i-00000002', 'i-0000012c'])
+
+    def test_index(self):
+        from awstools.utils.ec2 import InstanceIndex, filter_instances
+
+        index = InstanceIndex(self.instances)
+
+        self.assertEqual(filter_instances(['tt-web-*'], index),
+                         [self.instances[2]])
+        self.assertEqual(filter_instances(['i-00000001'], index),
+                         [self.instances[1]])
+
+
+class TestGetRegion(unittest.TestCase):
+
+    def test_get_region(self):
+        from boto.regioninfo import RegionInfo
+        from awstools.utils.ec2 import get_region
+
+        self.assertEqual(get_region(mock.Mock(region=RegionInfo(
+            name='eu-west-1'))), 'eu-west-1')
+        self.assertEqual(get_region(mock.Mock(region='eu-west-1')),
+                         'eu-west-1')
+
+
+class TestFindInstances(unittest.TestCase):
+
+    def test_get_filters(self):
+        from awstools.utils.ec2 import get_filters
+
+        filters = get_filters(['i-0000002a', '10.0.3.4', 'ip-10-0-3-4',
+                               'i-0000002b'])
+
+        self.assertEqual(filters, [
+            {'instance-state-name': 'running',
+             'instance-id': ['i-0000002a', 'i-0000002b']},
+            {'instance-state-name': 'running',
+             'private-ip-address': ['10.0.3.4']},
+            {'instance-state-name': 'running',
+             'private-dns-name': ['ip-10-0-3-4*']},
+        ])
+
+    def test_get_filters_names(self):
+        from awstools.utils.ec2 import get_filters
+
+        # As typed: the tag filters are case sensitive
+        filters = get_filters(['Tt-Web', 'I-0000002A', 'tt-api'])
+
+        self.assertEqual(filters, [
+            {'instance-state-name': 'running',
+             'instance-id': ['i-0000002a']},
+            {'instance-state-name': 'running',
+             'tag:Name': ['Tt-Web', 'tt-api']},
+            {'instance-state-name': 'running',
+             'tag:altName': ['Tt-Web', 'tt-api']},
+        ])
+
+    def test_get_filters_name_pattern(self):
+        from awstools.utils.ec2 import get_filters
+
+        # Matched regardless of the case, among all the instances
+        filters = get_filters(['tt-api-*', 'i-0000002a', 'tt-web'])
+
+        self.assertEqual(filters, [{'instance-state-name': 'running'}])
+
+    @mock.patch('awstools.utils.ec2.get_instances')
+    def test_find_instances(self, mock_get_instances):
+        from awstools.utils.ec2 import find_instances
+
+        api = make_instance(0, 'tt-api')
+        legacy = make_instance(1, 'tt-web', 'tt-api-legacy')
+        ip = make_instance(2, 'tt-web')
+
+        def get_instances(region, filters):
+            if 'instance-id' in filters:
+                return [api]
+            return [ip]
+
+        mock_get_instances.side_effect = get_instances
+
+        instances = find_instances(['i-00000000', '10.0.0.2'], 'eu-west-1')
+
+        self.assertEqual(instances, [api, ip])
+        self.assertEqual(mock_get_instances.call_count, 2)
+        for call in mock_get_instances.call_args_list:
+            self.assertEqual(call[0][0], 'eu-west-1')
+
+        mock_get_instances.side_effect = None
+        mock_get_instances.return_value = [api, legacy, ip]
+
+        instances = find_instances(['TT-API*'], 'eu-west-1')
+
+        self.assertEqual(instances, [api, legacy])
+        mock_get_instances.assert_called_with(
+            'eu-west-1', {'instance-state-name': 'running'})
+
+    def test_unmatched_specifiers(self):
+        from awstools.utils.ec2 import unmatched_specifiers
+
+        instances = [make_instance(0, 'web-1'), make_instance(1, 'API-1')]
+
+        self.assertEqual(
+            unmatched_specifiers(['web-*', 'api-1', 'web-2'], instances),
+            ['web-2'])
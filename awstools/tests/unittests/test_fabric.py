@@ -0,0 +1,78 @@
+import unittest
+from ConfigParser import ConfigParser
+
+import mock
+
+
+def make_instance(i, **tags):
+    instance = mock.Mock(public_dns_name='host-%s' % i,
+                         placement='us-east-1a')
+    instance.tags = tags
+    return instance
+
+
+class TestRoledefs(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('awstools.utils.inventory.inventory')
+        self.inventory = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.inventory.find_tagged_instances.return_value = [
+            make_instance(0, Name=u'web'),
+            make_instance(1, Name=u'web', altName=u'front'),
+            make_instance(2, **{'aws:cloudformation:stack-name': u'stack'}),
+        ]
+
+        patcher = mock.patch('awstools.commands.configure_inventory')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.config = ConfigParser()
+        patcher = mock.patch('awstools.read_config',
+                             return_value=self.config)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_populate_roledefs(self):
+        from awstools.fabric import populate_roledefs
+
+        roledefs = populate_roledefs({'Environment': 'production'})
+
+        self.assertEqual(sorted(roledefs['web']), ['host-0', 'host-1'])
+        self.assertEqual(sorted(roledefs['web:us-east-1a']),
+                         ['host-0', 'host-1'])
+        self.assertEqual(roledefs['stack'], ['host-2'])
+        self.assertNotIn('front', roledefs)
+        self.inventory.find_tagged_instances.assert_called_once_with(
+            {'Environment': 'production'}, stale=False)
+
+    def test_role_templates(self):
+        from awstools.fabric import populate_roledefs
+
+        self.config.add_section('fabric')
+        self.config.set('fabric', 'roletemplates',
+                        '\n%(altName)s\n%(Name)s-%(altName)s')
+
+        roledefs = populate_roledefs()
+
+        self.assertEqual(roledefs, {'front': ['host-1'],
+                                    'front:us-east-1a': ['host-1'],
+                                    'web-front': ['host-1'],
+                                    'web-front:us-east-1a': ['host-1']})
+
+    def test_invalid_template(self):
+        from awstools.fabric import RoleTemplate
+
+        self.assertRaises(ValueError, RoleTemplate, u'%(Name)')
+
+    def test_lazy_roledefs(self):
+        from awstools.fabric import lazy_roledefs
+
+        roledefs = lazy_roledefs()
+        self.assertIsInstance(roledefs, dict)
+        self.assertFalse(self.inventory.find_tagged_instances.called)
+
+        self.assertIn('web', roledefs)
+        self.assertEqual(roledefs['stack'], ['host-2'])
+        self.assertEqual(len(roledefs), 4)
+        self.assertEqual(self.inventory.find_tagged_instances.call_count, 1)
@@ -0,0 +1,207 @@
+import fcntl
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+
+def make_instance(i):
+    instance = mock.Mock(id='i-%08x' % i, state='running',
+                         private_ip_address='10.0.0.%s' % i,
+                         private_dns_name='ip-10-0-0-%s.ec2.internal' % i,
+                         ip_address='54.0.0.%s' % i,
+                         public_dns_name='ec2-54-0-0-%s.amazonaws.com' % i,
+                         placement='us-east-1a')
+    instance.tags = {'Name': 'host-%s' % i}
+    return instance
+
+
+class TestInventory(unittest.TestCase):
+
+    def setUp(self):
+        from awstools.utils.inventory import Inventory
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.inventory = Inventory()
+        self.inventory.configure(ttl=60, directory=self.directory)
+
+        patcher = mock.patch('awstools.utils.inventory.ec2.get_instances')
+        self.get_instances = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.get_instances.return_value = [make_instance(i)
+                                           for i in range(3)]
+
+        patcher = mock.patch.object(self.inventory, 'refresh_in_background')
+        self.refresh_in_background = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_disabled(self):
+        from awstools.utils.inventory import Inventory
+
+        inventory = Inventory()
+
+        self.assertEqual(inventory.get_instances('us-west-2'),
+                         self.get_instances.return_value)
+        self.get_instances.assert_called_once_with('us-west-2')
+
+    def test_cached(self):
+        first = self.inventory.get_instances()
+        cached = self.inventory.get_instances()
+
+        self.assertEqual(self.get_instances.call_count, 1)
+        self.assertFalse(self.refresh_in_background.called)
+        self.assertEqual([i.id for i in cached], [i.id for i in first])
+        self.assertEqual(cached[1].tags, {'Name': 'host-1'})
+        self.assertEqual(cached[1].private_ip_address, '10.0.0.1')
+        self.assertEqual(cached[1].placement, 'us-east-1a')
+        self.assertEqual(cached[1].region, 'us-east-1')
+
+    def test_stale(self):
+        self.inventory.get_instances()
+
+        later = time.time() + 61
+        with mock.patch('awstools.utils.cache.time.time') as mock_time:
+            mock_time.return_value = later
+            stale = self.inventory.get_instances()
+
+        self.assertEqual(len(stale), 3)
+        self.assertEqual(self.get_instances.call_count, 1)
+        self.refresh_in_background.assert_called_once_with('us-east-1')
+
+    def test_not_stale(self):
+        self.inventory.get_instances()
+
+        later = time.time() + 61
+        with mock.patch('awstools.utils.cache.time.time') as mock_time:
+            mock_time.return_value = later
+            self.inventory.get_instances(stale=False)
+            fresh = self.inventory.get_instances(stale=False)
+
+        self.assertEqual(len(fresh), 3)
+        self.assertEqual(self.get_instances.call_count, 2)
+        self.assertFalse(self.refresh_in_background.called)
+
+    def test_refresh(self):
+        self.inventory.get_instances()
+        self.inventory.refresh = True
+        self.inventory.get_instances()
+
+        self.assertEqual(self.get_instances.call_count, 2)
+
+    def test_all_regions(self):
+        self.inventory.configure(ttl=60, directory=self.directory,
+                                 regions=['us-east-1', 'eu-west-1'])
+        self.get_instances.side_effect = lambda region: [
+            make_instance(0 if region == 'us-east-1' else 1)]
+
+        instances = self.inventory.get_all_instances()
+        self.assertEqual([i.id for i in instances],
+                         ['i-00000000', 'i-00000001'])
+
+        cached = self.inventory.get_all_instances()
+        self.assertEqual([(i.id, i.region) for i in cached],
+                         [('i-00000000', 'us-east-1'),
+                          ('i-00000001', 'eu-west-1')])
+        self.assertEqual(self.get_instances.call_count, 2)
+
+        self.inventory.fetch_all()
+        self.assertEqual(self.get_instances.call_count, 4)
+
+    @mock.patch('awstools.utils.inventory.ec2.find_instances')
+    def test_find_instances(self, mock_find_instances):
+        mock_find_instances.return_value = [make_instance(1)]
+
+        self.assertFalse(self.inventory.is_cached())
+        instances = self.inventory.find_instances(['i-00000001'])
+
+        self.assertEqual(instances, mock_find_instances.return_value)
+        mock_find_instances.assert_called_once_with(['i-00000001'],
+                                                    'us-east-1')
+        self.refresh_in_background.assert_called_once_with('us-east-1')
+        self.assertFalse(self.get_instances.called)
+
+        self.inventory.get_instances()
+        self.assertTrue(self.inventory.is_cached())
+
+    def test_find_instances_names(self):
+        # All the instances are requested: they make the inventory
+        instances = self.inventory.find_instances(['HOST-1*', 'i-00000002'])
+
+        self.assertEqual([i.id for i in instances],
+                         ['i-00000001', 'i-00000002'])
+        self.get_instances.assert_called_once_with('us-east-1')
+        self.assertFalse(self.refresh_in_background.called)
+        self.assertTrue(self.inventory.is_cached())
+
+    def test_find_tagged_instances(self):
+        tags = {'Name': 'host-[12]'}
+
+        instances = self.inventory.find_tagged_instances(tags)
+        self.get_instances.assert_called_once_with(
+            'us-east-1', {'instance-state-name': 'running',
+                          'tag:Name': 'host-[12]'})
+        self.refresh_in_background.assert_called_once_with('us-east-1')
+        self.assertEqual(len(instances), 3)
+
+        self.inventory.get_instances()
+        cached = self.inventory.find_tagged_instances(tags)
+        self.assertEqual([i.id for i in cached], ['i-00000001', 'i-00000002'])
+
+    def test_find_tagged_instances_not_stale(self):
+        tags = {'Name': 'host-[12]'}
+        self.inventory.get_instances()
+
+        cached = self.inventory.find_tagged_instances(tags, stale=False)
+        self.assertEqual([i.id for i in cached], ['i-00000001', 'i-00000002'])
+        self.assertEqual(self.get_instances.call_count, 1)
+
+        later = time.time() + 61
+        with mock.patch('awstools.utils.cache.time.time') as mock_time:
+            mock_time.return_value = later
+            self.inventory.find_tagged_instances(tags, stale=False)
+            self.inventory.find_tagged_instances({}, stale=False)
+
+        self.get_instances.assert_has_calls([
+            mock.call('us-east-1', {'instance-state-name': 'running',
+                                    'tag:Name': 'host-[12]'}),
+            mock.call('us-east-1')])
+
+    def test_refresh_once(self):
+        self.inventory.get_instances()
+        lockpath = self.inventory._file('us-east-1').path + '.refresh'
+
+        with open(lockpath, 'a') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            self.assertFalse(self.inventory.refresh_once())
+        self.assertEqual(self.get_instances.call_count, 1)
+
+        self.assertTrue(self.inventory.refresh_once())
+        self.assertEqual(self.get_instances.call_count, 2)
+
+
+class TestCompletionList(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        patcher = mock.patch('awstools.utils.completion.COMPLETION_FILE',
+                             self.directory + '/completion')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_write_when_changed(self):
+        from awstools.utils.completion import (read_completion_list,
+                                               write_completion_list)
+
+        self.assertTrue(write_completion_list(['b', 'a', 'b']))
+        self.assertEqual(read_completion_list(), ['a', 'b'])
+
+        self.assertFalse(write_completion_list(['a', 'b']))
+
+        self.assertTrue(write_completion_list(['a', 'c']))
+        self.assertEqual(read_completion_list(), ['a', 'c'])
@@ -0,0 +1,66 @@
+import threading
+import time
+import unittest
+
+from awstools.utils.pool import ordered_map, wait
+
+
+class TestOrderedMap(unittest.TestCase):
+
+    def test_order(self):
+        def slow_first(item):
+            time.sleep(0.05 if item == 0 else 0)
+            return item * 2
+
+        result = list(ordered_map(slow_first, range(10), jobs=4))
+
+        self.assertEqual(result, [i * 2 for i in range(10)])
+
+    def test_concurrency(self):
+        threads = set()
+
+        def func(item):
+            threads.add(threading.current_thread().name)
+            time.sleep(0.01)
+            return item
+
+        list(ordered_map(func, range(8), jobs=4))
+
+        self.assertEqual(len(threads), 4)
+
+    def test_sequential(self):
+        threads = set()
+
+        def func(item):
+            threads.add(threading.current_thread().name)
+
+        list(ordered_map(func, range(4), jobs=1))
+
+        self.assertEqual(threads, set([threading.current_thread().name]))
+
+    def test_error(self):
+        def func(item):
+            if item == 2:
+                raise ValueError(item)
+            return item
+
+        results = ordered_map(func, range(4), jobs=2)
+
+        self.assertEqual(next(results), 0)
+        self.assertEqual(next(results), 1)
+        self.assertRaises(ValueError, next, results)
+
+
+class TestWait(unittest.TestCase):
+
+    def test_wait(self):
+        calls = []
+
+        def get(timeout):
+            calls.append(timeout)
+            if len(calls) < 3:
+                raise KeyError()
+            return 'done'
+
+        self.assertEqual(wait(get, KeyError), 'done')
+        self.assertEqual(calls, [1, 1, 1])
@@ -0,0 +1,92 @@
+import json
+import StringIO
+import time
+import unittest
+
+import mock
+from boto.exception import BotoServerError
+
+from awstools.utils.profiling import Profiler, percentile
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = Profiler()
+        self.profiler.configure(enabled=True)
+        self.listener = self.profiler.listener('cloudformation', None)
+
+    def test_disabled(self):
+        profiler = Profiler()
+        listener = profiler.listener('cloudformation', None)
+
+        listener(('ListStacks', {}), {}, mock.Mock(), None, 0, time.time())
+
+        self.assertEqual(profiler.spans, [])
+
+    def test_span(self):
+        response = mock.Mock(status=200)
+        response.read.return_value = '{"stacks": []}'
+
+        self.listener(('ListStacks', {'NextToken': 'abc'}), {}, response,
+                      None, 2, time.time() - 1)
+
+        span = self.profiler.spans[0]
+        self.assertEqual(span['service'], 'cloudformation')
+        self.assertEqual(span['operation'], 'ListStacks')
+        self.assertTrue(span['page'])
+        self.assertEqual(span['status'], 200)
+        self.assertEqual(span['bytes'], 14)
+        self.assertEqual(span['retries'], 2)
+        self.assertGreaterEqual(span['latency'], 1)
+
+    def test_span_error(self):
+        body = '<Error><Code>ValidationError</Code></Error>'
+        error = BotoServerError(400, 'Bad Request', body)
+
+        self.listener((), {'action': 'DescribeStacks'}, None, error, 0,
+                      time.time())
+
+        span = self.profiler.spans[0]
+        self.assertEqual(span['operation'], 'DescribeStacks')
+        self.assertFalse(span['page'])
+        self.assertEqual(span['status'], 400)
+        self.assertEqual(span['bytes'], len(body))
+
+    def test_summary(self):
+        for i, latency in enumerate([0.1, 0.2, 0.3, 0.4]):
+            self.profiler.record({
+                'service': 'cloudformation', 'operation': 'ListStacks',
+                'page': i > 0, 'bytes': 100, 'latency': latency,
+                'retries': 1})
+        self.profiler.record({
+            'service': 'elb', 'operation': 'DescribeInstanceHealth',
+            'page': False, 'bytes': 10, 'latency': 0.05, 'retries': 0})
+
+        rows = self.profiler.summary()
+
+        self.assertEqual([r['operation'] for r in rows],
+                         ['ListStacks', 'DescribeInstanceHealth'])
+        self.assertEqual(rows[0]['calls'], 1)
+        self.assertEqual(rows[0]['pages'], 4)
+        self.assertEqual(rows[0]['retries'], 4)
+        self.assertEqual(rows[0]['bytes'], 400)
+        self.assertEqual(rows[0]['p50'], 0.2)
+        self.assertEqual(rows[0]['p95'], 0.4)
+
+    def test_dump(self):
+        self.profiler.record({'operation': 'ListStacks', 'latency': 0.1})
+        self.profiler.record({'operation': 'DescribeStacks', 'latency': 0.2})
+
+        fp = StringIO.StringIO()
+        self.profiler.dump(fp)
+
+        lines = fp.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1])['operation'], 'DescribeStacks')
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 0.5))
+        self.assertEqual(percentile([1], 0.95), 1)
+        self.assertEqual(percentile(range(1, 101), 0.5), 50)
+        self.assertEqual(percentile(range(1, 101), 0.95), 95)
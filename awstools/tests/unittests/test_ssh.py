@@ -0,0 +1,123 @@
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+import mock
+
+
+class TestRunCommands(unittest.TestCase):
+
+    def setUp(self):
+        # The "address" is run as a shell script, in place of ssh
+        patcher = mock.patch('awstools.utils.ssh.SSH', ['sh', '-c'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_commands(self, hosts, **kwargs):
+        from awstools.utils.ssh import run_commands
+
+        return list(run_commands(hosts, [], **kwargs))
+
+    def test_output_and_status(self):
+        events = self.run_commands([('a', 'echo one; echo two; exit 3'),
+                                    ('b', 'echo three')], jobs=2)
+
+        self.assertEqual([e for e in events if e[0] == 'a'],
+                         [('a', 'one', None), ('a', 'two', None),
+                          ('a', None, 3)])
+        self.assertEqual([e for e in events if e[0] == 'b'],
+                         [('b', 'three', None), ('b', None, 0)])
+
+    def test_parallel(self):
+        start = time.time()
+        events = self.run_commands([(str(i), 'sleep 0.3') for i in range(4)],
+                                   jobs=4)
+
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(sorted(events),
+                         [(str(i), None, 0) for i in range(4)])
+
+    def test_timeout(self):
+        from awstools.utils.ssh import TIMEOUT
+
+        start = time.time()
+        events = self.run_commands([('slow', 'echo started; exec sleep 10'),
+                                    ('fast', 'true')], jobs=2, timeout=0.5)
+
+        self.assertLess(time.time() - start, 5)
+        self.assertIn(('slow', 'started', None), events)
+        self.assertIn(('slow', None, TIMEOUT), events)
+        self.assertIn(('fast', None, 0), events)
+
+    @mock.patch('awstools.utils.ssh._run_command')
+    def test_error(self, mock_run_command):
+        mock_run_command.side_effect = ValueError('broken')
+
+        events = self.run_commands([('a', 'true'), ('b', 'true')], jobs=2)
+
+        self.assertIn(('a', 'Failed to run the command: broken', None),
+                      events)
+        self.assertIn(('a', None, 255), events)
+        self.assertIn(('b', None, 255), events)
+
+
+class TestMultiplexer(unittest.TestCase):
+
+    def setUp(self):
+        from awstools.utils.ssh import Multiplexer
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.multiplexer = Multiplexer()
+        self.multiplexer.configure(enabled=True, directory=self.directory,
+                                   persist='1m')
+
+    def make_socket(self, name):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(os.path.join(self.directory, 'ssh', name))
+        sock.listen(1)
+        return sock
+
+    def test_disabled(self):
+        from awstools.utils.ssh import Multiplexer
+
+        multiplexer = Multiplexer()
+
+        self.assertEqual(multiplexer.options(), [])
+        self.assertEqual(multiplexer.warm_up(['host']), [])
+
+    def test_options(self):
+        self.assertEqual(self.multiplexer.options(), [
+            '-o', 'ControlMaster=auto',
+            '-o', 'ControlPath=%s/ssh/%%C' % self.directory,
+            '-o', 'ControlPersist=1m'])
+
+    def test_clean(self):
+        self.multiplexer.prepare()
+
+        # Named after a hash of the connection (%C)
+        live, stale = 'a' * 40, 'b' * 40
+        listening = self.make_socket(live)
+        self.addCleanup(listening.close)
+        self.make_socket(stale).close()
+        # Left by the former control path
+        self.make_socket('user@host:22').close()
+        open(os.path.join(self.directory, 'ssh', 'file'), 'w').close()
+
+        self.assertEqual(sorted(self.multiplexer.clean()),
+                         [stale, 'user@host:22'])
+        self.assertEqual(sorted(os.listdir(self.multiplexer.directory)),
+                         [live, 'file'])
+
+    @mock.patch('awstools.utils.ssh.SSH', ['sh', '-c'])
+    @mock.patch('awstools.utils.ssh.Multiplexer.options')
+    def test_warm_up(self, mock_options):
+        # The "address" is run as a shell script, the options are ignored
+        mock_options.return_value = []
+
+        self.assertEqual(self.multiplexer.warm_up(['exit 0', 'exit 255']),
+                         ['exit 255'])
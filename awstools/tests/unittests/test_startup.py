@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+# Slow to import, only loaded by the commands needing them
+HEAVY_MODULES = ['boto', 'argh', 'pkg_resources', 'yaml', 'arrow',
+                 'prettytable']
+
+REPORT_MODULES = """
+import json, sys
+sys.stderr.write(json.dumps(sorted(sys.modules)))
+"""
+
+
+class TestStartup(unittest.TestCase):
+
+    """Check the modules imported at the start of the commands.
+
+    Run in a new interpreter, so the modules imported by the other tests
+    don't count.
+    """
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.home)
+
+    def imported_modules(self, code):
+        env = dict(os.environ, HOME=self.home)
+        process = subprocess.Popen(
+            [sys.executable, '-c', code + REPORT_MODULES],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        stdout, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0, stderr)
+        return set(json.loads(stderr.splitlines()[-1]))
+
+    def assertNotImported(self, modules, names):
+        self.assertEqual(sorted(modules & set(names)), [])
+
+    def test_ec2ssh_completion_list(self):
+        modules = self.imported_modules(
+            "import sys\n"
+            "sys.argv = ['ec2ssh', '--completion-list']\n"
+            "from awstools import cli\n"
+            "cli.ec2ssh()\n")
+
+        self.assertNotImported(modules, HEAVY_MODULES)
+
+    def test_ec2ssh(self):
+        modules = self.imported_modules("import awstools.commands.ec2ssh\n")
+
+        self.assertNotImported(modules, ['boto', 'pkg_resources', 'yaml',
+                                         'arrow', 'prettytable'])
+
+    def test_cfn(self):
+        modules = self.imported_modules(
+            "import awstools.commands.cloudformation\n"
+            "import awstools.commands.cfnautoscale\n")
+
+        self.assertNotImported(modules, ['boto', 'pkg_resources', 'yaml',
+                                         'arrow', 'prettytable'])
+
+    def test_version(self):
+        modules = self.imported_modules(
+            "from awstools.commands import get_base_parser\n"
+            "get_base_parser()\n")
+
+        self.assertNotImported(modules, ['pkg_resources'])
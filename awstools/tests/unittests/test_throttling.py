@@ -0,0 +1,146 @@
+import socket
+import unittest
+
+import mock
+from boto.exception import BotoServerError
+
+from awstools.utils.throttling import TokenBucket, retrying, install
+
+
+THROTTLING_BODY = ('{"Error":{"Code":"Throttling",'
+                   '"Message":"Rate exceeded","Type":"Sender"}}')
+
+
+def make_response(status, body=''):
+    return mock.Mock(status=status, read=mock.Mock(return_value=body))
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        clock = mock.Mock(return_value=100)
+        sleep = mock.Mock()
+        bucket = TokenBucket(rate=2, capacity=3, sleep=sleep, clock=clock)
+
+        for i in range(3):
+            bucket.acquire()
+        self.assertFalse(sleep.called)
+
+        bucket.acquire()
+        sleep.assert_called_once_with(0.5)
+
+        bucket.acquire()
+        sleep.assert_called_with(1.0)
+
+    def test_refill(self):
+        clock = mock.Mock(return_value=100)
+        sleep = mock.Mock()
+        bucket = TokenBucket(rate=2, capacity=3, sleep=sleep, clock=clock)
+
+        for i in range(3):
+            bucket.acquire()
+
+        clock.return_value = 110
+        for i in range(3):
+            bucket.acquire()
+        self.assertFalse(sleep.called)
+
+
+class TestRetrying(unittest.TestCase):
+
+    def setUp(self):
+        self.bucket = mock.Mock()
+        self.backoff = mock.Mock()
+        self.make_request = mock.Mock()
+
+    def wrap(self, retries=3):
+        return retrying(self.make_request, self.bucket, retries=retries,
+                        transport_errors=(socket.error,),
+                        backoff_factory=lambda: self.backoff)
+
+    def test_success(self):
+        response = make_response(200, '{}')
+        self.make_request.return_value = response
+
+        self.assertIs(self.wrap()('DescribeStacks', {}), response)
+
+        self.make_request.assert_called_once_with('DescribeStacks', {})
+        self.assertEqual(self.bucket.acquire.call_count, 1)
+        self.assertFalse(response.read.called)
+        self.assertFalse(self.backoff.sleep.called)
+
+    def test_throttling(self):
+        response = make_response(200, '{}')
+        self.make_request.side_effect = [make_response(400, THROTTLING_BODY),
+                                         make_response(400, THROTTLING_BODY),
+                                         response]
+
+        self.assertIs(self.wrap()('DescribeStacks', {}), response)
+
+        self.assertEqual(self.bucket.acquire.call_count, 3)
+        self.assertEqual(self.backoff.sleep.call_count, 2)
+
+    def test_client_error(self):
+        response = make_response(400, '{"Error":{"Code":"ValidationError"}}')
+        self.make_request.return_value = response
+
+        self.assertIs(self.wrap()('DescribeStacks', {}), response)
+        self.assertFalse(self.backoff.sleep.called)
+
+    def test_server_errors(self):
+        response = make_response(200, '{}')
+        self.make_request.side_effect = [
+            BotoServerError(503, 'Service Unavailable'),
+            socket.error('reset'),
+            response]
+
+        self.assertIs(self.wrap()('DescribeStacks', {}), response)
+        self.assertEqual(self.backoff.sleep.call_count, 2)
+
+    def test_not_retryable_error(self):
+        self.make_request.side_effect = BotoServerError(403, 'Forbidden')
+
+        self.assertRaises(BotoServerError, self.wrap(), 'DescribeStacks', {})
+        self.assertEqual(self.make_request.call_count, 1)
+
+    def test_give_up(self):
+        throttled = make_response(400, THROTTLING_BODY)
+        self.make_request.return_value = throttled
+
+        self.assertIs(self.wrap(retries=2)('DescribeStacks', {}), throttled)
+        self.assertEqual(self.make_request.call_count, 3)
+
+        self.make_request.side_effect = socket.error('reset')
+        self.assertRaises(socket.error, self.wrap(), 'DescribeStacks', {})
+
+    def test_listener(self):
+        listener = mock.Mock()
+        response = make_response(200, '{}')
+        self.make_request.side_effect = [make_response(400, THROTTLING_BODY),
+                                         response]
+        make_request = retrying(self.make_request, self.bucket,
+                                backoff_factory=lambda: self.backoff,
+                                listener=listener)
+
+        make_request('DescribeStacks', {})
+
+        listener.assert_called_once_with(('DescribeStacks', {}), {},
+                                         response, None, 1, mock.ANY)
+
+
+class TestInstall(unittest.TestCase):
+
+    def test_install(self):
+        import boto
+
+        connection = boto.connect_cloudformation('key', 'secret')
+        original = connection.make_request
+
+        with mock.patch.object(connection, 'make_request') as m_request:
+            m_request.return_value = make_response(200, '{}')
+            install(connection, 'cloudformation')
+
+            self.assertEqual(connection.num_retries, 0)
+            self.assertIsNot(connection.make_request, original)
+            connection.make_request('DescribeStacks', {})
+            m_request.assert_called_once_with('DescribeStacks', {})
@@ -0,0 +1,46 @@
+import random
+import time
+
+
+class WaitTimeout(Exception):
+    pass
+
+
+class Backoff(object):
+
+    """Exponentially growing delays with jitter, up to an optional deadline.
+
+    Each delay is randomly shortened by up to `jitter` (a ratio) so that
+    many clients polling together spread their calls.
+    """
+
+    def __init__(self, initial=2, maximum=30, factor=2, jitter=0.5,
+                 timeout=None, sleep=time.sleep, clock=time.time):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self._sleep = sleep
+        self._clock = clock
+        self.deadline = clock() + timeout if timeout is not None else None
+        self.reset()
+
+    def reset(self):
+        self.delay = self.initial
+
+    def next_delay(self):
+        delay = self.delay * (1 - self.jitter * random.random())
+        self.delay = min(self.delay * self.factor, self.maximum)
+        return delay
+
+    def sleep(self):
+        """Sleep for the next delay. Raise WaitTimeout past the deadline."""
+        delay = self.next_delay()
+
+        if self.deadline is not None:
+            remaining = self.deadline - self._clock()
+            if remaining <= 0:
+                raise WaitTimeout("Deadline exceeded")
+            delay = min(delay, remaining)
+
+        self._sleep(delay)
@@ -0,0 +1,115 @@
+import errno
+import fcntl
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+CACHE_DIR = '~/.cache/awstools'
+
+
+class FileCache(object):
+
+    """A JSON document stored in the cache directory for ttl seconds.
+
+    Writes are atomic (temporary file + rename) so readers never need a lock.
+    Writers and invalidations are serialized with a lock file, and the mtime
+    of a stamp file records the last invalidation.
+    """
+
+    def __init__(self, name, ttl, directory=CACHE_DIR):
+        self.directory = os.path.expanduser(directory)
+        self.path = os.path.join(self.directory, name + '.json')
+        self.lockpath = self.path + '.lock'
+        self.stamppath = self.path + '.invalidated'
+        self.ttl = ttl
+
+    def __repr__(self):
+        return '<FileCache %s>' % self.path
+
+    @contextmanager
+    def lock(self):
+        _makedirs(self.directory)
+        with open(self.lockpath, 'a') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def get(self):
+        """Return the cached data, None if missing or expired."""
+        data, expired = self.get_stale()
+        if expired:
+            return None
+        return data
+
+    def get_stale(self):
+        """Return the cached data even if expired, and whether it expired.
+
+        Return (None, True) if missing.
+        """
+        try:
+            with open(self.path, 'rb') as fp:
+                document = json.load(fp)
+        except (IOError, ValueError):
+            return None, True
+
+        return (document['data'],
+                time.time() - document['timestamp'] > self.ttl)
+
+    def set(self, data, since=None):
+        """Store the data unless the cache was invalidated after `since`.
+
+        `since` is the time when the data started to be fetched: a stack
+        updated meanwhile would be stored with a stale state otherwise.
+        """
+        document = {'timestamp': time.time(), 'data': data}
+
+        with self.lock():
+            if since is not None and self.invalidated_at() > since:
+                return False
+
+            atomic_write(self.path, json.dumps(document))
+        return True
+
+    def invalidate(self):
+        with self.lock():
+            try:
+                os.unlink(self.path)
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+            with open(self.stamppath, 'a'):
+                os.utime(self.stamppath, None)
+
+    def invalidated_at(self):
+        try:
+            return os.stat(self.stamppath).st_mtime
+        except OSError:
+            return 0
+
+
+def atomic_write(path, content):
+    """Replace a file by a temporary file: readers see the old or new one."""
+    directory = os.path.dirname(path)
+    _makedirs(directory)
+
+    fd, tmppath = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(content)
+        os.rename(tmppath, path)
+    finally:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as error:
+        if error.errno != errno.EEXIST:
+            raise
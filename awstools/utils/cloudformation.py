@@ -1,34 +1,245 @@
-import boto
+import re
+import time
+from datetime import datetime
 
+from awstools.utils import connections
+from awstools.utils.backoff import Backoff
+from awstools.utils.cache import FileCache, CACHE_DIR
+from awstools.utils.pool import ordered_map, DEFAULT_JOBS
 
+
+# All the stack statuses: the ones of boto are outdated
+STACK_STATUSES = [
+    "CREATE_IN_PROGRESS", "CREATE_FAILED", "CREATE_COMPLETE",
+    "ROLLBACK_IN_PROGRESS", "ROLLBACK_FAILED", "ROLLBACK_COMPLETE",
+    "DELETE_IN_PROGRESS", "DELETE_FAILED", "DELETE_COMPLETE",
+    "UPDATE_IN_PROGRESS", "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS",
+    "UPDATE_COMPLETE", "UPDATE_FAILED",
+    "UPDATE_ROLLBACK_IN_PROGRESS", "UPDATE_ROLLBACK_FAILED",
+    "UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS",
+    "UPDATE_ROLLBACK_COMPLETE",
+    "REVIEW_IN_PROGRESS",
+    "IMPORT_IN_PROGRESS", "IMPORT_COMPLETE",
+    "IMPORT_ROLLBACK_IN_PROGRESS", "IMPORT_ROLLBACK_FAILED",
+    "IMPORT_ROLLBACK_COMPLETE",
+]
 STACK_IGNORE_STATUS = ["DELETE_COMPLETE"]
+STACK_DEFAULT_STATUS = [s for s in STACK_STATUSES
+                        if s not in STACK_IGNORE_STATUS]
+STACK_IN_PROGRESS_STATUS = [s for s in STACK_STATUSES
+                            if s.endswith('_IN_PROGRESS')]
+STACK_SUCCESS_STATUS = ["CREATE_COMPLETE", "UPDATE_COMPLETE",
+                        "DELETE_COMPLETE"]
+STACK_RESOURCE_TYPE = 'AWS::CloudFormation::Stack'
 
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
 
-def find_stacks(pattern=None, findall=False):
-    """Return a list of stacks matching a pattern."""
-    cfn = boto.connect_cloudformation()
-    stacks = []
+RE_STACK_NAME = re.compile(r'^[a-zA-Z][-a-zA-Z0-9]*$')
+
+
+class StackCache(object):
+
+    """On-disk cache of the stack summaries and descriptions.
+
+    Disabled until configured with a positive ttl (in seconds).
+    With refresh, the cache is written but never read.
+    """
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self, ttl=0, describe=False, refresh=False,
+                  directory=CACHE_DIR):
+        self.ttl = ttl
+        self.describe = describe
+        self.refresh = refresh
+        self.directory = directory
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _file(self, name):
+        return FileCache(name, self.ttl, directory=self.directory)
+
+    def get_summaries(self):
+        if not self.enabled or self.refresh:
+            return None
+        data = self._file('stacks').get()
+        if data is None:
+            return None
+        return [_load_summary(d) for d in data]
+
+    def set_summaries(self, stacks, since):
+        if self.enabled:
+            self._file('stacks').set([_dump_summary(s) for s in stacks],
+                                     since=since)
+
+    def get_stack(self, stack_name):
+        if not self.enabled or not self.describe or self.refresh:
+            return None
+        data = self._file('stack-%s' % stack_name).get()
+        if data is None:
+            return None
+        return _load_stack(data)
+
+    def set_stack(self, stack, since):
+        if self.enabled and self.describe:
+            self._file('stack-%s' % stack.stack_name).set(_dump_stack(stack),
+                                                          since=since)
+
+    def invalidate(self, stack_name):
+        """Forget a stack, to call after any change made on it."""
+        if self.enabled:
+            self._file('stacks').invalidate()
+            self._file('stack-%s' % stack_name).invalidate()
+
+
+stack_cache = StackCache()
+
+
+def _dump_date(date):
+    return date.strftime(DATE_FORMAT) if date else None
+
+
+def _load_date(value):
+    return datetime.strptime(value, DATE_FORMAT) if value else None
+
+
+def _dump_summary(stack):
+    return {
+        'stack_id': stack.stack_id,
+        'stack_name': stack.stack_name,
+        'stack_status': stack.stack_status,
+        'creation_time': _dump_date(stack.creation_time),
+        'deletion_time': _dump_date(stack.deletion_time),
+        'template_description': stack.template_description,
+    }
+
+
+def _load_summary(data):
+    from boto.cloudformation.stack import StackSummary
+
+    stack = StackSummary()
+    stack.__dict__.update(data)
+    stack.creation_time = _load_date(data['creation_time'])
+    stack.deletion_time = _load_date(data['deletion_time'])
+    return stack
+
+
+def _dump_stack(stack):
+    return {
+        'stack_id': stack.stack_id,
+        'stack_name': stack.stack_name,
+        'stack_status': stack.stack_status,
+        'stack_status_reason': stack.stack_status_reason,
+        'creation_time': _dump_date(stack.creation_time),
+        'description': stack.description,
+        'disable_rollback': stack.disable_rollback,
+        'timeout_in_minutes': stack.timeout_in_minutes,
+        'notification_arns': [n.value for n in stack.notification_arns],
+        'capabilities': [c.value for c in stack.capabilities],
+        'parameters': [(p.key, p.value) for p in stack.parameters],
+        'outputs': [(o.key, o.value, o.description) for o in stack.outputs],
+        'tags': dict(stack.tags),
+    }
+
+
+def _load_stack(data):
+    from boto.cloudformation.stack import (Stack, Parameter, Output,
+                                           Capability, NotificationARN, Tag)
+
+    def build(cls, **attrs):
+        obj = cls()
+        obj.__dict__.update(attrs)
+        return obj
+
+    stack = Stack(connection=connections.cloudformation())
+    for attr in ['stack_id', 'stack_name', 'stack_status',
+                 'stack_status_reason', 'description', 'disable_rollback',
+                 'timeout_in_minutes']:
+        setattr(stack, attr, data[attr])
+    stack.creation_time = _load_date(data['creation_time'])
+    stack.notification_arns = [build(NotificationARN, value=v)
+                               for v in data['notification_arns']]
+    stack.capabilities = [build(Capability, value=v)
+                          for v in data['capabilities']]
+    stack.parameters = [build(Parameter, key=k, value=v)
+                        for k, v in data['parameters']]
+    stack.outputs = [build(Output, key=k, value=v, description=d)
+                     for k, v, d in data['outputs']]
+    stack.tags = Tag()
+    stack.tags.update(data['tags'])
+    return stack
+
+
+def find_stacks(pattern=None, findall=False, statuses=None):
+    """Yield the stacks matching a pattern, page after page.
+
+    The status filtering is done by the API: unless findall is set, the
+    stacks in STACK_IGNORE_STATUS are never downloaded.
+    Each page is sorted by stack name but the whole result is not.
+    Without findall nor statuses, the stacks are read from the stack_cache.
+    """
+    if statuses is None and not findall:
+        stacks = _list_stacks_cached()
+    else:
+        stacks = _list_stacks(statuses)
+
+    for stack in stacks:
+        if not pattern or pattern in stack.stack_name:
+            yield stack
+
+
+def _list_stacks(statuses):
+    cfn = connections.cloudformation()
     next_token = None
     while True:
-        result = cfn.list_stacks(next_token=next_token)
-        stacks.extend(result)
+        result = cfn.list_stacks(stack_status_filters=statuses,
+                                 next_token=next_token)
+
+        for stack in sorted(result, key=lambda k: k.stack_name):
+            yield stack
+
         next_token = result.next_token
         if next_token is None:
             break
 
-    if pattern:
-        stacks = [s for s in stacks if pattern in s.stack_name]
 
-    if not findall:
-        stacks = [s for s in stacks
-                  if s.stack_status not in STACK_IGNORE_STATUS]
+def _list_stacks_cached():
+    cached = stack_cache.get_summaries()
+    if cached is not None:
+        for stack in cached:
+            yield stack
+        return
+
+    since = time.time()
+    stacks = []
+    for stack in _list_stacks(STACK_DEFAULT_STATUS):
+        if stack_cache.enabled:
+            stacks.append(stack)
+        yield stack
 
-    return sorted(stacks, key=lambda k: k.stack_name)
+    # Only reached when the listing was entirely consumed
+    stack_cache.set_summaries(stacks, since)
 
 
 def find_one_stack(pattern, findall=False, summary=True):
-    """Return the result is there is only one. Raise ValueError otherwise."""
-    stacks = find_stacks(pattern=pattern, findall=findall)
+    """Return the result is there is only one. Raise ValueError otherwise.
+
+    When the full description is requested, the pattern is first tried as
+    an exact stack name: the stacks are only listed if it's not one.
+    """
+    if not summary and RE_STACK_NAME.match(pattern):
+        from boto.exception import BotoServerError
+
+        try:
+            return describe_stack(pattern)
+        except BotoServerError as error:
+            if not _is_stack_not_found(error):
+                raise
+
+    stacks = list(find_stacks(pattern=pattern, findall=findall))
 
     for stack in stacks:        # If we have an exact match, just take it
         if stack.stack_name == pattern:
@@ -43,42 +254,250 @@ def find_one_stack(pattern, findall=False, summary=True):
     if summary:
         return stacks[0]
     else:
-        cfn = boto.connect_cloudformation()
-        return cfn.describe_stacks(stacks[0].stack_name)[0]
+        return describe_stack(stacks[0].stack_name)
+
+
+def describe_stack(stack_name):
+    """Return the full description of a stack, from the cache if enabled."""
+    stack = stack_cache.get_stack(stack_name)
+    if stack is None:
+        since = time.time()
+        cfn = connections.cloudformation()
+        stack = cfn.describe_stacks(stack_name)[0]
+        stack_cache.set_stack(stack, since)
+    return stack
+
+
+def iter_stack_events(stack_name, limit=None, since=None):
+    """Yield the events of a stack, newest first.
+
+    The pages are requested one by one and no more once `limit` events are
+    yielded, or once an event older than `since` (a naive UTC datetime) is
+    reached.
+    """
+    if limit is not None and limit <= 0:
+        return
+
+    cfn = connections.cloudformation()
+    count = 0
+    next_token = None
+    while True:
+        result = cfn.describe_stack_events(stack_name, next_token=next_token)
+
+        for event in result:
+            if since is not None and event.timestamp < since:
+                return
+            yield event
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+        next_token = result.next_token
+        if next_token is None:
+            break
+
+
+def iter_stack_events_after(stack_name, event_id):
+    """Return the events newer than event_id, oldest first.
+
+    The pages are requested until event_id is reached.
+    """
+    events = []
+    for event in iter_stack_events(stack_name):
+        if event.event_id == event_id:
+            break
+        events.append(event)
+    events.reverse()
+    return events
+
+
+def follow_stack_events(stack_name, last_event_id=None,
+                        interval=2, max_interval=30, sleep=time.sleep):
+    """Yield the events after last_event_id, oldest first, as they happen.
+
+    Stop after an event making the stack stable (see is_stack_stable).
+    The stack is polled every `interval` seconds, twice less often after
+    each idle poll (up to max_interval).
+    """
+    delay = interval
+    while True:
+        events = iter_stack_events_after(stack_name, last_event_id)
+
+        for event in events:
+            yield event
+            last_event_id = event.event_id
+            if (is_stack_event(event) and
+                    is_stack_stable(event.resource_status)):
+                return
+
+        delay = interval if events else min(delay * 2, max_interval)
+        sleep(delay)
+
+
+def wait_for_stacks(stack_ids, timeout=None, backoff=None):
+    """Yield the stacks (described) as soon as they are stable.
+
+    A single stack is polled with DescribeStacks; for many stacks, one
+    listing of the stacks in progress covers all of them, and each stack is
+    described once, when it leaves that list.
+    The stacks must be given by id: the name of a deleted stack can't be
+    described.
+    Raise WaitTimeout if stacks are still in progress after timeout seconds.
+    """
+    cfn = connections.cloudformation()
+    backoff = backoff or Backoff(timeout=timeout)
+    pending = set(stack_ids)
+
+    while pending:
+        if len(pending) == 1:
+            stack_id = list(pending)[0]
+            stack = cfn.describe_stacks(stack_id)[0]
+            if is_stack_stable(stack.stack_status):
+                done = [(stack_id, stack)]
+            else:
+                done = []
+        else:
+            in_progress = set(s.stack_id for s in
+                              _list_stacks(STACK_IN_PROGRESS_STATUS))
+            done = [(stack_id, cfn.describe_stacks(stack_id)[0])
+                    for stack_id in sorted(pending - in_progress)]
+
+        for stack_id, stack in done:
+            stack_cache.invalidate(stack.stack_name)
+            pending.discard(stack_id)
+            yield stack
+
+        if pending:
+            backoff.sleep()
+
+
+def is_stack_event(event):
+    """Whether the event is about the stack itself, not a resource.
+
+    A nested stack is a resource of the same type as the stack.
+    """
+    return (event.resource_type == STACK_RESOURCE_TYPE and
+            (event.physical_resource_id == event.stack_id or
+             event.logical_resource_id == event.stack_name))
+
+
+def is_stack_stable(status):
+    return not status.endswith('_IN_PROGRESS')
+
+
+def _is_stack_not_found(error):
+    return (error.status == 400 and
+            error.error_code == 'ValidationError' and
+            'does not exist' in (error.error_message or ''))
 
 
 RES_TYPE_ASG = 'AWS::AutoScaling::AutoScalingGroup'
 RES_TYPE_ELB = 'AWS::ElasticLoadBalancing::LoadBalancer'
 
 
+RES_NAMES = {RES_TYPE_ASG: 'AutoScale', RES_TYPE_ELB: 'ELB'}
+
+# Maximum number of names accepted by a Describe call
+RES_PAGE_SIZE = {RES_TYPE_ASG: 50, RES_TYPE_ELB: 20}
+
+
 def find_one_resource(stack, resource_type, only_id=False):
-    stackresources = stack.describe_resources()
+    if resource_type not in RES_NAMES:
+        raise NotImplementedError("Unkown resource type")
+
+    phy_id = _get_physical_id(stack.describe_resources(), resource_type)
+
+    if only_id:
+        return phy_id
+
+    try:
+        return _describe_physical_resources(resource_type, [phy_id])[phy_id]
+    except KeyError:
+        raise ValueError("The %s physical id doesn't exist" % (
+                         RES_NAMES[resource_type]))
+
+
+def describe_stacks_resources(stacks, jobs=DEFAULT_JOBS):
+    """Return the resources of many stacks, described in parallel.
+
+    The result is a {stack_name: resources} dict.
+    """
+    cfn = connections.cloudformation()
+    names = [s.stack_name for s in stacks]
+    resources = ordered_map(cfn.describe_stack_resources, names, jobs)
+    return dict(zip(names, resources))
+
+
+def find_resources(stacks_resources, resource_type, only_id=False):
+    """Like find_one_resource, for many stacks at once.
+
+    stacks_resources is returned by describe_stacks_resources, the result is
+    a {stack_name: resource} dict. The resources are described by pages of
+    names instead of one call per stack.
+    """
+    if resource_type not in RES_NAMES:
+        raise NotImplementedError("Unkown resource type")
+
+    phy_ids = dict((stack_name, _get_physical_id(resources, resource_type))
+                   for stack_name, resources in stacks_resources.items())
+
+    if only_id:
+        return phy_ids
+
+    found = _describe_physical_resources(resource_type, phy_ids.values())
+
+    try:
+        return dict((stack_name, found[phy_id])
+                    for stack_name, phy_id in phy_ids.items())
+    except KeyError as error:
+        raise ValueError("The %s physical id doesn't exist: %s" % (
+                         RES_NAMES[resource_type], error))
+
+
+def _get_physical_id(stackresources, resource_type):
+    name = RES_NAMES[resource_type]
 
     resources = [r for r in stackresources if r.resource_type == resource_type]
     if len(resources) == 0:
-        raise ValueError("This stack contains no AutoScale")
+        raise ValueError("This stack contains no %s" % name)
     if len(resources) > 1:
-        raise ValueError("This stack contains more than one AutoScale")
+        raise ValueError("This stack contains more than one %s" % name)
+
+    return resources[0].physical_resource_id
+
+
+def _describe_physical_resources(resource_type, phy_ids):
+    """Return a {physical_id: resource} dict of the existing resources."""
+    phy_ids = sorted(set(phy_ids))
+    size = RES_PAGE_SIZE[resource_type]
+
+    found = {}
+    for start in range(0, len(phy_ids), size):
+        for resource in _list_physical_resources(resource_type,
+                                                 phy_ids[start:start + size]):
+            found[resource.name] = resource
+    return found
 
-    phy_id = resources[0].physical_resource_id
 
+def _list_physical_resources(resource_type, names):
     if resource_type == RES_TYPE_ASG:
-        if only_id:
-            return phy_id
-        else:
-            try:
-                return boto.connect_autoscale().get_all_groups([phy_id])[0]
-            except IndexError:
-                raise ValueError("The AutoScale physical id doesn't exist")
-
-    elif resource_type == RES_TYPE_ELB:
-        if only_id:
-            return phy_id
-        else:
-            try:
-                return boto.connect_elb().get_all_load_balancers([phy_id])[0]
-            except IndexError:
-                raise ValueError("The ELB physical id doesn't exist")
+        conn = connections.autoscale()
 
+        def fetch(token):
+            return conn.get_all_groups(names, next_token=token)
+        next_attr = 'next_token'
     else:
-        raise NotImplementedError("Unkown resource type")
+        conn = connections.elb()
+
+        def fetch(token):
+            return conn.get_all_load_balancers(names, marker=token)
+        next_attr = 'next_marker'
+
+    token = None
+    while True:
+        result = fetch(token)
+        for resource in result:
+            yield resource
+        token = getattr(result, next_attr, None)
+        if token is None:
+            break
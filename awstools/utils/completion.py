@@ -0,0 +1,34 @@
+"""The list of the instance names for the bash completion of ec2ssh.
+
+It's read at each Tab press: only the standard library is imported here.
+"""
+import json
+import os
+
+from awstools.utils.cache import atomic_write
+
+
+COMPLETION_FILE = '~/.ec2ssh_completion'
+
+
+def write_completion_list(names):
+    """Write the names, unless the file already lists them.
+
+    Return whether the file was written.
+    """
+    names = sorted(set(names))
+    try:
+        if read_completion_list() == names:
+            return False
+    except (IOError, ValueError):
+        pass
+
+    atomic_write(os.path.expanduser(COMPLETION_FILE),
+                 json.dumps(names, indent=2))
+    return True
+
+
+def read_completion_list():
+    fname = os.path.expanduser(COMPLETION_FILE)
+    with open(fname, 'rb') as fp:
+        return json.load(fp)
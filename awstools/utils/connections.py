@@ -0,0 +1,83 @@
+"""Process-wide registry of the AWS connections.
+
+A boto connection keeps its HTTP(S) connections alive in a pool, so reusing
+the same object saves a TLS handshake and a credentials lookup per call.
+The requests of the connections are rate limited and retried (see
+awstools.utils.throttling), and recorded when profiling.
+"""
+import importlib
+import threading
+
+from awstools.utils.profiling import profiler
+
+
+def _lazy(module, function):
+    """Return a function calling module.function, imported on first call.
+
+    boto and its service modules are only imported when a connection is
+    made.
+    """
+    def call(*args):
+        return getattr(importlib.import_module(module), function)(*args)
+    return call
+
+
+# service: (connect with the boto defaults, connect to a given region)
+SERVICES = {
+    'cloudformation': (_lazy('boto', 'connect_cloudformation'),
+                       _lazy('boto.cloudformation', 'connect_to_region')),
+    'autoscale': (_lazy('boto', 'connect_autoscale'),
+                  _lazy('boto.ec2.autoscale', 'connect_to_region')),
+    'elb': (_lazy('boto', 'connect_elb'),
+            _lazy('boto.ec2.elb', 'connect_to_region')),
+    'ec2': (_lazy('boto', 'connect_ec2'),
+            _lazy('boto.ec2', 'connect_to_region')),
+}
+
+_connections = {}
+_lock = threading.Lock()
+
+
+def get_connection(service, region=None):
+    """Return the shared connection to a service in a region.
+
+    Without region, the connection uses the boto defaults.
+    """
+    from awstools.utils import throttling
+
+    key = (service, region)
+    with _lock:
+        if key not in _connections:
+            connect, connect_to_region = SERVICES[service]
+            if region is None:
+                connection = connect()
+            else:
+                connection = connect_to_region(region)
+                if connection is None:
+                    raise ValueError("Unknown region: %s" % region)
+            _connections[key] = throttling.install(
+                connection, service,
+                listener=profiler.listener(service, region))
+        return _connections[key]
+
+
+def reset():
+    """Forget all the connections."""
+    with _lock:
+        _connections.clear()
+
+
+def cloudformation(region=None):
+    return get_connection('cloudformation', region)
+
+
+def autoscale(region=None):
+    return get_connection('autoscale', region)
+
+
+def elb(region=None):
+    return get_connection('elb', region)
+
+
+def ec2(region=None):
+    return get_connection('ec2', region)
@@ -1,15 +1,16 @@
+import bisect
 import re
-from fnmatch import fnmatch
+from fnmatch import fnmatchcase, translate
 
-import boto
-import boto.ec2
+from awstools.utils import connections
+from awstools.utils.pool import ordered_map
 
 
 def get_instances(region='us-east-1',
                   filters={'instance-state-name': 'running'},
                   instance_ids=None):
 
-    ec2 = boto.connect_ec2(region=boto.ec2.get_region(region))
+    ec2 = connections.ec2(region)
 
     reservations = ec2.get_all_instances(filters=filters,
                                          instance_ids=instance_ids)
@@ -24,41 +25,172 @@ def get_name(instance):
     return name or altname or instanceid
 
 
+def get_region(instance):
+    """Return the region name of an instance (boto or cached)."""
+    return getattr(instance.region, 'name', instance.region)
+
+
+def match_tags(instance, tags):
+    """Return whether the instance has the tags (name: value or pattern)."""
+    return all(fnmatchcase(instance.tags.get(name, ''), value)
+               for name, value in tags.items())
+
+
 RE_INSTANCE_ID = re.compile(r'^i-[a-fA-F0-9]{8}$')
 RE_PRIVATE_IP = re.compile(r'^10\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
 RE_PRIVATE_HOSTNAME_1 = re.compile(r'^ip-10(-\d{1,3}){3}')
 RE_PRIVATE_HOSTNAME_2 = re.compile(r'^domU(-[0-9a-fA-F]{2}){6}')
 
 
-def filter_instances(specifiers, instances):
-    targets = set()
+RE_WILDCARD = re.compile(r'[*?[]')
+
+
+def get_specifier_type(specifier):
+    """Return what a specifier is: 'id', 'ip', 'dns' (prefix) or 'name'."""
+    if RE_INSTANCE_ID.match(specifier):
+        return 'id'
+    if RE_PRIVATE_IP.match(specifier):
+        return 'ip'
+    if RE_PRIVATE_HOSTNAME_1.match(specifier) or \
+            RE_PRIVATE_HOSTNAME_2.match(specifier):
+        return 'dns'
+    return 'name'
+
+
+class InstanceIndex(object):
 
-    for instance in instances:
-        for specifier in specifiers:
+    """Hash indexes of instances, to resolve many specifiers quickly.
 
-            if re.match(RE_INSTANCE_ID, specifier):
-                if instance.id == specifier:
-                    targets.add(instance)
+    The instances are indexed by id, private IP, private DNS name (sorted,
+    for the prefix lookups) and lowercased Name and altName tags.
+    """
 
-            elif re.match(RE_PRIVATE_IP, specifier):
-                if instance.private_ip_address == specifier:
-                    targets.add(instance)
+    def __init__(self, instances):
+        self.instances = list(instances)
+        self.by_id = {}
+        self.by_ip = {}
+        self.by_name = {}
 
-            elif re.match(RE_PRIVATE_HOSTNAME_1, specifier):
-                if instance.private_dns_name.startswith(specifier):
-                    targets.add(instance)
+        dns_names = []
+        for position, instance in enumerate(self.instances):
+            self.by_id.setdefault(instance.id, []).append(position)
+            self.by_ip.setdefault(instance.private_ip_address,
+                                  []).append(position)
+            for tag in ('Name', 'altName'):
+                name = instance.tags.get(tag, '').lower()
+                self.by_name.setdefault(name, []).append(position)
+            dns_names.append((instance.private_dns_name or '', position))
 
-            elif re.match(RE_PRIVATE_HOSTNAME_2, specifier):
-                if instance.private_dns_name.startswith(specifier):
-                    targets.add(instance)
+        dns_names.sort()
+        self.dns_names = [name for name, position in dns_names]
+        self.dns_positions = [position for name, position in dns_names]
 
-            else:
-                name = instance.tags.get('Name', '').lower()
-                altname = instance.tags.get('altName', '').lower()
+    def match(self, specifier):
+        """Return the positions of the instances matching a specifier."""
+        specifier_type = get_specifier_type(specifier)
 
-                if fnmatch(name, specifier.lower()):
-                    targets.add(instance)
-                elif fnmatch(altname, specifier.lower()):
-                    targets.add(instance)
+        if specifier_type == 'id':
+            return self.by_id.get(specifier, [])
 
-    return list(targets)
+        if specifier_type == 'ip':
+            return self.by_ip.get(specifier, [])
+
+        if specifier_type == 'dns':
+            return self._match_dns_prefix(specifier)
+
+        pattern = specifier.lower()
+        if not RE_WILDCARD.search(pattern):
+            return self.by_name.get(pattern, [])
+
+        regex = re.compile(translate(pattern))
+        return [position
+                for name, positions in self.by_name.items()
+                if regex.match(name)
+                for position in positions]
+
+    def _match_dns_prefix(self, prefix):
+        start = bisect.bisect_left(self.dns_names, prefix)
+        end = start
+        while end < len(self.dns_names) and \
+                self.dns_names[end].startswith(prefix):
+            end += 1
+        return self.dns_positions[start:end]
+
+    def filter(self, specifiers):
+        """Return the instances matching any specifier, in their order."""
+        positions = set()
+        for specifier in set(specifiers):
+            positions.update(self.match(specifier))
+        return [self.instances[p] for p in sorted(positions)]
+
+
+def filter_instances(specifiers, instances):
+    """Return the instances matching any of the specifiers.
+
+    The instances are returned in their original order. `instances` can be
+    an InstanceIndex, to filter the same instances many times.
+    """
+    if not isinstance(instances, InstanceIndex):
+        instances = InstanceIndex(instances)
+    return instances.filter(specifiers)
+
+
+def get_filters(specifiers):
+    """Return the DescribeInstances filters of the specifiers, one per query.
+
+    The specifiers of a kind are grouped in one filter. A Name may be in the
+    Name or the altName tag: two queries, as the filters of one query are
+    all required. The tag filters are case sensitive: the names are given as
+    typed, and a name with wildcards needs all the running instances (one
+    query), to be matched regardless of the case.
+    """
+    values = {'id': [], 'ip': [], 'dns': [], 'name': []}
+    for specifier in sorted(set(specifiers)):
+        specifier_type = get_specifier_type(specifier.lower())
+        if specifier_type == 'name':
+            if RE_WILDCARD.search(specifier):
+                return [{'instance-state-name': 'running'}]
+        else:
+            specifier = specifier.lower()
+        if specifier_type == 'dns':
+            specifier += '*'
+        values[specifier_type].append(specifier)
+
+    queries = []
+    for specifier_type, name in [('id', 'instance-id'),
+                                 ('ip', 'private-ip-address'),
+                                 ('dns', 'private-dns-name'),
+                                 ('name', 'tag:Name'),
+                                 ('name', 'tag:altName')]:
+        if values[specifier_type]:
+            queries.append({'instance-state-name': 'running',
+                            name: values[specifier_type]})
+    return queries
+
+
+def unmatched_specifiers(specifiers, instances):
+    """Return the specifiers matching none of the instances."""
+    if not isinstance(instances, InstanceIndex):
+        instances = InstanceIndex(instances)
+    return [s for s in specifiers if not instances.match(s)]
+
+
+def find_instances(specifiers, region='us-east-1'):
+    """Return the running instances matching any of the specifiers.
+
+    Unlike filter_instances(specifiers, get_instances()), only the instances
+    selected by the filters of the specifiers are requested, with the
+    queries run concurrently. The names are filtered by EC2 in their case
+    (see get_filters), then matched regardless of it.
+    """
+    queries = get_filters(specifiers)
+    results = ordered_map(lambda filters: get_instances(region, filters),
+                          queries, jobs=len(queries))
+
+    instances = []
+    instance_ids = set()
+    for instance in (i for result in results for i in result):
+        if instance.id not in instance_ids:
+            instance_ids.add(instance.id)
+            instances.append(instance)
+    return filter_instances([s.lower() for s in specifiers], instances)
@@ -0,0 +1,224 @@
+"""Persistent inventory of the EC2 instances, for ec2ssh.
+
+The instances of a region (id, name tags, IPs, DNS names and placement) are
+cached for `ttl` seconds. Once expired, the inventory is still served, and a
+detached process refreshes it for the next calls:
+
+    python -m awstools.utils.inventory <region> <ttl> <directory>
+"""
+import fcntl
+import os
+import subprocess
+import sys
+import time
+
+from awstools.utils import ec2
+from awstools.utils.cache import FileCache, CACHE_DIR
+from awstools.utils.pool import ordered_map
+
+
+DEFAULT_REGION = 'us-east-1'
+
+INSTANCE_FIELDS = ['id', 'tags', 'state', 'private_ip_address',
+                   'private_dns_name', 'ip_address', 'public_dns_name',
+                   'placement']
+
+
+class CachedInstance(object):
+
+    """The attributes of a boto Instance kept in the inventory.
+
+    The region is the name of the region, not a boto RegionInfo.
+    """
+
+    def __init__(self, region=None, **fields):
+        self.region = region
+        for field in INSTANCE_FIELDS:
+            setattr(self, field, fields.get(field))
+        self.tags = self.tags or {}
+
+    def __repr__(self):
+        return 'CachedInstance:%s' % self.id
+
+
+class Inventory(object):
+
+    """On-disk cache of the instances, served even when expired.
+
+    Disabled until configured with a positive ttl (in seconds).
+    With refresh, the cache is written but never read.
+    Each region has its own cache, and the regions are queried concurrently.
+    """
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self, ttl=0, refresh=False, directory=CACHE_DIR,
+                  regions=None):
+        self.ttl = ttl
+        self.refresh = refresh
+        self.directory = directory
+        self.regions = regions or [DEFAULT_REGION]
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _file(self, region):
+        return FileCache('instances-%s' % region, self.ttl,
+                         directory=self.directory)
+
+    def get_instances(self, region=DEFAULT_REGION, stale=True):
+        """Return the running instances of a region.
+
+        An expired inventory is returned as is, and refreshed in the
+        background. Without stale, it is fetched again instead.
+        """
+        if not self.enabled:
+            return ec2.get_instances(region)
+
+        instances, expired = self._read(region)
+        if instances is None or (expired and not stale):
+            return self.fetch(region)
+
+        if expired:
+            self.refresh_in_background(region)
+        return instances
+
+    def _read(self, region):
+        """Return the cached instances of a region, and whether they expired.
+
+        The instances are None if missing or refreshing.
+        """
+        if self.refresh:
+            return None, True
+        data, expired = self._file(region).get_stale()
+        if data is None:
+            return None, True
+        return ([CachedInstance(region=region, **fields) for fields in data],
+                expired)
+
+    def fetch(self, region=DEFAULT_REGION):
+        """Return the running instances of a region, from the API."""
+        since = time.time()
+        instances = ec2.get_instances(region)
+        if self.enabled:
+            self._file(region).set([_dump_instance(i) for i in instances],
+                                   since)
+        return instances
+
+    def is_cached(self):
+        """Return whether the instances of all the regions are cached."""
+        return self.enabled and not self.refresh and all(
+            os.path.exists(self._file(region).path)
+            for region in self.regions)
+
+    def find_instances(self, specifiers):
+        """Return the instances of all the regions matching the specifiers.
+
+        Without inventory, only the matching instances are requested (see
+        ec2.find_instances), and the inventory is made in the background.
+        With a name pattern, all the instances are requested: they make the
+        inventory.
+        """
+        everything = ec2.get_filters(specifiers) == [
+            {'instance-state-name': 'running'}]
+
+        def find_instances(region):
+            if everything and self.enabled:
+                return ec2.filter_instances([s.lower() for s in specifiers],
+                                            self.fetch(region))
+            instances = ec2.find_instances(specifiers, region)
+            if self.enabled:
+                self.refresh_in_background(region)
+            return instances
+
+        return self._merge(find_instances)
+
+    def find_tagged_instances(self, tags, stale=True):
+        """Return the instances of all the regions with the tags.
+
+        The tags (name: value, with wildcards) are matched locally when the
+        inventory is cached, else by EC2 filters (and the inventory is made
+        in the background). Without stale, an expired inventory is not used.
+        """
+        if not tags:
+            return self.get_all_instances(stale)
+        if stale and self.is_cached():
+            return [i for i in self.get_all_instances()
+                    if ec2.match_tags(i, tags)]
+
+        filters = dict(('tag:%s' % name, value)
+                       for name, value in tags.items())
+        filters['instance-state-name'] = 'running'
+
+        def find_instances(region):
+            if not stale and self.enabled:
+                cached, expired = self._read(region)
+                if cached is not None and not expired:
+                    return [i for i in cached if ec2.match_tags(i, tags)]
+            instances = ec2.get_instances(region, filters)
+            if self.enabled:
+                self.refresh_in_background(region)
+            return instances
+
+        return self._merge(find_instances)
+
+    def get_all_instances(self, stale=True):
+        """Return the running instances of all the regions.
+
+        The regions are read concurrently, and their instances merged in
+        the order of the regions.
+        """
+        return self._merge(lambda region: self.get_instances(region, stale))
+
+    def fetch_all(self):
+        """Return the running instances of all the regions, from the API."""
+        return self._merge(self.fetch)
+
+    def _merge(self, get_instances):
+        results = ordered_map(get_instances, self.regions,
+                              jobs=len(self.regions))
+        return [instance for instances in results for instance in instances]
+
+    def refresh_in_background(self, region=DEFAULT_REGION):
+        """Start a detached process refreshing the inventory of a region."""
+        with open(os.devnull, 'r+') as devnull:
+            subprocess.Popen(
+                [sys.executable, '-m', 'awstools.utils.inventory',
+                 region, str(self.ttl), self.directory],
+                stdin=devnull, stdout=devnull, stderr=devnull,
+                close_fds=True, preexec_fn=os.setsid)
+
+    def refresh_once(self, region=DEFAULT_REGION):
+        """Refresh the inventory, unless another process is already on it.
+
+        Return whether it was refreshed.
+        """
+        lockpath = self._file(region).path + '.refresh'
+        with open(lockpath, 'a') as fp:
+            try:
+                fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                return False
+            self.fetch(region)
+        return True
+
+
+def _dump_instance(instance):
+    data = dict((field, getattr(instance, field, None))
+                for field in INSTANCE_FIELDS)
+    data['tags'] = dict(instance.tags)
+    return data
+
+
+inventory = Inventory()
+
+
+def main(region, ttl, directory):
+    inventory.configure(ttl=int(ttl), directory=directory)
+    inventory.refresh_once(region)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,44 @@
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+
+DEFAULT_JOBS = 8
+
+
+def ordered_map(func, items, jobs=DEFAULT_JOBS):
+    """Yield func(item) for each item, computed by up to `jobs` threads.
+
+    The results are yielded in the order of the items, each one as soon as
+    it and its predecessors are done. An exception raised by func is raised
+    again when its result is reached.
+    """
+    items = list(items)
+
+    if jobs <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pool = ThreadPool(min(jobs, len(items)))
+    try:
+        results = pool.imap(func, items)
+        while True:
+            try:
+                yield wait(results.next, TimeoutError)
+            except StopIteration:
+                break
+    finally:
+        pool.terminate()
+
+
+def wait(get, timeout_error):
+    """Return get(timeout=...) once it is not timing out anymore.
+
+    A blocking wait without a timeout would not be interrupted by ctrl-c, so
+    get is called again every second until it does not raise timeout_error.
+    """
+    while True:
+        try:
+            return get(timeout=1)
+        except timeout_error:
+            continue
@@ -0,0 +1,109 @@
+"""Record the AWS calls, to find out where the time of a command goes.
+
+A span is recorded for each request made through the registry of
+connections: service, region, operation, continuation page or not, HTTP
+status, bytes received, latency (retries included) and number of retries.
+"""
+import json
+import math
+import threading
+import time
+
+
+# Parameters carrying the token of the next page, per API
+PAGE_PARAMS = ('NextToken', 'Marker')
+
+
+class Profiler(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def configure(self, enabled=False):
+        self.enabled = enabled
+
+    def listener(self, service, region):
+        """Return a listener of the requests of a connection (see retrying)."""
+        def listener(args, kwargs, response, error, retries, start):
+            if self.enabled:
+                self.record(make_span(service, region, args, kwargs,
+                                      response, error, retries, start))
+        return listener
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self):
+        """Return the statistics per operation, slowest operations first.
+
+        Each row is a dict with the service, operation, calls (first pages),
+        pages (all requests), retries, bytes, p50, p95 and total latency.
+        """
+        operations = {}
+        for span in self.spans:
+            key = (span['service'], span['operation'])
+            operations.setdefault(key, []).append(span)
+
+        rows = []
+        for (service, operation), spans in operations.items():
+            latencies = sorted(s['latency'] for s in spans)
+            rows.append({
+                'service': service,
+                'operation': operation,
+                'calls': len([s for s in spans if not s['page']]),
+                'pages': len(spans),
+                'retries': sum(s['retries'] for s in spans),
+                'bytes': sum(s['bytes'] for s in spans),
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+                'total': sum(latencies),
+            })
+
+        return sorted(rows, key=lambda r: r['total'], reverse=True)
+
+    def dump(self, fp):
+        """Write the spans as JSON lines."""
+        for span in self.spans:
+            fp.write(json.dumps(span, sort_keys=True) + '\n')
+
+
+def make_span(service, region, args, kwargs, response, error, retries,
+              start):
+    latency = time.time() - start
+
+    # AWSQueryConnection.make_request(action, params=None, path, verb)
+    operation = args[0] if args else kwargs.get('action')
+    params = (args[1] if len(args) > 1 else kwargs.get('params')) or {}
+
+    if response is not None:
+        status = response.status
+        size = len(response.read() or '')
+    else:
+        status = getattr(error, 'status', error.__class__.__name__)
+        size = len(getattr(error, 'body', None) or '')
+
+    return {
+        'service': service,
+        'region': region,
+        'operation': operation,
+        'page': any(p in params for p in PAGE_PARAMS),
+        'status': status,
+        'bytes': size,
+        'start': start,
+        'latency': latency,
+        'retries': retries,
+    }
+
+
+def percentile(values, ratio):
+    """Return the nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    index = int(math.ceil(ratio * len(values))) - 1
+    return values[max(index, 0)]
+
+
+profiler = Profiler()
@@ -0,0 +1,202 @@
+"""Run a command on many hosts with ssh, at the same time.
+
+    for name, line, status in run_commands(hosts, ['uptime'], jobs=20):
+        ...
+
+The output of the commands is yielded line by line as soon as printed, each
+line with the name of its host. Once a command is over, its exit status is
+yielded (TIMEOUT if it was killed after `timeout` seconds).
+
+Once configured, the multiplexer makes ssh share one connection per host
+(ControlMaster), kept open in the background between the commands.
+"""
+import errno
+import os
+import Queue
+import socket
+import stat
+import subprocess
+import threading
+from multiprocessing.pool import ThreadPool
+
+from awstools.utils.cache import CACHE_DIR
+from awstools.utils.pool import wait
+
+
+# The ssh command line, before the options, the address and the command
+SSH = ['ssh']
+
+TIMEOUT = 'TIMEOUT'
+
+# How long a master connection is kept after its last use (ssh time format)
+CONTROL_PERSIST = '10m'
+
+WARM_UP_JOBS = 20
+WARM_UP_TIMEOUT = 30
+
+
+class Multiplexer(object):
+
+    """The ssh options to share one connection per host.
+
+    Disabled until configured. The control sockets of the masters are in
+    the `ssh` directory of the cache.
+    """
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self, enabled=False, directory=CACHE_DIR,
+                  persist=CONTROL_PERSIST):
+        self.enabled = enabled
+        self.directory = os.path.join(os.path.expanduser(directory), 'ssh')
+        self.persist = persist
+
+    def options(self):
+        """Return the ssh options (none when disabled)."""
+        if not self.enabled:
+            return []
+        # %C: a hash of the connection, the long host names would exceed
+        # the length limit of a socket path
+        return ['-o', 'ControlMaster=auto',
+                '-o', 'ControlPath=%s' % os.path.join(self.directory, '%C'),
+                '-o', 'ControlPersist=%s' % self.persist]
+
+    def prepare(self):
+        """Create the sockets directory and remove the stale sockets."""
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.directory, 0700)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        self.clean()
+
+    def clean(self):
+        """Remove the sockets left by the masters which are gone.
+
+        Return their names.
+        """
+        removed = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if not stat.S_ISSOCK(os.lstat(path).st_mode) or \
+                        _is_listening(path):
+                    continue
+                os.remove(path)
+            except OSError:
+                # Removed in the meantime
+                continue
+            removed.append(name)
+        return removed
+
+    def warm_up(self, addresses, jobs=WARM_UP_JOBS, timeout=WARM_UP_TIMEOUT):
+        """Start the masters of the hosts, `jobs` at the same time.
+
+        Return the addresses of the hosts which failed.
+        """
+        if not self.enabled:
+            return []
+        hosts = [(address, address) for address in addresses]
+        return [name
+                for name, line, status in run_commands(
+                    hosts, ['true'], jobs=jobs, timeout=timeout,
+                    options=self.options())
+                if status not in (None, 0)]
+
+
+def _is_listening(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+multiplexer = Multiplexer()
+
+
+def run_commands(hosts, command, jobs=1, timeout=None, options=()):
+    """Run `ssh options address command` for each (name, address) of hosts.
+
+    Up to `jobs` commands are run at the same time. Yield (name, line, None)
+    for each line of output, and (name, None, status) once a command is
+    over. The commands still running are killed when the generator is
+    closed (on ctrl-c).
+    """
+    hosts = list(hosts)
+    events = Queue.Queue()
+    processes = set()
+
+    def run(host):
+        name, address = host
+        status = 255
+        try:
+            args = SSH + list(options) + [address] + list(command)
+            status = _run_command(args, timeout,
+                                  processes,
+                                  lambda line: events.put((name, line, None)))
+        except OSError as error:
+            events.put((name, "Failed to call the ssh command: %s" % error,
+                        None))
+        except Exception as error:
+            events.put((name, "Failed to run the command: %s" % error, None))
+        finally:
+            # Always over, or the loop below would wait for it forever
+            events.put((name, None, status))
+
+    pool = ThreadPool(max(min(jobs, len(hosts)), 1))
+    try:
+        pool.map_async(run, hosts)
+        remaining = len(hosts)
+        while remaining:
+            event = wait(events.get, Queue.Empty)
+            if event[2] is not None:
+                remaining -= 1
+            yield event
+    finally:
+        for process in list(processes):
+            _kill(process)
+        pool.terminate()
+
+
+def _run_command(args, timeout, processes, write_line):
+    with open(os.devnull, 'r') as devnull:
+        process = subprocess.Popen(args, stdin=devnull,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, close_fds=True)
+    processes.add(process)
+
+    timed_out = []
+    timer = None
+    if timeout:
+        def kill():
+            timed_out.append(True)
+            _kill(process)
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+
+    try:
+        for line in iter(process.stdout.readline, ''):
+            write_line(line.rstrip('\r\n'))
+        status = process.wait()
+    finally:
+        if timer:
+            timer.cancel()
+        processes.discard(process)
+
+    return TIMEOUT if timed_out else status
+
+
+def _kill(process):
+    try:
+        process.kill()
+    except OSError:
+        # Already over
+        pass
@@ -0,0 +1,140 @@
+"""Client-side rate limiting and retries of the AWS calls.
+
+Each connection of the registry gets a token bucket (per service and
+region) and retries its throttled and failed (5xx) requests with a jittered
+exponential backoff. The retries also take a token so that many threads
+slow down together instead of hammering a throttled API.
+"""
+import re
+import threading
+import time
+
+from boto.exception import BotoServerError
+
+from awstools.utils.backoff import Backoff
+
+
+# service: (calls per second, burst)
+RATE_LIMITS = {
+    'cloudformation': (5, 10),
+    'autoscale': (10, 20),
+    'elb': (10, 20),
+    'ec2': (20, 40),
+}
+DEFAULT_RATE_LIMIT = (10, 20)
+MAX_RETRIES = 8
+
+RE_THROTTLING = re.compile(
+    r'Throttling|RequestLimitExceeded|RequestThrottled|SlowDown')
+
+
+class TokenBucket(object):
+
+    """Allow `rate` calls per second on average, with bursts of `capacity`.
+
+    Thread safe: a caller reserves its token then sleeps outside the lock
+    until the token is available.
+    """
+
+    def __init__(self, rate, capacity, sleep=time.sleep, clock=time.time):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._sleep = sleep
+        self._clock = clock
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self._updated_at) *
+                              self.rate)
+            self._updated_at = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait:
+            self._sleep(wait)
+
+
+def is_throttling(status, body):
+    return status in (400, 503) and bool(RE_THROTTLING.search(body or ''))
+
+
+def is_retryable_response(response):
+    if response.status < 400:
+        return False
+    return response.status >= 500 or is_throttling(response.status,
+                                                   response.read())
+
+
+def is_retryable_error(error):
+    if isinstance(error, BotoServerError):
+        return error.status >= 500 or is_throttling(error.status, error.body)
+    return False
+
+
+def retrying(make_request, bucket, retries=MAX_RETRIES,
+             transport_errors=(), backoff_factory=None, listener=None):
+    """Wrap the make_request method of a boto connection.
+
+    Every request takes a token from the bucket. The throttled requests, the
+    server errors and the transport errors are retried with a backoff.
+    Once done, a request is reported to the listener with
+    (args, kwargs, response, error, retries, start time).
+    """
+    backoff_factory = backoff_factory or (lambda: Backoff(initial=0.5,
+                                                          maximum=20,
+                                                          jitter=1))
+
+    def make_request_with_retries(*args, **kwargs):
+        backoff = backoff_factory()
+        start = time.time()
+
+        for attempt in range(retries + 1):
+            last_attempt = attempt == retries
+            bucket.acquire()
+            try:
+                response = make_request(*args, **kwargs)
+            except transport_errors as error:
+                if last_attempt:
+                    _notify(listener, args, kwargs, None, error, attempt,
+                            start)
+                    raise
+            except BotoServerError as error:
+                if last_attempt or not is_retryable_error(error):
+                    _notify(listener, args, kwargs, None, error, attempt,
+                            start)
+                    raise
+            else:
+                if last_attempt or not is_retryable_response(response):
+                    _notify(listener, args, kwargs, response, None, attempt,
+                            start)
+                    return response
+            backoff.sleep()
+
+    return make_request_with_retries
+
+
+def _notify(listener, *request):
+    if listener is not None:
+        listener(*request)
+
+
+def install(connection, service, listener=None):
+    """Rate limit and retry the requests of a new boto connection."""
+    rate, capacity = RATE_LIMITS.get(service, DEFAULT_RATE_LIMIT)
+    unretryable = tuple(connection.http_unretryable_exceptions)
+    transport_errors = tuple(e for e in connection.http_exceptions
+                             if not issubclass(e, unretryable))
+
+    # boto retries the 5xx and transport errors itself, without taking a
+    # token: this layer does it instead
+    connection.num_retries = 0
+    connection.make_request = retrying(connection.make_request,
+                                       TokenBucket(rate, capacity),
+                                       transport_errors=transport_errors,
+                                       listener=listener)
+    return connection
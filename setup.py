@@ -1,7 +1,14 @@
 from setuptools import setup, find_packages
 import codecs
+import re
 
-version = '0.3.11.dev0'
+
+def read_version(filename):
+    with open(filename) as fp:
+        return re.search(r"^__version__ = '(.*)'$", fp.read(), re.M).group(1)
+
+
+version = read_version('awstools/__init__.py')
 
 
 def read(filename):
@@ -42,9 +49,9 @@ setup(
         },
     entry_points={
         'console_scripts': [
-            'cfnas = awstools.commands.cfnautoscale:main',
-            'cfn = awstools.commands.cloudformation:main',
-            'ec2ssh = awstools.commands.ec2ssh:main',
+            'cfnas = awstools.cli:cfnas',
+            'cfn = awstools.cli:cfn',
+            'ec2ssh = awstools.cli:ec2ssh',
         ]
     }
 )